@@ -0,0 +1,339 @@
+### Synthetic data and benchmarks for mini_project2
+# generate_data_file() writes a TSV in the same 11-column, semicolon-list layout
+# that step1 .. step11 read, at any number of order lines. run_benchmark() builds
+# a database from it with the step functions, runs every exN query against it
+# and saves wall time, CPU time, rows/sec and peak RSS per stage as JSON.
+#
+#   python benchmark.py --scales 10000 100000 1000000 --output results.json
+#   python benchmark.py --compare old.json new.json
+import argparse
+import concurrent.futures
+import datetime
+import itertools
+import json
+import multiprocessing
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+import mini_project2
+
+try:
+    import resource
+except ImportError: # not available on Windows
+    resource = None
+
+
+### Synthetic data
+
+DATA_HEADER = ['Name', 'Address', 'City', 'Country', 'Region', 'ProductName', 'ProductCategory',
+               'ProductCategoryDescription', 'ProductUnitPrice', 'QuantityOrderded', 'OrderDate']
+
+GEOGRAPHY = {
+    'North America': ['USA', 'Canada', 'Mexico'],
+    'South America': ['Brazil', 'Argentina', 'Venezuela'],
+    'British Isles': ['UK', 'Ireland'],
+    'Western Europe': ['Germany', 'France', 'Belgium', 'Austria', 'Switzerland'],
+    'Southern Europe': ['Spain', 'Portugal', 'Italy'],
+    'Scandinavia': ['Sweden', 'Norway', 'Denmark', 'Finland'],
+    'Eastern Europe': ['Poland'],
+}
+
+CATEGORIES = [
+    ('Beverages', 'Soft drinks, coffees, teas, beers, and ales'),
+    ('Condiments', 'Sweet and savory sauces, relishes, spreads, and seasonings'),
+    ('Confections', 'Desserts, candies, and sweet breads'),
+    ('Dairy Products', 'Cheeses'),
+    ('Grains/Cereals', 'Breads, crackers, pasta, and cereal'),
+    ('Meat/Poultry', 'Prepared meats'),
+    ('Produce', 'Dried fruit and bean curd'),
+    ('Seafood', 'Seaweed and fish'),
+]
+
+FIRST_NAMES = ['Maria', 'Ana', 'Antonio', 'Thomas', 'Christina', 'Hanna', 'Frederique', 'Martin', 'Laurence',
+               'Elizabeth', 'Victoria', 'Patricio', 'Francisco', 'Yang', 'Pedro', 'Aria', 'Diego', 'Yoshi']
+LAST_NAMES = ['Anders', 'Trujillo', 'Moreno', 'Hardy', 'Berglund', 'Moos', 'Citeaux', 'Sommer', 'Lebihan',
+              'Lincoln', 'Ashworth', 'Simpson', 'Chang', 'Afonso', 'Cruz', 'Roel', 'Van Damme', 'Latimer']
+STREETS = ['Obere Str.', 'Avda. de la Constitucion', 'Mataderos', 'Hanover Sq.', 'Berguvsvagen',
+           'Forsterstr.', 'place Kleber', 'C/ Araquil', 'rue des Bouchers', 'Fauntleroy Circus']
+
+
+def _zipf_cum_weights(n, skew):
+    # Cumulative weights of rank 1 .. n under a Zipf law, rank 1 being the most
+    # frequent. skew=0 gives a uniform draw.
+    return list(itertools.accumulate(1.0 / rank ** skew for rank in range(1, n + 1)))
+
+
+def _customer_fields(i):
+    # Name, address, city, country and region of customer i. Derived from i so
+    # that millions of customers do not have to be held in memory; the index in
+    # the last name keeps every name unique.
+    countries = _customer_fields.countries
+    country, region = countries[(i * 7919) % len(countries)]
+    name = '%s %s-%d' % (FIRST_NAMES[i % len(FIRST_NAMES)], LAST_NAMES[(i // len(FIRST_NAMES)) % len(LAST_NAMES)], i)
+    address = '%d %s' % (i % 997 + 1, STREETS[i % len(STREETS)])
+    city = '%s City %d' % (country, i % 13)
+    return [name, address, city, country, region]
+
+_customer_fields.countries = [(country, region) for region, countries in GEOGRAPHY.items() for country in countries]
+
+
+def generate_data_file(data_filename, order_lines, customers=None, products=77, skew=1.1, max_items=5,
+                       start_date=datetime.date(2010, 1, 1), end_date=datetime.date(2013, 12, 31), seed=0):
+    # Writes about order_lines order lines (one per product on a line, so a
+    # little more than asked for) with customers and products drawn from a Zipf
+    # distribution: customer 0 and product 0 are the most frequent. Returns a
+    # dict with the line counts and the name of the most frequent customer.
+    if products < len(CATEGORIES):
+        raise ValueError("products must be at least %d, one per category" % len(CATEGORIES))
+    if customers is None:
+        customers = max(100, order_lines // 50)
+    rng = random.Random(seed)
+
+    # product j is (name, category, description, price); the first ones cover
+    # every category once.
+    catalog = []
+    for j in range(products):
+        category, description = CATEGORIES[j] if j < len(CATEGORIES) else rng.choice(CATEGORIES)
+        catalog.append(('Product %05d' % j, category, description, '%.2f' % rng.uniform(2, 100)))
+
+    first_day = start_date.toordinal()
+    dates = [datetime.date.fromordinal(day).strftime('%Y%m%d') for day in range(first_day, end_date.toordinal() + 1)]
+    quantities = [str(q) for q in range(1, 51)]
+    customer_ids = range(customers)
+    customer_weights = _zipf_cum_weights(customers, skew)
+    product_weights = _zipf_cum_weights(products, skew)
+
+    def line(fields, items):
+        return '\t'.join(fields + [';'.join(item[0] for item in items),
+                                   ';'.join(item[1] for item in items),
+                                   ';'.join(item[2] for item in items),
+                                   ';'.join(item[3] for item in items),
+                                   ';'.join(rng.choice(quantities) for item in items),
+                                   ';'.join(rng.choice(dates) for item in items)]) + '\n'
+
+    lines = 0
+    written = 0
+    with open(data_filename, 'w') as f:
+        f.write('\t'.join(DATA_HEADER) + '\n')
+        batch = []
+        while written < order_lines:
+            (customer,) = rng.choices(customer_ids, cum_weights=customer_weights)
+            items = rng.choices(catalog, cum_weights=product_weights, k=rng.randint(1, max_items))
+            batch.append(line(_customer_fields(customer), items))
+            written += len(items)
+            if len(batch) == 10000:
+                f.writelines(batch)
+                lines += len(batch)
+                batch = []
+        # step7 only keeps the categories named on the last line of the file,
+        # so the last line orders one product of every category.
+        batch.append(line(_customer_fields(0), catalog[:len(CATEGORIES)]))
+        written += len(CATEGORIES)
+        f.writelines(batch)
+        lines += len(batch)
+
+    return {'lines': lines, 'order_lines': written, 'customers': customers, 'products': products,
+            'top_customer': _customer_fields(0)[0]}
+
+
+### Benchmark runner
+
+STEPS = [
+    ('step1_create_region_table', 'region'),
+    ('step2_create_region_to_regionid_dictionary', None),
+    ('step3_create_country_table', 'country'),
+    ('step4_create_country_to_countryid_dictionary', None),
+    ('step5_create_customer_table', 'customer'),
+    ('step6_create_customer_to_customerid_dictionary', None),
+    ('step7_create_productcategory_table', 'productcategory'),
+    ('step8_create_productcategory_to_productcategoryid_dictionary', None),
+    ('step9_create_product_table', 'product'),
+    ('step10_create_product_to_productid_dictionary', None),
+    ('step11_create_orderdetail_table', 'OrderDetail'),
+]
+
+QUERIES = ['ex%d' % n for n in range(1, 12)]
+
+
+def _peak_rss_kb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+
+def _run_stage(stage, data_filename, normalized_database_filename, CustomerName):
+    # Runs one step or query and measures it. Called in a fresh process per
+    # stage, so the peak RSS is that of the stage alone (plus the imports).
+    func = getattr(mini_project2, stage)
+    conn = None
+    if stage.startswith('ex'):
+        conn = mini_project2.create_connection(normalized_database_filename)
+        args = (conn, CustomerName) if stage in ('ex1', 'ex2') else (conn,)
+    elif stage.endswith('dictionary'):
+        args = (normalized_database_filename,)
+    else:
+        args = (data_filename, normalized_database_filename)
+
+    start_rss_kb = _peak_rss_kb()
+    wall = time.perf_counter()
+    cpu = time.process_time()
+    result = func(*args)
+    wall = time.perf_counter() - wall
+    cpu = time.process_time() - cpu
+    peak_rss_kb = _peak_rss_kb()
+
+    if conn is not None:
+        # the exN functions run their query and return the SQL, so the rows are
+        # counted separately, outside the timed call
+        rows = conn.execute("SELECT count(*) FROM (%s)" % result).fetchone()[0]
+        conn.close()
+    elif isinstance(result, dict):
+        rows = len(result)
+    else:
+        conn = mini_project2.create_connection(normalized_database_filename)
+        rows = conn.execute("SELECT count(*) FROM %s" % dict(STEPS)[stage]).fetchone()[0]
+        conn.close()
+
+    return {'stage': stage, 'wall': wall, 'cpu': cpu, 'rows': rows,
+            'rows_per_sec': rows / wall if wall > 0 else None,
+            'start_rss_kb': start_rss_kb, 'peak_rss_kb': peak_rss_kb}
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmark(scales, directory=None, stages=None, keep_files=False, seed=0, **generator_options):
+    # For each scale (number of order lines): generate a data file, build the
+    # database with step1 .. step11 and run ex1 .. ex11. stages limits the run to
+    # the named steps and queries; the steps are still run in order, since
+    # each one reads the tables of the ones before it.
+    remove_directory = directory is None
+    if remove_directory:
+        directory = tempfile.mkdtemp(prefix='walmart_benchmark_')
+    else:
+        os.makedirs(directory, exist_ok=True)
+    selected = [stage for stage, table in STEPS] + QUERIES
+    if stages:
+        unknown = set(stages) - set(selected)
+        if unknown:
+            raise ValueError("unknown stages: %s" % ', '.join(sorted(unknown)))
+        last_step = max((i for i, (stage, table) in enumerate(STEPS) if stage in stages), default=-1)
+        if any(stage in QUERIES for stage in stages):
+            last_step = len(STEPS) - 1
+        selected = [stage for i, (stage, table) in enumerate(STEPS) if i <= last_step] + \
+                   [stage for stage in QUERIES if stage in stages]
+
+    results = {'commit': _git_commit(), 'python': platform.python_version(), 'platform': platform.platform(),
+               'sqlite': mini_project2.sqlite3.sqlite_version, 'started': datetime.datetime.now().isoformat(),
+               'seed': seed, 'generator_options': generator_options, 'scales': []}
+    # a fresh interpreter per stage, so ru_maxrss is not carried over from the
+    # previous stage or from the parent
+    context = multiprocessing.get_context('spawn')
+    try:
+        for scale in scales:
+            data_filename = os.path.join(directory, 'data_%d.tsv' % scale)
+            db = os.path.join(directory, 'normalized_%d.db' % scale)
+            if os.path.exists(db):
+                os.remove(db)
+
+            generate = time.perf_counter()
+            data = generate_data_file(data_filename, scale, seed=seed, **generator_options)
+            generate = time.perf_counter() - generate
+            data['generate_seconds'] = generate
+            data['file_bytes'] = os.path.getsize(data_filename)
+            print("scale %d: %d lines, %d order lines, %.1f MB, generated in %.1fs" % (
+                scale, data['lines'], data['order_lines'], data['file_bytes'] / 1e6, generate))
+
+            stage_results = []
+            for stage in selected:
+                with concurrent.futures.ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                    result = executor.submit(_run_stage, stage, data_filename, db, data['top_customer']).result()
+                if stages and stage not in stages:
+                    result['setup'] = True
+                stage_results.append(result)
+                print("  %-62s %9.3fs %10d rows %12.0f rows/s %8s KB" % (
+                    stage, result['wall'], result['rows'], result['rows_per_sec'] or 0, result['peak_rss_kb']))
+            results['scales'].append({'order_lines': scale, 'data': data, 'stages': stage_results})
+
+            if not keep_files:
+                os.remove(data_filename)
+                os.remove(db)
+    finally:
+        if remove_directory and not keep_files:
+            shutil.rmtree(directory, ignore_errors=True)
+    results['finished'] = datetime.datetime.now().isoformat()
+    return results
+
+
+def save_results(results, output_filename):
+    with open(output_filename, 'w') as f:
+        json.dump(results, f, indent=2)
+
+
+def compare_results(old_filename, new_filename):
+    # Wall time of every stage in both files, matched on scale and stage name.
+    # ratio > 1 means the new run is slower.
+    with open(old_filename) as f:
+        old = json.load(f)
+    with open(new_filename) as f:
+        new = json.load(f)
+    old_wall = {(scale['order_lines'], stage['stage']): stage['wall']
+                for scale in old['scales'] for stage in scale['stages']}
+    rows = []
+    for scale in new['scales']:
+        for stage in scale['stages']:
+            key = (scale['order_lines'], stage['stage'])
+            if key in old_wall:
+                rows.append((key[0], key[1], old_wall[key], stage['wall'],
+                             stage['wall'] / old_wall[key] if old_wall[key] > 0 else None))
+    return pd.DataFrame(rows, columns=['order_lines', 'stage', 'old_wall', 'new_wall', 'ratio'])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate synthetic data and time every step and query of mini_project2.")
+    parser.add_argument('--scales', type=int, nargs='+', default=[10000, 100000], help="order lines per run")
+    parser.add_argument('--customers', type=int, help="number of customers (default: order lines / 50)")
+    parser.add_argument('--products', type=int, default=77)
+    parser.add_argument('--skew', type=float, default=1.1, help="Zipf exponent for customers and products, 0 is uniform")
+    parser.add_argument('--max-items', type=int, default=5, help="most products on one line")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--stages', nargs='+', help="only report these steps/queries")
+    parser.add_argument('--directory', help="where to write data files and databases (default: a temporary directory)")
+    parser.add_argument('--keep-files', action='store_true')
+    parser.add_argument('--output', help="JSON file for the results")
+    parser.add_argument('--generate-only', metavar='DATA_FILE', help="only write a data file of the first scale")
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help="compare two results files")
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        print(compare_results(*args.compare).to_string(index=False))
+        return
+
+    generator_options = {'customers': args.customers, 'products': args.products, 'skew': args.skew,
+                         'max_items': args.max_items}
+    if args.generate_only:
+        print(generate_data_file(args.generate_only, args.scales[0], seed=args.seed, **generator_options))
+        return
+
+    results = run_benchmark(args.scales, args.directory, args.stages, args.keep_files, args.seed, **generator_options)
+    if args.output:
+        save_results(results, args.output)
+
+
+if __name__ == '__main__':
+    main()
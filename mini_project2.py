@@ -1,729 +1,3853 @@
-### Utility Functions
-import pandas as pd
-import sqlite3
-from sqlite3 import Error
-import datetime
-
-def create_connection(db_file, delete_db=False):
-    import os
-    if delete_db and os.path.exists(db_file):
-        os.remove(db_file)
-
-    conn = None
-    try:
-        conn = sqlite3.connect(db_file)
-        conn.execute("PRAGMA foreign_keys = 1")
-    except Error as e:
-        print(e)
-
-    return conn
-
-
-def create_table(conn, create_table_sql, drop_table_name=None):
-    
-    if drop_table_name: # You can optionally pass drop_table_name to drop the table. 
-        try:
-            c = conn.cursor()
-            c.execute("""DROP TABLE IF EXISTS %s""" % (drop_table_name))
-        except Error as e:
-            print(e)
-    
-    try:
-        c = conn.cursor()
-        c.execute(create_table_sql)
-    except Error as e:
-        print(e)
-        
-def execute_sql_statement(sql_statement, conn):
-    cur = conn.cursor()
-    cur.execute(sql_statement)
-
-    rows = cur.fetchall()
-
-    return rows
-
-def step1_create_region_table(data_filename, normalized_database_filename):
-    regions = set()
-    with open(data_filename, 'r') as f:
-        next(f) 
-        for line in f:
-            fields = line.strip().split('\t')
-            region = fields[4]
-            regions.add(region)
-    regions = sorted(list(regions))
-    
-    conn = create_connection(normalized_database_filename)
-
-    create_table_sql = """
-        CREATE TABLE IF NOT EXISTS region (
-            RegionID INTEGER PRIMARY KEY,
-            Region TEXT NOT NULL
-        );
-    """
-    create_table(conn, create_table_sql)
-
-    # Insert into region table
-    insert_sql = "INSERT INTO region (Region) VALUES (?)"
-    values = [(region,) for region in regions]
-    conn.executemany(insert_sql, values)
-
-
-    conn.commit()
-    conn.close()
-
-def step2_create_region_to_regionid_dictionary(normalized_database_filename):
-    conn = create_connection(normalized_database_filename)
-
-    select_sql = "SELECT RegionID, Region FROM region"
-    cursor = conn.cursor()
-    cursor.execute(select_sql)
-    rows = cursor.fetchall()
-
-    region_to_id = {row[1]: row[0] for row in rows}
-
-    conn.close()
-
-    return region_to_id
-
-
-def step3_create_country_table(data_filename, normalized_database_filename):
-    countries = set()
-    country_region = []
-    region_to_id = step2_create_region_to_regionid_dictionary(normalized_database_filename)
-    with open(data_filename, 'r') as f:
-        next(f) 
-        for line in f:
-            fields = line.strip().split('\t')
-            country, region = fields[3], fields[4]
-            if country in countries and region in region_to_id:
-                continue
-            countries.add(country)
-            if region in region_to_id:
-                country_region.append((country, region_to_id[region]))
-
-    conn = create_connection(normalized_database_filename)
-
-    create_table_sql = """
-        CREATE TABLE IF NOT EXISTS country (
-            CountryID INTEGER PRIMARY KEY,
-            Country TEXT NOT NULL,
-            RegionID INTEGER NOT NULL,
-            FOREIGN KEY (RegionID) REFERENCES region (RegionID)
-        );
-    """
-    create_table(conn, create_table_sql)
-
-    # Insert into country table
-    insert_sql = "INSERT INTO country (Country, RegionID) VALUES (?, ?)"
-    values = [(country_reg[0], country_reg[1]) for country_reg in country_region if country_reg[0] in countries]
-    values.sort(key=lambda x: x[0])    
-    conn.executemany(insert_sql, values)
-
-    conn.commit()
-    conn.close()
-
-
-
-def step4_create_country_to_countryid_dictionary(normalized_database_filename):
-    conn = create_connection(normalized_database_filename)
-
-    select_sql = "SELECT CountryID, Country FROM country"
-    cursor = conn.cursor()
-    cursor.execute(select_sql)
-    rows = cursor.fetchall()
-
-    country_to_id = {row[1]: row[0] for row in rows}
-
-    conn.close()
-
-    return country_to_id
-        
-        
-def step5_create_customer_table(data_filename, normalized_database_filename):
-
-    country_to_id = step4_create_country_to_countryid_dictionary(normalized_database_filename)
-    with open(data_filename, 'r') as f:
-        next(f) 
-        values = []
-        for line in f:
-            fields = line.strip().split('\t')
-            name = fields[0].split(' ')
-            firstname, lastname = name[0], ' '.join(name[1:])
-            address, city, country = fields[1], fields[2], fields[3]
-            if country in country_to_id:
-                values.append((firstname, lastname, address, city, country_to_id[country]))
-        
-
-    conn = create_connection(normalized_database_filename)
-
-    create_table_sql = """
-        CREATE TABLE IF NOT EXISTS customer (
-            CustomerID INTEGER PRIMARY KEY,
-            FirstName TEXT NOT NULL,
-            LastName TEXT NOT NULL,
-            Address TEXT NOT NULL,
-            City TEXT NOT NULL,
-            CountryID INTEGER NOT NULL,
-            FOREIGN KEY (CountryID) REFERENCES country (CountryID)
-        );
-    """
-    create_table(conn, create_table_sql)
-
-    # Insert into customer table
-    insert_sql = "INSERT INTO customer (FirstName, LastName, Address, City, CountryID) VALUES (?, ?, ?, ?, ?)"
-    values = sorted(values, key=lambda x: x[0])
-    conn.executemany(insert_sql, values)
-
-    conn.commit()
-    conn.close()
-
-
-def step6_create_customer_to_customerid_dictionary(normalized_database_filename):
-    conn = create_connection(normalized_database_filename)
-
-    select_sql = "SELECT CustomerID, FirstName ||' '|| LastName as Name FROM customer"
-    cursor = conn.cursor()
-    cursor.execute(select_sql)
-    rows = cursor.fetchall()
-
-    customer_to_id = {row[1]: row[0] for row in rows}
-
-    conn.close()
-
-    return customer_to_id
-        
-def step7_create_productcategory_table(data_filename, normalized_database_filename):
-    with open(data_filename, 'r') as f:
-        next(f) # skip header line
-        ProductCategories=set()
-        ProductCategoryDescriptions=set()
-        ProductCategoryValue=[]
-        for line in f:
-            fields = line.strip().split('\t')
-            ProductCategoryList, ProductCategoryDescriptionList = fields[6].split(';'), fields[7].split(';')
-            ProductCategorydict = dict(zip(ProductCategoryList, ProductCategoryDescriptionList))
-            
-    for key,value in ProductCategorydict.items():
-        a=tuple((key,value))
-        ProductCategoryValue.append(a)
-            
-            
-
-    conn = create_connection(normalized_database_filename)
-
-    # Create customer table
-    create_table_sql = """
-        CREATE TABLE IF NOT EXISTS productcategory (
-            ProductCategoryID INTEGER PRIMARY KEY,
-            ProductCategory TEXT NOT NULL,
-            ProductCategoryDescription TEXT NOT NULL
-        );
-    """
-    create_table(conn, create_table_sql)
-
-    # Insert data into productcategory table
-    insert_sql = "INSERT INTO productcategory (ProductCategory, ProductCategoryDescription) VALUES (?, ?)"
-    ProductCategoryValue = sorted(ProductCategoryValue, key=lambda x: x[0])
-    conn.executemany(insert_sql, ProductCategoryValue)
-
-    conn.commit()
-    conn.close()
-
-def step8_create_productcategory_to_productcategoryid_dictionary(normalized_database_filename):
-    
-    conn = create_connection(normalized_database_filename)
-
-    select_sql = "SELECT ProductCategoryID, ProductCategory FROM productcategory"
-    cursor = conn.cursor()
-    cursor.execute(select_sql)
-    rows = cursor.fetchall()
-
-    ProductCategory_to_id = {row[1]: row[0] for row in rows}
-
-    conn.close()
-
-    return ProductCategory_to_id
-        
-
-def step9_create_product_table(data_filename, normalized_database_filename):
-    ProductCategory_to_id = step8_create_productcategory_to_productcategoryid_dictionary(normalized_database_filename)
-    values = set()
-
-    with open(data_filename, 'r') as f:
-        next(f)
-        for line in f:
-            fields = line.strip().split('\t')
-            #ProductName, ProductUnitPrice, ProductCategoryList = fields[5].split(';'), fields[8].split(';'), fields[6].split(';')
-            #prod_dict=dict(zip(ProductName, ProductUnitPrice))
-            #print(prod_dict)
-            ProductName, ProductUnitPrice, ProductCategoryList = fields[5].split(';'), fields[8].split(';'), fields[6].split(';')
-            for i, prod_name in enumerate(ProductName):
-                values.add((prod_name.strip(), float(ProductUnitPrice[i]), ProductCategory_to_id[ProductCategoryList[i].strip()]))
-    conn = create_connection(normalized_database_filename)
-
-    # Create customer table
-    create_table_sql = """
-        CREATE TABLE IF NOT EXISTS product (
-            ProductID INTEGER PRIMARY KEY,
-            ProductName TEXT NOT NULL,
-            ProductUnitPrice REAL NOT NULL,
-            ProductCategoryID INTEGER NOT NULL,
-            FOREIGN KEY (ProductCategoryID) REFERENCES productcategory (ProductCategoryID)
-        );
-    """
-    create_table(conn, create_table_sql)
-
-    insert_sql = "INSERT INTO product (ProductName, ProductUnitPrice, ProductCategoryID) VALUES (?, ?, ?)"
-    values = sorted(values, key=lambda x: x[0])
-    conn.executemany(insert_sql, values)
-
-    conn.commit()
-    conn.close()
-
-
-def step10_create_product_to_productid_dictionary(normalized_database_filename):
-    conn = create_connection(normalized_database_filename)
-
-    select_sql = "SELECT ProductID, ProductName FROM product"
-    cursor = conn.cursor()
-    cursor.execute(select_sql)
-    rows = cursor.fetchall()
-
-    Product_to_id = {row[1]: row[0] for row in rows}
-
-    conn.close()
-
-    return Product_to_id
-    
-        
-
-def step11_create_orderdetail_table(data_filename, normalized_database_filename):
-    Customer_to_id = step6_create_customer_to_customerid_dictionary(normalized_database_filename)
-    Product_to_id = step10_create_product_to_productid_dictionary(normalized_database_filename)
-    #Product_to_id={'Alice Mutton': 1, 'Aniseed Syrup': 2, 'Boston Crab Meat': 3, 'Camembert Pierrot': 4, 'Carnarvon Tigers': 5, 'Chai': 6, 'Chang': 7, 'Chartreuse verte': 8, "Chef Anton's Cajun Seasoning": 9, "Chef Anton's Gumbo Mix": 10, 'Chocolade': 11, 'Cote de Blaye': 12, 'Escargots de Bourgogne': 13, 'Filo Mix': 14, 'Flotemysost': 15, 'Geitost': 16, 'Genen Shouyu': 17, 'Gnocchi di nonna Alice': 18, 'Gorgonzola Telino': 19, "Grandma's Boysenberry Spread": 20, 'Gravad lax': 21, 'Guarana Fantastica': 22, 'Gudbrandsdalsost': 23, 'Gula Malacca': 24, 'Gumbar Gummibarchen': 25, "Gustaf's Knackebrod": 26, 'Ikura': 27, 'Inlagd Sill': 28, 'Ipoh Coffee': 29, "Jack's New England Clam Chowder": 30, 'Konbu': 31, 'Lakkalikoori': 32, 'Laughing Lumberjack Lager': 33, 'Longlife Tofu': 34, 'Louisiana Fiery Hot Pepper Sauce': 35, 'Louisiana Hot Spiced Okra': 36, 'Manjimup Dried Apples': 37, 'Mascarpone Fabioli': 38, 'Maxilaku': 39, 'Mishi Kobe Niku': 40, 'Mozzarella di Giovanni': 41, 'Nord-Ost Matjeshering': 42, 'Northwoods Cranberry Sauce': 43, 'NuNuCa Nu-Nougat-Creme': 44, 'Original Frankfurter grune Soe': 45, 'Outback Lager': 46, 'Pate chinois': 47, 'Pavlova': 48, 'Perth Pasties': 49, 'Queso Cabrales': 50, 'Queso Manchego La Pastora': 51, 'Raclette Courdavault': 52, 'Ravioli Angelo': 53, 'Rhonbrau Klosterbier': 54, 'Rod Kaviar': 55, 'Rogede sild': 56, 'Rossle Sauerkraut': 57, 'Sasquatch Ale': 58, 'Schoggi Schokolade': 59, 'Scottish Longbreads': 60, 'Singaporean Hokkien Fried Mee': 61, "Sir Rodney's Marmalade": 62, "Sir Rodney's Scones": 63, "Sirop d'erable": 64, 'Spegesild': 65, 'Steeleye Stout': 66, 'Tarte au sucre': 67, 'Teatime Chocolate Biscuits': 68, 'Thuringer Rostbratwurst': 69, 'Tofu': 70, 'Tourtiere': 71, 'Tunnbrod': 72, "Uncle Bob's Organic Dried Pears": 73, 'Valkoinen suklaa': 74, 'Vegie-spread': 75, 'Wimmers gute Semmelknodel': 76, 'Zaanse koeken': 77}
-    values = []
-    with open(data_filename, 'r') as f:
-        next(f) # skip header line
-        for line in f:
-            fields = line.strip().split('\t')
-            CustomerName, OrderDate, ProductName, QuantityOrdered = fields[0], fields[10].split(';'), fields[5].split(';'), fields[9].split(';')
-            for ProdName in ProductName:
-                p_id=Product_to_id[ProdName]
-                
-            for i, ProdName in enumerate(ProductName):
-                values.append((Customer_to_id[CustomerName], Product_to_id[ProdName], datetime.datetime.strptime(OrderDate[i], '%Y%m%d').strftime('%Y-%m-%d') , QuantityOrdered[i]))
-
-    conn = create_connection(normalized_database_filename)
-
-    # Create customer table
-    create_table_sql = """
-        CREATE TABLE IF NOT EXISTS OrderDetail (
-            OrderID INTEGER PRIMARY KEY,
-            CustomerID INTEGER NOT NULL,
-            ProductID INTEGER NOT NULL,
-            OrderDate TEXT NOT NULL,
-            QuantityOrdered INTEGER NOT NULL
-
-        );
-    """
-    create_table(conn, create_table_sql)
-
-    # Insert data into customer table
-    insert_sql = "INSERT INTO OrderDetail (CustomerID, ProductID, OrderDate, QuantityOrdered) VALUES (?, ?, ?, ?)"
-    values = sorted(values, key=lambda x: x[0])
-    conn.executemany(insert_sql, values)
-
-    conn.commit()
-    conn.close()
-
-
-def ex1(conn, CustomerName):
-    
-    # Simply, you are fetching all the rows for a given CustomerName. 
-    # Write an SQL statement that SELECTs From the OrderDetail table and joins with the Customer and Product table.
-    # Pull out the following columns. 
-    # Name -- concatenation of FirstName and LastName
-    # ProductName
-    # OrderDate
-    # ProductUnitPrice
-    # QuantityOrdered
-    # Total -- which is calculated from multiplying ProductUnitPrice with QuantityOrdered -- round to two decimal places
-    # HINT: USE customer_to_customerid_dict to map customer name to customer id and then use where clause with CustomerID
-    
-    ### BEGIN SOLUTION
-    Customer_to_id = step6_create_customer_to_customerid_dictionary('normalized.db')
-    customer_id = Customer_to_id[CustomerName]
-
-    sql_statement = """
-    select 
-        c.FirstName ||' '|| c.LastName as Name,
-        p.ProductName as ProductName,
-        od.OrderDate as OrderDate,
-        p.ProductUnitPrice as ProductUnitPrice,
-        od.QuantityOrdered as QuantityOrdered,
-        round(p.ProductUnitPrice * od.QuantityOrdered,2) as Total
-    from OrderDetail od 
-    join customer c on od.CustomerID = c.CustomerID
-    join product p on od.ProductID = p.ProductID
-    where od.CustomerID={}
-    """.format(customer_id)
-    ### END SOLUTION
-    df = pd.read_sql_query(sql_statement, conn)
-    return sql_statement
-
-def ex2(conn, CustomerName):
-    
-    # Simply, you are summing the total for a given CustomerName. 
-    # Write an SQL statement that SELECTs From the OrderDetail table and joins with the Customer and Product table.
-    # Pull out the following columns. 
-    # Name -- concatenation of FirstName and LastName
-    # Total -- which is calculated from multiplying ProductUnitPrice with QuantityOrdered -- sum first and then round to two decimal places
-    # HINT: USE customer_to_customerid_dict to map customer name to customer id and then use where clause with CustomerID
-    
-    ### BEGIN SOLUTION
-    Customer_to_id = step6_create_customer_to_customerid_dictionary('normalized.db')
-    customer_id = Customer_to_id[CustomerName]
-    sql_statement = """
-
-    SELECT 
-        FirstName || ' ' || LastName AS Name, 
-        round(sum(ProductUnitPrice * QuantityOrdered), 2) as Total
-    from OrderDetail od 
-    join customer c on od.CustomerID = c.CustomerID
-    join product p on od.ProductID = p.ProductID
-    where od.CustomerID={}
-    """.format(customer_id)
-    df = pd.read_sql_query(sql_statement, conn)
-    return sql_statement
-
-def ex3(conn):
-    
-    # Simply, find the total for all the customers
-    # Write an SQL statement that SELECTs From the OrderDetail table and joins with the Customer and Product table.
-    # Pull out the following columns. 
-    # Name -- concatenation of FirstName and LastName
-    # Total -- which is calculated from multiplying ProductUnitPrice with QuantityOrdered -- sum first and then round to two decimal places
-    # ORDER BY Total Descending 
-    ### BEGIN SOLUTION
-   
-    sql_statement = """
-
-    SELECT 
-        FirstName || ' ' || LastName AS Name, 
-        round(sum(ProductUnitPrice * QuantityOrdered), 2) as Total
-    from OrderDetail od 
-    join customer c on od.CustomerID = c.CustomerID
-    join product p on od.ProductID = p.ProductID
-    group by od.CustomerID
-    order by Total desc
-    """
-
-    df = pd.read_sql_query(sql_statement, conn)
-    return sql_statement
-
-def ex4(conn):
-    
-    # Simply, find the total for all the region
-    # Write an SQL statement that SELECTs From the OrderDetail table and joins with the Customer, Product, Country, and 
-    # Region tables.
-    # Pull out the following columns. 
-    # Region
-    # Total -- which is calculated from multiplying ProductUnitPrice with QuantityOrdered -- sum first and then round to two decimal places
-    # ORDER BY Total Descending 
-    ### BEGIN SOLUTION
-
-    sql_statement = """
-    SELECT 
-        r.Region, 
-        round(sum(p.ProductUnitPrice * od.QuantityOrdered), 2) as Total
-    from OrderDetail od 
-    join customer c on od.CustomerID = c.CustomerID
-    join product p on od.ProductID = p.ProductID
-    join country co ON c.CountryID = co.CountryID
-    join region r on co.RegionID=r.RegionID
-    GROUP BY r.Region
-    order by Total desc
-    
-    """
-    ### END SOLUTION
-    df = pd.read_sql_query(sql_statement, conn)
-    return sql_statement
-
-def ex5(conn):
-    
-     # Simply, find the total for all the countries
-    # Write an SQL statement that SELECTs From the OrderDetail table and joins with the Customer, Product, and Country table.
-    # Pull out the following columns. 
-    # Country
-    # CountryTotal -- which is calculated from multiplying ProductUnitPrice with QuantityOrdered -- sum first and then round
-    # ORDER BY Total Descending 
-    ### BEGIN SOLUTION
-
-    sql_statement = """
-    select co.Country, round(sum(p.ProductUnitPrice * od.QuantityOrdered), 0) AS CountryTotal
-    from OrderDetail od
-    join customer c ON od.CustomerID = c.CustomerID
-    join product p ON od.ProductID = p.ProductID
-    join country co ON c.CountryID = co.CountryID
-    group by co.Country
-    order by CountryTotal DESC
-    """
-    df = pd.read_sql_query(sql_statement, conn)
-    return sql_statement
-
-
-def ex6(conn):
-    
-    # Rank the countries within a region based on order total
-    # Output Columns: Region, Country, CountryTotal, CountryRegionalRank
-    # Hint: Round the the total
-    # Hint: Sort ASC by Region
-    ### BEGIN SOLUTION
-
-    sql_statement = """
-    with region_country_total as
-    (
-        select r.Region as Region,
-        co.Country as Country,
-        round(sum(p.ProductUnitPrice * od.QuantityOrdered),0) as CountryTotal
-        from OrderDetail od
-        join Customer c on od.CustomerID=c.CustomerID
-        join Country co on c.CountryID=co.CountryID
-        join Region r on co.RegionID=r.RegionID
-        join Product p on od.ProductID=p.ProductID
-        group by r.Region,co.Country
-    ),
-    ranked_country_total as
-    (
-        select *,
-        dense_rank() over(partition by Region order by CountryTotal desc) as CountryRegionalRank
-        from region_country_total
-    )
-    select Region, Country, CountryTotal, CountryRegionalRank
-    from ranked_country_total
-    order by Region ASC
-
-    """
-
-
-    ### END SOLUTION
-    df = pd.read_sql_query(sql_statement, conn)
-    return sql_statement
-
-
-
-def ex7(conn):
-    
-   # Rank the countries within a region based on order total, BUT only select the TOP country, meaning rank = 1!
-    # Output Columns: Region, Country, CountryTotal, CountryRegionalRank
-    # Hint: Round the the total
-    # Hint: Sort ASC by Region
-    # HINT: Use "WITH"
-    ### BEGIN SOLUTION
-
-    sql_statement = """
-    with region_country_total as
-    (
-        select r.Region as Region,
-        co.Country as Country,
-        round(sum(p.ProductUnitPrice * od.QuantityOrdered),0) as CountryTotal
-        from OrderDetail od
-        join Customer c on od.CustomerID=c.CustomerID
-        join Country co on c.CountryID=co.CountryID
-        join Region r on co.RegionID=r.RegionID
-        join Product p on od.ProductID=p.ProductID
-        group by r.Region,co.Country
-    ),
-    ranked_country_total as
-    (
-        select *,
-        dense_rank() over(partition by Region order by CountryTotal desc) as CountryRegionalRank
-        from region_country_total
-    )
-    select Region, Country, CountryTotal, CountryRegionalRank
-    from ranked_country_total
-    where CountryRegionalRank=1
-    order by Region ASC
-      
-    """
-    ### END SOLUTION
-    df = pd.read_sql_query(sql_statement, conn)
-    return sql_statement
-
-def ex8(conn):
-    
-    # Sum customer sales by Quarter and year
-    # Output Columns: Quarter,Year,CustomerID,Total
-    # HINT: Use "WITH"
-    # Hint: Round the the total
-    # HINT: YOU MUST CAST YEAR TO TYPE INTEGER!!!!
-    ### BEGIN SOLUTION
-
-    sql_statement = """
-    With SalesByQuarter AS (
-        select 
-            strftime('%Y', OrderDate) AS Year, 
-            CASE 
-                WHEN strftime('%m', OrderDate) BETWEEN '01' AND '03' THEN 'Q1'
-                WHEN strftime('%m', OrderDate) BETWEEN '04' AND '06' THEN 'Q2'
-                WHEN strftime('%m', OrderDate) BETWEEN '07' AND '09' THEN 'Q3'
-                ELSE 'Q4'
-            END AS Quarter, 
-            CustomerID, 
-            ROUND(SUM(p.ProductUnitPrice * od.QuantityOrdered), 0) AS Total
-        from OrderDetail od
-        join Product p ON od.ProductID = p.ProductID
-        group by Year, Quarter, CustomerID
-    )
-    select Quarter, CAST(Year AS INTEGER) AS Year, CustomerID, Total
-    from SalesByQuarter
-    order by Year, Quarter
-
-       
-    """
-    ### END SOLUTION
-    df = pd.read_sql_query(sql_statement, conn)
-    return sql_statement
-
-def ex9(conn):
-    
-    # Rank the customer sales by Quarter and year, but only select the top 5 customers!
-    # Output Columns: Quarter, Year, CustomerID, Total
-    # HINT: Use "WITH"
-    # Hint: Round the the total
-    # HINT: YOU MUST CAST YEAR TO TYPE INTEGER!!!!
-    # HINT: You can have multiple CTE tables;
-    # WITH table1 AS (), table2 AS ()
-    ### BEGIN SOLUTION
-
-    sql_statement = """
-    
-    With SalesByQuarter AS (
-        select 
-            strftime('%Y', OrderDate) AS Year, 
-            CASE 
-                WHEN strftime('%m', OrderDate) BETWEEN '01' AND '03' THEN 'Q1'
-                WHEN strftime('%m', OrderDate) BETWEEN '04' AND '06' THEN 'Q2'
-                WHEN strftime('%m', OrderDate) BETWEEN '07' AND '09' THEN 'Q3'
-                ELSE 'Q4'
-            END AS Quarter, 
-            CustomerID, 
-            ROUND(SUM(p.ProductUnitPrice * od.QuantityOrdered), 0) AS Total
-        from OrderDetail od
-        join Product p ON od.ProductID = p.ProductID
-        group by Year, Quarter, CustomerID
-    ),
-    Top5Customers AS (
-        select 
-            Quarter, 
-            CAST(Year AS INTEGER) AS Year, 
-            CustomerID, 
-            Total, 
-            RANK() OVER (PARTITION BY Quarter, Year ORDER BY Total DESC) AS CustomerRank
-        from SalesByQuarter
-    )
-    select Quarter, Year, CustomerID, Total,CustomerRank
-    from Top5Customers
-    where CustomerRank <= 5
-    order by Year, Quarter
-    
-
-    
-    """
-    ### END SOLUTION
-    df = pd.read_sql_query(sql_statement, conn)
-    return sql_statement
-
-def ex10(conn):
-    
-    # Rank the monthly sales
-    # Output Columns: Quarter, Year, CustomerID, Total
-    # HINT: Use "WITH"
-    # Hint: Round the the total
-    ### BEGIN SOLUTION
-
-    sql_statement = """
-    	With SalesByMonth AS (
-			select 
-				CASE 
-					WHEN strftime('%m', OrderDate) = '01' THEN 'January'
-					WHEN strftime('%m', OrderDate) = '02' THEN 'February'
-					WHEN strftime('%m', OrderDate) = '03' THEN 'March'
-					WHEN strftime('%m', OrderDate) = '04' THEN 'April'
-					WHEN strftime('%m', OrderDate) = '05' THEN 'May'
-					WHEN strftime('%m', OrderDate) = '06' THEN 'June'
-					WHEN strftime('%m', OrderDate) = '07' THEN 'July'
-					WHEN strftime('%m', OrderDate) = '08' THEN 'August'
-					WHEN strftime('%m', OrderDate) = '09' THEN 'September'
-					WHEN strftime('%m', OrderDate) = '10' THEN 'October'
-					WHEN strftime('%m', OrderDate) = '11' THEN 'November'
-					WHEN strftime('%m', OrderDate) = '12' THEN 'December'
-				END AS Month, 
-				sum(ROUND((p.ProductUnitPrice * od.QuantityOrdered))) AS Total
-			from OrderDetail od
-			join Product p ON od.ProductID = p.ProductID
-			group by Month
-		),
-		 MonthlySalesRank AS (
-			SELECT 
-				Month, 
-				Total, 
-				RANK() OVER (ORDER BY Total DESC) AS TotalRank
-			FROM SalesByMonth
-		)
-		select Month,Total,TotalRank
-		from MonthlySalesRank
-      
-    """
-    ### END SOLUTION
-    df = pd.read_sql_query(sql_statement, conn)
-    return sql_statement
-
-def ex11(conn):
-    
-    # Find the MaxDaysWithoutOrder for each customer 
-    # Output Columns: 
-    # CustomerID,
-    # FirstName,
-    # LastName,
-    # Country,
-    # OrderDate, 
-    # PreviousOrderDate,
-    # MaxDaysWithoutOrder
-    # order by MaxDaysWithoutOrder desc
-    # HINT: Use "WITH"; I created two CTE tables
-    # HINT: Use Lag
-
-    ### BEGIN SOLUTION
-
-    sql_statement = """
-    WITH OrderDates AS (
-        SELECT 
-			CustomerID, 
-            OrderDate, 
-            LAG(OrderDate, 1) OVER (PARTITION BY CustomerID ORDER BY OrderDate) AS PreviousOrderDate,
-            JULIANDAY(OrderDate) - JULIANDAY(LAG(OrderDate, 1) OVER (PARTITION BY CustomerID ORDER BY OrderDate)) AS DaysSinceLastOrder
-        FROM 
-            OrderDetail
-			)
-    
-    SELECT 
-        distinct od.CustomerID, 
-        FirstName, 
-        LastName, 
-        Country, 
-        OrderDate, 
-        PreviousOrderDate, 
-        max(DaysSinceLastOrder) AS MaxDaysWithoutOrder
-    FROM OrderDates od   
-    JOIN Customer ON od.CustomerID = Customer.CustomerID
-	join country on Customer.CountryID =country.CountryID
-	group by od.CustomerID
-	order by MaxDaysWithoutOrder desc
-    
-
-    """
-    ### END SOLUTION
-    df = pd.read_sql_query(sql_statement, conn)
-    return sql_statement
-
+### Utility Functions
+import pandas as pd
+import numpy as np
+import sqlite3
+from sqlite3 import Error
+import datetime
+import itertools
+import os
+import sys
+import locale
+import concurrent.futures
+import hashlib
+import functools
+import json
+import threading
+import time
+import tracemalloc
+import asyncio
+import urllib.request
+import collections
+import pickle
+import array
+import heapq
+import tempfile
+import mmap
+import operator
+import gzip
+import bz2
+import lzma
+import queue
+import contextlib
+import types
+
+
+### Instrumentation
+# Opt-in measurements of the ETL steps and the queries:
+#
+#     with Instrumentation(trace_memory=True) as inst:
+#         build_normalized_database(data_filename, db)
+#     print(inst.table())
+#
+# Every call of an @instrumented function made while an Instrumentation is
+# active is recorded as a stage: wall and CPU time, data lines parsed, rows
+# inserted and fetched, the tracemalloc peak and the SQL statements it ran.
+# Stages nest (step11 calls step6 and step10), and each one is passed to `sink`
+# when it finishes. Connections opened by create_connection() while it is
+# active time every statement and fetch; on other connections passed to a stage
+# the statements are captured with set_trace_callback, without durations or
+# row counts. When nothing is active the wrappers only check one global and
+# create_connection() returns plain connections.
+
+_instrumentation = None
+
+
+def instrumented(func):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if _instrumentation is None:
+            return func(*args, **kwargs)
+        return _instrumentation.run(func, args, kwargs)
+    return wrapper
+
+
+def record_metric(name, value):
+    if _instrumentation is not None:
+        _instrumentation.add(name, value)
+
+
+def open_data_file(data_filename):
+    compression = data_file_compression(data_filename)
+    f = open(data_filename, 'r') if compression is None else _DecompressingFile(data_filename, compression)
+    if _instrumentation is None:
+        return f
+    return _CountingFile(f)
+
+
+class _CountingFile:
+    def __init__(self, f):
+        self._f = f
+        self.lines = 0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        line = next(self._f)
+        self.lines += 1
+        return line
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._f.close()
+        record_metric('lines_parsed', max(self.lines - 1, 0)) # not counting the header line
+
+
+class _TracedCursor(sqlite3.Cursor):
+    _entry = None
+
+    def _executed(self, sql, start):
+        if _instrumentation is not None:
+            self._entry = _instrumentation.statement(sql, time.perf_counter() - start, self.rowcount)
+
+    def _fetched(self, start, rows):
+        if _instrumentation is not None and self._entry is not None:
+            _instrumentation.fetched(self._entry, time.perf_counter() - start, rows)
+
+    def execute(self, sql, parameters=()):
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self._executed(sql, start)
+
+    def executemany(self, sql, seq_of_parameters):
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            self._executed(sql, start)
+
+    def executescript(self, sql_script):
+        start = time.perf_counter()
+        try:
+            return super().executescript(sql_script)
+        finally:
+            self._executed(sql_script, start)
+
+    def fetchone(self):
+        start = time.perf_counter()
+        row = super().fetchone()
+        self._fetched(start, 0 if row is None else 1)
+        return row
+
+    def fetchmany(self, size=None):
+        start = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self._fetched(start, len(rows))
+        return rows
+
+    def fetchall(self):
+        start = time.perf_counter()
+        rows = super().fetchall()
+        self._fetched(start, len(rows))
+        return rows
+
+    def __next__(self):
+        start = time.perf_counter()
+        row = super().__next__()
+        self._fetched(start, 1)
+        return row
+
+
+class _TracedConnection(sqlite3.Connection):
+    def cursor(self, factory=None):
+        return super().cursor(factory or _TracedCursor)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def executescript(self, sql_script):
+        return self.cursor().executescript(sql_script)
+
+    def commit(self):
+        start = time.perf_counter()
+        try:
+            super().commit()
+        finally:
+            if _instrumentation is not None:
+                _instrumentation.statement("COMMIT", time.perf_counter() - start, -1)
+
+
+class Instrumentation:
+    def __init__(self, trace_sql=True, trace_memory=False, sink=None):
+        self.trace_sql = trace_sql
+        self.trace_memory = trace_memory
+        self.sink = sink
+        self.stages = []
+        self._local = threading.local()
+        self._stop_tracemalloc = False
+
+    def start(self):
+        global _instrumentation
+        if _instrumentation is not None:
+            raise RuntimeError("another Instrumentation is already active")
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._stop_tracemalloc = True
+        _instrumentation = self
+        return self
+
+    def stop(self):
+        global _instrumentation
+        if _instrumentation is self:
+            _instrumentation = None
+        if self._stop_tracemalloc:
+            tracemalloc.stop()
+            self._stop_tracemalloc = False
+        return self
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def _stack(self):
+        # (stage, connection traced with set_trace_callback or None) per
+        # thread, innermost stage last
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def _update_peaks(self, stack):
+        # tracemalloc has one peak for the process: fold it into every open
+        # stage before it is reset for a nested one.
+        if self.trace_memory and tracemalloc.is_tracing():
+            peak = tracemalloc.get_traced_memory()[1]
+            for stage, conn in stack:
+                stage['peak_tracemalloc'] = max(stage['peak_tracemalloc'] or 0, peak)
+            tracemalloc.reset_peak()
+
+    def _trace_connection(self, stack, args, kwargs):
+        for value in itertools.chain(args, kwargs.values()):
+            if isinstance(value, sqlite3.Connection) and not isinstance(value, _TracedConnection):
+                if any(conn is value for stage, conn in stack):
+                    return None
+                value.set_trace_callback(lambda sql: self.statement(sql))
+                return value
+        return None
+
+    def _resume(self, stage, conn, call):
+        # Run call() with stage as the innermost stage, adding to its times.
+        stack = self._stack()
+        self._update_peaks(stack)
+        stack.append((stage, conn))
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        try:
+            return call()
+        except StopIteration:
+            raise
+        except BaseException as e:
+            stage['error'] = repr(e)
+            raise
+        finally:
+            stage['wall'] = (stage['wall'] or 0) + time.perf_counter() - wall
+            stage['cpu'] = (stage['cpu'] or 0) + time.process_time() - cpu
+            self._update_peaks(stack)
+            stack.pop()
+
+    def _finish(self, stage, conn):
+        if conn is not None:
+            conn.set_trace_callback(None)
+        if self.sink is not None:
+            self.sink(self._stage_report(stage))
+
+    def _consume(self, stage, conn, generator):
+        # A generator returned by a stage (the ex functions with chunksize) is
+        # measured while it is consumed: every next() runs inside the stage,
+        # and the stage finishes when the generator is exhausted or closed.
+        try:
+            while True:
+                try:
+                    item = self._resume(stage, conn, functools.partial(next, generator))
+                except StopIteration:
+                    return
+                yield item
+        finally:
+            generator.close()
+            self._finish(stage, conn)
+
+    def run(self, func, args, kwargs):
+        stack = self._stack()
+        stage = {'stage': func.__name__, 'depth': len(stack), 'parent': stack[-1][0]['stage'] if stack else None,
+                 'wall': None, 'cpu': None, 'lines_parsed': 0, 'rows_inserted': 0, 'rows_fetched': 0,
+                 'peak_tracemalloc': None, 'statements': {}, 'error': None}
+        self.stages.append(stage)
+        conn = self._trace_connection(stack, args, kwargs) if self.trace_sql else None
+        try:
+            result = self._resume(stage, conn, functools.partial(func, *args, **kwargs))
+        except BaseException:
+            self._finish(stage, conn)
+            raise
+        if isinstance(result, types.GeneratorType):
+            return self._consume(stage, conn, result)
+        self._finish(stage, conn)
+        return result
+
+    def add(self, name, value):
+        stack = self._stack()
+        if stack:
+            stack[-1][0][name] += value
+
+    def statement(self, sql, seconds=None, rowcount=-1):
+        # Adds one execution of sql to the innermost stage and returns its entry.
+        stack = self._stack()
+        if not stack or not self.trace_sql:
+            return None
+        stage = stack[-1][0]
+        sql = ' '.join(sql.split())
+        entry = stage['statements'].get(sql)
+        if entry is None:
+            entry = stage['statements'][sql] = {'sql': sql, 'calls': 0, 'seconds': None, 'rows': 0}
+        entry['calls'] += 1
+        if seconds is not None:
+            entry['seconds'] = (entry['seconds'] or 0) + seconds
+        if rowcount > 0:
+            entry['rows'] += rowcount
+            if sql[:6].upper() == 'INSERT':
+                stage['rows_inserted'] += rowcount
+        return entry
+
+    def fetched(self, entry, seconds, rows):
+        entry['seconds'] = (entry['seconds'] or 0) + seconds
+        entry['rows'] += rows
+        self.add('rows_fetched', rows)
+
+    def _stage_report(self, stage):
+        statements = sorted(stage['statements'].values(), key=lambda entry: -(entry['seconds'] or 0))
+        return dict(stage, statements=statements)
+
+    def report(self):
+        return {'stages': [self._stage_report(stage) for stage in self.stages]}
+
+    def to_json(self, filename=None):
+        text = json.dumps(self.report(), indent=2)
+        if filename is not None:
+            with open(filename, 'w') as f:
+                f.write(text)
+        return text
+
+    def table(self, statements=10):
+        # One line per stage, indented by nesting depth, then the slowest
+        # `statements` SQL statements over all stages.
+        columns = ['wall', 'cpu', 'lines_parsed', 'rows_inserted', 'rows_fetched', 'peak_tracemalloc']
+        stages = pd.DataFrame([dict({column: stage[column] for column in columns},
+                                    stage='  ' * stage['depth'] + stage['stage'], sql=len(stage['statements']))
+                               for stage in self.stages], columns=['stage'] + columns + ['sql'])
+        # left-aligned, or the indentation would be lost in the padding
+        width = max([len('stage')] + [len(stage) for stage in stages['stage']])
+        stages['stage'] = stages['stage'].str.ljust(width)
+        text = stages.rename(columns={'stage': 'stage'.ljust(width)}).to_string(index=False)
+        timed = [dict(entry, stage=stage['stage']) for stage in self.stages for entry in stage['statements'].values()]
+        timed.sort(key=lambda entry: -(entry['seconds'] or 0))
+        if statements and timed:
+            slowest = pd.DataFrame(timed[:statements], columns=['stage', 'calls', 'seconds', 'rows', 'sql'])
+            slowest['sql'] = slowest['sql'].str.slice(0, 80)
+            text += '\n\n' + slowest.to_string(index=False)
+        return text
+
+# Settings for a rebuild where only insert speed matters: no rollback journal,
+# no fsync, a 1 GB page cache and in-memory temp tables. A crash during the load
+# can corrupt the file, so the load has to be started over from scratch.
+BULK_LOAD_PRAGMAS = [
+    "PRAGMA foreign_keys = 0",
+    "PRAGMA journal_mode = OFF",
+    "PRAGMA synchronous = OFF",
+    "PRAGMA cache_size = -1048576",
+    "PRAGMA temp_store = MEMORY",
+]
+
+# What finish_bulk_load() restores on a connection whose settings from before
+# start_bulk_load() are not known.
+SAFE_PRAGMAS = [
+    "PRAGMA synchronous = FULL",
+    "PRAGMA cache_size = -2000",
+    "PRAGMA temp_store = DEFAULT",
+    "PRAGMA foreign_keys = 1",
+]
+
+# The settings BULK_LOAD_PRAGMAS change. start_bulk_load() returns what they
+# were before the load, for finish_bulk_load() to put back.
+BULK_LOAD_SETTINGS = ['journal_mode', 'synchronous', 'cache_size', 'temp_store', 'foreign_keys']
+
+def create_connection(db_file, delete_db=False):
+    import os
+    if delete_db and os.path.exists(db_file):
+        os.remove(db_file)
+
+    conn = None
+    try:
+        if _instrumentation is None:
+            conn = sqlite3.connect(db_file)
+        else:
+            conn = sqlite3.connect(db_file, factory=_TracedConnection)
+        conn.execute("PRAGMA foreign_keys = 1")
+    except Error as e:
+        print(e)
+
+    return conn
+
+
+def start_bulk_load(conn):
+    # Switch conn to BULK_LOAD_PRAGMAS and return the settings it had before
+    # (e.g. journal_mode = wal), to pass to finish_bulk_load().
+    conn.commit()
+    settings = [(name, conn.execute("PRAGMA %s" % name).fetchone()[0]) for name in BULK_LOAD_SETTINGS]
+    for pragma in BULK_LOAD_PRAGMAS:
+        conn.execute(pragma)
+    return settings
+
+
+def _restore_settings(conn, settings):
+    # journal_mode and foreign_keys cannot change inside a transaction, so one
+    # left open by a failed load is rolled back first.
+    if conn.in_transaction:
+        conn.rollback()
+    if settings is None:
+        pragmas = SAFE_PRAGMAS
+    else:
+        pragmas = ["PRAGMA %s = %s" % (name, value) for name, value in settings]
+    for pragma in pragmas:
+        conn.execute(pragma)
+
+
+def finish_bulk_load(conn, settings=None):
+    # Commit a bulk load, check every foreign key once (instead of on each
+    # inserted row) and put back settings from start_bulk_load(), or
+    # SAFE_PRAGMAS when they are not known. The settings are put back even
+    # if the commit fails.
+    try:
+        conn.commit()
+        violations = conn.execute("PRAGMA foreign_key_check").fetchall()
+    finally:
+        _restore_settings(conn, settings)
+    if violations:
+        raise sqlite3.IntegrityError("%d rows violate a foreign key, first: %r" % (len(violations), violations[0]))
+
+
+@contextlib.contextmanager
+def bulk_loading(conn):
+    # start_bulk_load() and finish_bulk_load() around a with block. If the
+    # block raises, its transaction is rolled back and conn gets its settings
+    # back all the same.
+    settings = start_bulk_load(conn)
+    try:
+        yield conn
+    except BaseException:
+        _restore_settings(conn, settings)
+        raise
+    finish_bulk_load(conn, settings)
+
+
+def create_table(conn, create_table_sql, drop_table_name=None):
+    
+    if drop_table_name: # You can optionally pass drop_table_name to drop the table. 
+        try:
+            c = conn.cursor()
+            c.execute("""DROP TABLE IF EXISTS %s""" % (drop_table_name))
+        except Error as e:
+            print(e)
+    
+    try:
+        c = conn.cursor()
+        c.execute(create_table_sql)
+    except Error as e:
+        print(e)
+        
+@instrumented
+def execute_sql_statement(sql_statement, conn):
+    cur = conn.cursor()
+    cur.execute(sql_statement)
+
+    rows = cur.fetchall()
+
+    return rows
+
+REGION_TABLE_SQL = """
+    CREATE TABLE IF NOT EXISTS region (
+        RegionID INTEGER PRIMARY KEY,
+        Region TEXT NOT NULL
+    );
+"""
+
+COUNTRY_TABLE_SQL = """
+    CREATE TABLE IF NOT EXISTS country (
+        CountryID INTEGER PRIMARY KEY,
+        Country TEXT NOT NULL,
+        RegionID INTEGER NOT NULL,
+        FOREIGN KEY (RegionID) REFERENCES region (RegionID)
+    );
+"""
+
+CUSTOMER_TABLE_SQL = """
+    CREATE TABLE IF NOT EXISTS customer (
+        CustomerID INTEGER PRIMARY KEY,
+        FirstName TEXT NOT NULL,
+        LastName TEXT NOT NULL,
+        Address TEXT NOT NULL,
+        City TEXT NOT NULL,
+        CountryID INTEGER NOT NULL,
+        FOREIGN KEY (CountryID) REFERENCES country (CountryID)
+    );
+"""
+
+PRODUCTCATEGORY_TABLE_SQL = """
+    CREATE TABLE IF NOT EXISTS productcategory (
+        ProductCategoryID INTEGER PRIMARY KEY,
+        ProductCategory TEXT NOT NULL,
+        ProductCategoryDescription TEXT NOT NULL
+    );
+"""
+
+PRODUCT_TABLE_SQL = """
+    CREATE TABLE IF NOT EXISTS product (
+        ProductID INTEGER PRIMARY KEY,
+        ProductName TEXT NOT NULL,
+        ProductUnitPrice REAL NOT NULL,
+        ProductCategoryID INTEGER NOT NULL,
+        FOREIGN KEY (ProductCategoryID) REFERENCES productcategory (ProductCategoryID)
+    );
+"""
+
+ORDERDETAIL_TABLE_SQL = """
+    CREATE TABLE IF NOT EXISTS OrderDetail (
+        OrderID INTEGER PRIMARY KEY,
+        CustomerID INTEGER NOT NULL,
+        ProductID INTEGER NOT NULL,
+        OrderDate TEXT NOT NULL,
+        QuantityOrdered INTEGER NOT NULL,
+        DateKey INTEGER NOT NULL
+    );
+"""
+
+# OrderDetail rows are (CustomerID, ProductID, OrderDate, QuantityOrdered, DateKey),
+# where DateKey is the yyyymmdd integer of OrderDate, see create_date_dim().
+ORDERDETAIL_INSERT_SQL = "INSERT INTO OrderDetail (CustomerID, ProductID, OrderDate, QuantityOrdered, DateKey) VALUES (?, ?, ?, ?, ?)"
+
+# Secondary indexes for the ex queries: the customer lookups and window in
+# ex1/ex2/ex11, the joins in ex3..ex9 and the name -> ID dictionaries.
+INDEX_SQL = {
+    'idx_orderdetail_customer_date': "CREATE INDEX IF NOT EXISTS idx_orderdetail_customer_date ON OrderDetail (CustomerID, OrderDate)",
+    'idx_orderdetail_datekey': "CREATE INDEX IF NOT EXISTS idx_orderdetail_datekey ON OrderDetail (DateKey)",
+    'idx_orderdetail_productid': "CREATE INDEX IF NOT EXISTS idx_orderdetail_productid ON OrderDetail (ProductID)",
+    'idx_customer_countryid': "CREATE INDEX IF NOT EXISTS idx_customer_countryid ON customer (CountryID)",
+    'idx_customer_name': "CREATE INDEX IF NOT EXISTS idx_customer_name ON customer (FirstName, LastName)",
+    'idx_country_regionid': "CREATE INDEX IF NOT EXISTS idx_country_regionid ON country (RegionID)",
+    'idx_country_name': "CREATE INDEX IF NOT EXISTS idx_country_name ON country (Country)",
+    'idx_region_name': "CREATE INDEX IF NOT EXISTS idx_region_name ON region (Region)",
+    'idx_productcategory_name': "CREATE INDEX IF NOT EXISTS idx_productcategory_name ON productcategory (ProductCategory)",
+    'idx_product_name': "CREATE INDEX IF NOT EXISTS idx_product_name ON product (ProductName)",
+}
+
+
+@instrumented
+def create_indexes(conn):
+    for index_sql in INDEX_SQL.values():
+        conn.execute(index_sql)
+    conn.execute("ANALYZE")
+
+
+### Compressed data files
+# Data files may be gzip, bzip2 or xz compressed; open_data_file() and
+# iter_data_fields() recognise them by their first bytes, whatever the file
+# is called. The file is inflated on a producer thread that puts batches of
+# about DECOMPRESS_BATCH_BYTES of lines on a queue of at most
+# DECOMPRESS_QUEUE_BATCHES, so decompression (which releases the GIL) runs
+# while the previous batch is parsed and inserted, and nothing is written to
+# disk. build_normalized_database(workers=...) parses a compressed file in
+# one process, since it cannot be split at byte offsets, and ingest_delta()
+# keeps its watermark as an offset into the decompressed data.
+
+DECOMPRESS_BATCH_BYTES = 2**20
+DECOMPRESS_QUEUE_BATCHES = 8
+
+_COMPRESSION_MAGIC = [('gzip', b'\x1f\x8b'), ('bz2', b'BZh'), ('xz', b'\xfd7zXZ\x00')]
+_COMPRESSED_OPENERS = {'gzip': gzip.open, 'bz2': bz2.open, 'xz': lzma.open}
+
+
+def data_file_compression(data_filename):
+    # 'gzip', 'bz2', 'xz' or None, from the file's first bytes.
+    with open(data_filename, 'rb') as f:
+        magic = f.read(6)
+    for compression, prefix in _COMPRESSION_MAGIC:
+        if magic.startswith(prefix):
+            return compression
+    return None
+
+
+def _open_binary(data_filename):
+    # Seekable binary file object of the decompressed data, for byte offsets.
+    compression = data_file_compression(data_filename)
+    if compression is None:
+        return open(data_filename, 'rb')
+    return _COMPRESSED_OPENERS[compression](data_filename, 'rb')
+
+
+class _DecompressingFile:
+    # Iterates the lines of a compressed file ('r' for str, 'rb' for bytes)
+    # while a producer thread decompresses the ones after them.
+    def __init__(self, data_filename, compression, mode='r'):
+        self._queue = queue.Queue(DECOMPRESS_QUEUE_BATCHES)
+        self._stop = threading.Event()
+        self._batch = iter(())
+        self._finished = False
+        self._thread = threading.Thread(target=self._produce, args=(data_filename, compression, mode), daemon=True)
+        self._thread.start()
+
+    def _put(self, item):
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def _produce(self, data_filename, compression, mode):
+        try:
+            with _COMPRESSED_OPENERS[compression](data_filename, mode + 't' if mode == 'r' else mode) as f:
+                while not self._stop.is_set():
+                    batch = f.readlines(DECOMPRESS_BATCH_BYTES)
+                    if not batch:
+                        break
+                    self._put(batch)
+        except Exception as e:
+            self._put(e) # raised again in the reading thread
+        else:
+            self._put(None)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            return next(self._batch)
+        except StopIteration:
+            if self._finished:
+                raise
+        batch = self._queue.get()
+        if batch is None:
+            self._finished = True
+            raise StopIteration
+        if isinstance(batch, Exception):
+            self._finished = True
+            raise batch
+        self._batch = iter(batch)
+        return next(self._batch)
+
+    def close(self):
+        self._stop.set()
+        self._thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+@contextlib.contextmanager
+def _binary_lines(data_filename):
+    # Iterator over the raw lines of a data file, header included: read from
+    # an mmap, or from a _DecompressingFile when the file is compressed.
+    compression = data_file_compression(data_filename)
+    if compression is not None:
+        with _DecompressingFile(data_filename, compression, 'rb') as f:
+            yield f
+        return
+    with open(data_filename, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            yield iter(())
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            yield iter(mm.readline, b'')
+
+
+### Field reader
+# iter_data_fields() reads only some columns of a data file. The file is
+# memory-mapped and read as raw bytes: each line is split on tabs only up to
+# the last column asked for, and only those fields are decoded. Decoding field
+# by field is no faster than the text reader decoding whole lines, so the
+# gain is in passes that keep few distinct values (step1, step3, step7): with
+# decode=False the fields stay bytes and only the kept values are decoded, at
+# the end. Steps that need most columns of every line still use open_data_file().
+
+def iter_data_fields(data_filename, columns, decode=True):
+    # Yields tuple(line.strip().split('\t')[i] for i in columns) for every
+    # line after the header.
+    encoding = locale.getpreferredencoding(False)
+    maxsplit = max(columns) + 1
+    if len(columns) == 1:
+        column = columns[0]
+        get = lambda fields: (fields[column],)
+    else:
+        get = operator.itemgetter(*columns)
+    lines = 0
+    with _binary_lines(data_filename) as f:
+        try:
+            next(f, None) # skip header line
+            for lines, line in enumerate(f, 1):
+                fields = get(line.strip().split(b'\t', maxsplit))
+                yield tuple([field.decode(encoding) for field in fields]) if decode else fields
+        finally:
+            record_metric('lines_parsed', lines)
+
+
+def _decoded(values):
+    # A list of bytes values, or a dict of them, decoded as data files are.
+    encoding = locale.getpreferredencoding(False)
+    if isinstance(values, dict):
+        return {key.decode(encoding): value.decode(encoding) for key, value in values.items()}
+    return [value.decode(encoding) for value in values]
+
+
+### Date dimension
+# date_dim has one row per order date, keyed by the integer DateKey (yyyymmdd)
+# stored on OrderDetail, so the time-bucketed ex queries (date_dim=True) join
+# and group on integers instead of calling strftime/JULIANDAY on every row.
+# DayNumber is the proleptic Gregorian ordinal, so differences are day counts.
+
+DATE_DIM_TABLE_SQL = """
+    CREATE TABLE IF NOT EXISTS date_dim (
+        DateKey INTEGER PRIMARY KEY,
+        OrderDate TEXT NOT NULL,
+        Year INTEGER NOT NULL,
+        Quarter TEXT NOT NULL,
+        MonthNumber INTEGER NOT NULL,
+        MonthName TEXT NOT NULL,
+        DayNumber INTEGER NOT NULL
+    );
+"""
+
+MONTH_NAMES = ['January', 'February', 'March', 'April', 'May', 'June', 'July',
+               'August', 'September', 'October', 'November', 'December']
+
+
+def create_orderdetail_table(conn):
+    # Databases built before DateKey existed get the column added and filled.
+    create_table(conn, ORDERDETAIL_TABLE_SQL)
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(OrderDetail)")]
+    if 'DateKey' not in columns:
+        conn.execute("ALTER TABLE OrderDetail ADD COLUMN DateKey INTEGER")
+        conn.execute("UPDATE OrderDetail SET DateKey = CAST(strftime('%Y%m%d', OrderDate) AS INTEGER)")
+
+
+def create_date_dim(conn, date_keys=None):
+    # Add the date_dim rows for date_keys, or for every DateKey in OrderDetail.
+    create_table(conn, DATE_DIM_TABLE_SQL)
+    if date_keys is None:
+        create_orderdetail_table(conn)
+        date_keys = [row[0] for row in conn.execute("SELECT DISTINCT DateKey FROM OrderDetail")]
+    known = set(row[0] for row in conn.execute("SELECT DateKey FROM date_dim"))
+    values = []
+    for date_key in sorted(set(date_keys) - known):
+        date = datetime.date(date_key // 10000, date_key // 100 % 100, date_key % 100)
+        values.append((date_key, date.isoformat(), date.year, 'Q%d' % ((date.month - 1) // 3 + 1),
+                       date.month, MONTH_NAMES[date.month - 1], date.toordinal()))
+    conn.executemany("INSERT INTO date_dim (DateKey, OrderDate, Year, Quarter, MonthNumber, MonthName, DayNumber) VALUES (?, ?, ?, ?, ?, ?, ?)", values)
+
+
+
+### External sort
+# step5, step9 and step11 insert their rows sorted. Up to EXTERNAL_SORT_ROWS
+# rows are sorted in memory; past that, each full run of rows is sorted and
+# spilled to an anonymous temp file (in EXTERNAL_SORT_DIR, None for the system
+# default), and the runs are merged with heapq.merge while they are inserted.
+# The merge takes equal keys from earlier runs first, so the result is the
+# same stable order that sorted() gives.
+
+EXTERNAL_SORT_ROWS = 1000000
+EXTERNAL_SORT_DIR = None
+
+
+def _next_run(rows, run_size, unique):
+    # Up to run_size rows (distinct rows with unique), and whether rows ran out.
+    if not unique:
+        run = list(itertools.islice(rows, run_size))
+        return run, len(run) < run_size
+    run = {}
+    for row in rows:
+        run[row] = None
+        if len(run) == run_size:
+            return list(run), False
+    return list(run), True
+
+
+def _spill_run(run, batch_size=10000):
+    f = tempfile.TemporaryFile(dir=EXTERNAL_SORT_DIR)
+    for start in range(0, len(run), batch_size):
+        pickle.dump(run[start:start + batch_size], f, pickle.HIGHEST_PROTOCOL)
+    f.seek(0)
+    return f
+
+
+def _read_run(f):
+    with f:
+        while True:
+            try:
+                batch = pickle.load(f)
+            except EOFError:
+                return
+            yield from batch
+
+
+def _unique_sorted(rows, key):
+    # Drop repeated rows from sorted rows; equal rows can only be apart when
+    # rows with the same key lie between them.
+    current, seen = object(), set()
+    for row in rows:
+        row_key = row if key is None else key(row)
+        if row_key != current:
+            current, seen = row_key, set()
+        if row not in seen:
+            seen.add(row)
+            yield row
+
+
+def external_sort(rows, key=None, unique=False, run_size=None):
+    # Iterator over sorted(rows, key=key), holding at most run_size rows
+    # (default EXTERNAL_SORT_ROWS) in memory. unique=True also drops repeated
+    # rows, keeping the first, like sorting a set but with a stable order.
+    run_size = run_size or EXTERNAL_SORT_ROWS
+    rows = iter(rows)
+    runs = []
+    while True:
+        run, exhausted = _next_run(rows, run_size, unique)
+        run.sort(key=key)
+        if exhausted and not runs:
+            merged = run
+            break
+        if run:
+            runs.append(_spill_run(run))
+        del run
+        if exhausted:
+            merged = heapq.merge(*[_read_run(f) for f in runs], key=key)
+            break
+    if unique:
+        merged = _unique_sorted(merged, key)
+    yield from merged
+
+
+### OrderDetail rows
+# The order lines are the one part of the file that grows with every line
+# item, so they are encoded compactly. Order dates repeat (a few thousand
+# distinct days), so strptime runs once per distinct date, and the rows are
+# held as four array('q') columns (32 bytes a row) instead of 5-tuples holding
+# two strings. OrderDate is rebuilt from DateKey when the rows are written.
+# Past EXTERNAL_SORT_ROWS rows the columns are spilled as a sorted run of
+# (CustomerID, ProductID, DateKey, QuantityOrdered) int64 records and merged
+# on the way out, see external_sort().
+
+class _OrderDates(dict):
+    # yyyymmdd -> (OrderDate as 'YYYY-MM-DD', DateKey)
+    def __missing__(self, OrderDate):
+        value = self[OrderDate] = (datetime.datetime.strptime(OrderDate, '%Y%m%d').strftime('%Y-%m-%d'), int(OrderDate))
+        return value
+
+    def date_keys(self):
+        return set(date_key for iso_date, date_key in self.values())
+
+
+class _OrderDetailColumns:
+    def __init__(self):
+        self.CustomerID = array.array('q')
+        self.ProductID = array.array('q')
+        self.DateKey = array.array('q')
+        self.QuantityOrdered = array.array('q')
+        self.runs = []
+
+    def __len__(self):
+        return len(self.CustomerID)
+
+    def _sorted_columns(self):
+        columns = [np.frombuffer(column, dtype=np.int64) for column in (self.CustomerID, self.ProductID, self.DateKey, self.QuantityOrdered)]
+        order = np.argsort(columns[0], kind='stable')
+        return [column[order] for column in columns]
+
+    def spill(self):
+        # Write the rows held so far as one sorted run and empty the columns in
+        # place, so bound append methods stay valid.
+        f = tempfile.TemporaryFile(dir=EXTERNAL_SORT_DIR)
+        f.write(np.column_stack(self._sorted_columns()).tobytes())
+        f.seek(0)
+        self.runs.append(f)
+        for column in (self.CustomerID, self.ProductID, self.DateKey, self.QuantityOrdered):
+            del column[:]
+
+    def _read_run(self, f, batch_size):
+        with f:
+            while True:
+                records = np.frombuffer(f.read(batch_size * 32), dtype=np.int64)
+                if not len(records):
+                    return
+                yield from records.reshape(-1, 4).tolist()
+
+    def rows(self, dates, batch_size=100000):
+        # ORDERDETAIL_INSERT_SQL tuples, stable-sorted by CustomerID as step11
+        # sorts them, built batch_size rows at a time.
+        iso_date = {date_key: iso for iso, date_key in dates.values()}
+        if not self.runs:
+            columns = self._sorted_columns()
+            for start in range(0, len(columns[0]), batch_size):
+                CustomerID, ProductID, DateKey, QuantityOrdered = (column[start:start + batch_size].tolist() for column in columns)
+                yield from zip(CustomerID, ProductID, [iso_date[date_key] for date_key in DateKey], QuantityOrdered, DateKey)
+            return
+        if len(self):
+            self.spill()
+        runs = [self._read_run(f, 8192) for f in self.runs]
+        self.runs = []
+        for CustomerID, ProductID, DateKey, QuantityOrdered in heapq.merge(*runs, key=lambda record: record[0]):
+            yield (CustomerID, ProductID, iso_date[DateKey], QuantityOrdered, DateKey)
+
+
+@instrumented
+def step1_create_region_table(data_filename, normalized_database_filename, conn=None):
+    regions = set()
+    for region, in iter_data_fields(data_filename, (4,), decode=False):
+        regions.add(region)
+    regions = sorted(_decoded(regions))
+    
+    close_conn = conn is None
+    if close_conn:
+        conn = create_connection(normalized_database_filename)
+
+    create_table(conn, REGION_TABLE_SQL)
+
+    # Insert into region table
+    insert_sql = "INSERT INTO region (Region) VALUES (?)"
+    values = [(region,) for region in regions]
+    conn.executemany(insert_sql, values)
+
+
+    conn.commit()
+    if close_conn:
+        conn.close()
+
+@instrumented
+def step2_create_region_to_regionid_dictionary(normalized_database_filename, conn=None):
+    close_conn = conn is None
+    if close_conn:
+        conn = create_connection(normalized_database_filename)
+
+    select_sql = "SELECT RegionID, Region FROM region"
+    cursor = conn.cursor()
+    cursor.execute(select_sql)
+    rows = cursor.fetchall()
+
+    region_to_id = {row[1]: row[0] for row in rows}
+
+    if close_conn:
+        conn.close()
+
+    return region_to_id
+
+
+@instrumented
+def step3_create_country_table(data_filename, normalized_database_filename, conn=None):
+    country_region = {}
+    region_to_id = step2_create_region_to_regionid_dictionary(normalized_database_filename, conn)
+    # A country gets the region of its first line, if that region is known
+    for country, region in iter_data_fields(data_filename, (3, 4), decode=False):
+        if country not in country_region:
+            country_region[country] = region
+
+    close_conn = conn is None
+    if close_conn:
+        conn = create_connection(normalized_database_filename)
+
+    create_table(conn, COUNTRY_TABLE_SQL)
+
+    # Insert into country table
+    insert_sql = "INSERT INTO country (Country, RegionID) VALUES (?, ?)"
+    values = [(country, region_to_id[region]) for country, region in _decoded(country_region).items() if region in region_to_id]
+    values.sort(key=lambda x: x[0])    
+    conn.executemany(insert_sql, values)
+
+    conn.commit()
+    if close_conn:
+        conn.close()
+
+
+
+@instrumented
+def step4_create_country_to_countryid_dictionary(normalized_database_filename, conn=None):
+    close_conn = conn is None
+    if close_conn:
+        conn = create_connection(normalized_database_filename)
+
+    select_sql = "SELECT CountryID, Country FROM country"
+    cursor = conn.cursor()
+    cursor.execute(select_sql)
+    rows = cursor.fetchall()
+
+    country_to_id = {row[1]: row[0] for row in rows}
+
+    if close_conn:
+        conn.close()
+
+    return country_to_id
+        
+        
+@instrumented
+def step5_create_customer_table(data_filename, normalized_database_filename, conn=None):
+
+    country_to_id = step4_create_country_to_countryid_dictionary(normalized_database_filename, conn)
+    def customer_rows():
+        with open_data_file(data_filename) as f:
+            next(f) 
+            for line in f:
+                fields = line.strip().split('\t')
+                name = fields[0].split(' ')
+                firstname, lastname = name[0], ' '.join(name[1:])
+                address, city, country = fields[1], fields[2], fields[3]
+                if country in country_to_id:
+                    yield (firstname, lastname, address, city, country_to_id[country])
+    values = external_sort(customer_rows(), key=lambda x: x[0])
+
+    close_conn = conn is None
+    if close_conn:
+        conn = create_connection(normalized_database_filename)
+
+    create_table(conn, CUSTOMER_TABLE_SQL)
+
+    # Insert into customer table
+    insert_sql = "INSERT INTO customer (FirstName, LastName, Address, City, CountryID) VALUES (?, ?, ?, ?, ?)"
+    conn.executemany(insert_sql, values)
+
+    conn.commit()
+    if close_conn:
+        conn.close()
+
+
+@instrumented
+def step6_create_customer_to_customerid_dictionary(normalized_database_filename, conn=None):
+    close_conn = conn is None
+    if close_conn:
+        conn = create_connection(normalized_database_filename)
+
+    select_sql = "SELECT CustomerID, FirstName ||' '|| LastName as Name FROM customer"
+    cursor = conn.cursor()
+    cursor.execute(select_sql)
+    rows = cursor.fetchall()
+
+    customer_to_id = {row[1]: row[0] for row in rows}
+
+    if close_conn:
+        conn.close()
+
+    return customer_to_id
+        
+@instrumented
+def step7_create_productcategory_table(data_filename, normalized_database_filename, conn=None):
+    ProductCategoryValue=[]
+    # Only the categories of the last line are kept
+    last_line = collections.deque(iter_data_fields(data_filename, (6, 7), decode=False), maxlen=1)
+    ProductCategoryList, ProductCategoryDescriptionList = [field.split(';') for field in _decoded(last_line[0])]
+    ProductCategorydict = dict(zip(ProductCategoryList, ProductCategoryDescriptionList))
+            
+    for key,value in ProductCategorydict.items():
+        a=tuple((key,value))
+        ProductCategoryValue.append(a)
+            
+            
+
+    close_conn = conn is None
+    if close_conn:
+        conn = create_connection(normalized_database_filename)
+
+    # Create customer table
+    create_table(conn, PRODUCTCATEGORY_TABLE_SQL)
+
+    # Insert data into productcategory table
+    insert_sql = "INSERT INTO productcategory (ProductCategory, ProductCategoryDescription) VALUES (?, ?)"
+    ProductCategoryValue = sorted(ProductCategoryValue, key=lambda x: x[0])
+    conn.executemany(insert_sql, ProductCategoryValue)
+
+    conn.commit()
+    if close_conn:
+        conn.close()
+
+@instrumented
+def step8_create_productcategory_to_productcategoryid_dictionary(normalized_database_filename, conn=None):
+    
+    close_conn = conn is None
+    if close_conn:
+        conn = create_connection(normalized_database_filename)
+
+    select_sql = "SELECT ProductCategoryID, ProductCategory FROM productcategory"
+    cursor = conn.cursor()
+    cursor.execute(select_sql)
+    rows = cursor.fetchall()
+
+    ProductCategory_to_id = {row[1]: row[0] for row in rows}
+
+    if close_conn:
+        conn.close()
+
+    return ProductCategory_to_id
+        
+
+@instrumented
+def step9_create_product_table(data_filename, normalized_database_filename, conn=None):
+    ProductCategory_to_id = step8_create_productcategory_to_productcategoryid_dictionary(normalized_database_filename, conn)
+
+    def product_rows():
+        with open_data_file(data_filename) as f:
+            next(f)
+            for line in f:
+                fields = line.strip().split('\t')
+                #ProductName, ProductUnitPrice, ProductCategoryList = fields[5].split(';'), fields[8].split(';'), fields[6].split(';')
+                #prod_dict=dict(zip(ProductName, ProductUnitPrice))
+                #print(prod_dict)
+                ProductName, ProductUnitPrice, ProductCategoryList = fields[5].split(';'), fields[8].split(';'), fields[6].split(';')
+                for i, prod_name in enumerate(ProductName):
+                    yield (prod_name.strip(), float(ProductUnitPrice[i]), ProductCategory_to_id[ProductCategoryList[i].strip()])
+    values = external_sort(product_rows(), key=lambda x: x[0], unique=True)
+    close_conn = conn is None
+    if close_conn:
+        conn = create_connection(normalized_database_filename)
+
+    # Create customer table
+    create_table(conn, PRODUCT_TABLE_SQL)
+
+    insert_sql = "INSERT INTO product (ProductName, ProductUnitPrice, ProductCategoryID) VALUES (?, ?, ?)"
+    conn.executemany(insert_sql, values)
+
+    conn.commit()
+    if close_conn:
+        conn.close()
+
+
+@instrumented
+def step10_create_product_to_productid_dictionary(normalized_database_filename, conn=None):
+    close_conn = conn is None
+    if close_conn:
+        conn = create_connection(normalized_database_filename)
+
+    select_sql = "SELECT ProductID, ProductName FROM product"
+    cursor = conn.cursor()
+    cursor.execute(select_sql)
+    rows = cursor.fetchall()
+
+    Product_to_id = {row[1]: row[0] for row in rows}
+
+    if close_conn:
+        conn.close()
+
+    return Product_to_id
+    
+        
+
+@instrumented
+def step11_create_orderdetail_table(data_filename, normalized_database_filename, conn=None):
+    Customer_to_id = step6_create_customer_to_customerid_dictionary(normalized_database_filename, conn)
+    Product_to_id = step10_create_product_to_productid_dictionary(normalized_database_filename, conn)
+    #Product_to_id={'Alice Mutton': 1, 'Aniseed Syrup': 2, 'Boston Crab Meat': 3, 'Camembert Pierrot': 4, 'Carnarvon Tigers': 5, 'Chai': 6, 'Chang': 7, 'Chartreuse verte': 8, "Chef Anton's Cajun Seasoning": 9, "Chef Anton's Gumbo Mix": 10, 'Chocolade': 11, 'Cote de Blaye': 12, 'Escargots de Bourgogne': 13, 'Filo Mix': 14, 'Flotemysost': 15, 'Geitost': 16, 'Genen Shouyu': 17, 'Gnocchi di nonna Alice': 18, 'Gorgonzola Telino': 19, "Grandma's Boysenberry Spread": 20, 'Gravad lax': 21, 'Guarana Fantastica': 22, 'Gudbrandsdalsost': 23, 'Gula Malacca': 24, 'Gumbar Gummibarchen': 25, "Gustaf's Knackebrod": 26, 'Ikura': 27, 'Inlagd Sill': 28, 'Ipoh Coffee': 29, "Jack's New England Clam Chowder": 30, 'Konbu': 31, 'Lakkalikoori': 32, 'Laughing Lumberjack Lager': 33, 'Longlife Tofu': 34, 'Louisiana Fiery Hot Pepper Sauce': 35, 'Louisiana Hot Spiced Okra': 36, 'Manjimup Dried Apples': 37, 'Mascarpone Fabioli': 38, 'Maxilaku': 39, 'Mishi Kobe Niku': 40, 'Mozzarella di Giovanni': 41, 'Nord-Ost Matjeshering': 42, 'Northwoods Cranberry Sauce': 43, 'NuNuCa Nu-Nougat-Creme': 44, 'Original Frankfurter grune Soe': 45, 'Outback Lager': 46, 'Pate chinois': 47, 'Pavlova': 48, 'Perth Pasties': 49, 'Queso Cabrales': 50, 'Queso Manchego La Pastora': 51, 'Raclette Courdavault': 52, 'Ravioli Angelo': 53, 'Rhonbrau Klosterbier': 54, 'Rod Kaviar': 55, 'Rogede sild': 56, 'Rossle Sauerkraut': 57, 'Sasquatch Ale': 58, 'Schoggi Schokolade': 59, 'Scottish Longbreads': 60, 'Singaporean Hokkien Fried Mee': 61, "Sir Rodney's Marmalade": 62, "Sir Rodney's Scones": 63, "Sirop d'erable": 64, 'Spegesild': 65, 'Steeleye Stout': 66, 'Tarte au sucre': 67, 'Teatime Chocolate Biscuits': 68, 'Thuringer Rostbratwurst': 69, 'Tofu': 70, 'Tourtiere': 71, 'Tunnbrod': 72, "Uncle Bob's Organic Dried Pears": 73, 'Valkoinen suklaa': 74, 'Vegie-spread': 75, 'Wimmers gute Semmelknodel': 76, 'Zaanse koeken': 77}
+    dates = _OrderDates()
+    orders = _OrderDetailColumns()
+    add_customer, add_product, add_date, add_quantity = orders.CustomerID.append, orders.ProductID.append, orders.DateKey.append, orders.QuantityOrdered.append
+    with open_data_file(data_filename) as f:
+        next(f) # skip header line
+        for line in f:
+            fields = line.strip().split('\t')
+            CustomerName, OrderDate, ProductName, QuantityOrdered = fields[0], fields[10].split(';'), fields[5].split(';'), fields[9].split(';')
+            customer_id = Customer_to_id[CustomerName]
+            for i, ProdName in enumerate(ProductName):
+                add_customer(customer_id)
+                add_product(Product_to_id[ProdName])
+                add_date(dates[OrderDate[i]][1])
+                add_quantity(int(QuantityOrdered[i]))
+            if len(orders.CustomerID) >= EXTERNAL_SORT_ROWS:
+                orders.spill()
+
+    close_conn = conn is None
+    if close_conn:
+        conn = create_connection(normalized_database_filename)
+
+    # Create customer table
+    create_orderdetail_table(conn)
+
+    # Insert data into customer table
+    insert_sql = ORDERDETAIL_INSERT_SQL
+    conn.executemany(insert_sql, orders.rows(dates))
+    create_date_dim(conn, dates.date_keys())
+    _record_watermark(conn, data_filename)
+
+    conn.commit()
+    if close_conn:
+        conn.close()
+
+
+### Streaming OrderDetail load
+# step11 keeps every order line in a list and sorts it before inserting, so its
+# memory grows with the input. The functions below read the file through a
+# generator and insert fixed-size batches, so memory stays flat.
+
+def iter_orderdetail_rows(data_filename, Customer_to_id, Product_to_id, dates=None):
+    # dates collects the distinct order dates seen, see _OrderDates.
+    if dates is None:
+        dates = _OrderDates()
+    with open_data_file(data_filename) as f:
+        next(f) # skip header line
+        for line in f:
+            fields = line.strip().split('\t')
+            CustomerName, OrderDate, ProductName, QuantityOrdered = fields[0], fields[10].split(';'), fields[5].split(';'), fields[9].split(';')
+            customer_id = Customer_to_id[CustomerName]
+            for i, ProdName in enumerate(ProductName):
+                iso_date, date_key = dates[OrderDate[i]]
+                yield (customer_id, Product_to_id[ProdName], iso_date, int(QuantityOrdered[i]), date_key)
+
+
+def insert_in_batches(conn, insert_sql, rows, batch_size=10000, sort_key=None):
+    # Insert rows from any iterable batch_size rows at a time. With sort_key each
+    # batch is sorted before it is written. Returns the number of rows inserted.
+    rows = iter(rows)
+    count = 0
+    while True:
+        batch = list(itertools.islice(rows, batch_size))
+        if not batch:
+            break
+        if sort_key is not None:
+            batch.sort(key=sort_key)
+        conn.executemany(insert_sql, batch)
+        count += len(batch)
+    return count
+
+
+@instrumented
+def step11_stream_orderdetail_table(data_filename, normalized_database_filename, batch_size=10000, cluster='index', bulk_load=False, conn=None):
+    # cluster chooses how rows for one customer are kept together:
+    #   'index' -- insert in file order, then index OrderDetail(CustomerID, OrderDate)
+    #   'batch' -- sort each batch by CustomerID before inserting it
+    #   None    -- file order only
+    if cluster not in ('index', 'batch', None):
+        raise ValueError("cluster must be 'index', 'batch' or None")
+
+    Customer_to_id = step6_create_customer_to_customerid_dictionary(normalized_database_filename, conn)
+    Product_to_id = step10_create_product_to_productid_dictionary(normalized_database_filename, conn)
+
+    close_conn = conn is None
+    if close_conn:
+        conn = create_connection(normalized_database_filename)
+    try:
+        with bulk_loading(conn) if bulk_load else contextlib.nullcontext():
+            create_orderdetail_table(conn)
+
+            insert_sql = ORDERDETAIL_INSERT_SQL
+            dates = _OrderDates()
+            rows = iter_orderdetail_rows(data_filename, Customer_to_id, Product_to_id, dates)
+            sort_key = (lambda x: x[0]) if cluster == 'batch' else None
+            count = insert_in_batches(conn, insert_sql, rows, batch_size, sort_key)
+
+            if cluster == 'index':
+                conn.execute(INDEX_SQL['idx_orderdetail_customer_date'])
+            create_date_dim(conn, dates.date_keys())
+            _record_watermark(conn, data_filename)
+        conn.commit()
+    finally:
+        if close_conn:
+            conn.close()
+
+    return count
+
+
+### Single-pass ETL
+# step1 .. step11 each rescan data_filename and reload the dictionaries from the
+# database in between. build_normalized_database() reads the file once, keeps the
+# dimensions in memory and writes every table from that one pass. The IDs and rows
+# are the same as the ones produced by running the step functions in order.
+
+def _new_parse_state():
+    return {
+        'regions': set(),
+        'country_region': {},   # Country -> Region of its first line (step3)
+        'customers': [],        # one row per line, in file order (step5)
+        'categories': {},       # ProductCategory -> ProductCategoryDescription (step7)
+        'products': {},         # (ProductName, ProductUnitPrice, ProductCategory) -> None, in first-line order (step9)
+        'orders': [],           # (line number, ProductName, OrderDate, QuantityOrdered) (step11)
+    }
+
+
+def _parse_data_line(state, line):
+    fields = line.strip().split('\t')
+    line_no = len(state['customers'])
+
+    name = fields[0].split(' ')
+    firstname, lastname = name[0], ' '.join(name[1:])
+    address, city, country, region = fields[1], fields[2], fields[3], fields[4]
+    state['regions'].add(region)
+    if country not in state['country_region']:
+        state['country_region'][country] = region
+    state['customers'].append((firstname, lastname, address, city, country))
+
+    ProductName, ProductCategoryList, ProductCategoryDescriptionList = fields[5].split(';'), fields[6].split(';'), fields[7].split(';')
+    ProductUnitPrice, QuantityOrdered, OrderDate = fields[8].split(';'), fields[9].split(';'), fields[10].split(';')
+    state['categories'].update(zip(ProductCategoryList, ProductCategoryDescriptionList))
+    for i, ProdName in enumerate(ProductName):
+        state['products'][ProdName.strip(), float(ProductUnitPrice[i]), ProductCategoryList[i].strip()] = None
+        # Interned so repeated names and dates share one object in memory and
+        # are pickled once per shard by the parallel parser.
+        state['orders'].append((line_no, sys.intern(ProdName), sys.intern(OrderDate[i]), sys.intern(QuantityOrdered[i])))
+
+
+def _assign_dimension_ids(state):
+    # Number every dimension exactly like the step functions do: sort, insert,
+    # and read the name -> ID dictionary back (the last duplicate name wins).
+    # Customers and order lines are left to the caller.
+    regions = sorted(state['regions'])
+    region_to_id = {region: i + 1 for i, region in enumerate(regions)}
+
+    countries = sorted(state['country_region'].items(), key=lambda x: x[0])
+    country_rows = [(country, region_to_id[region]) for country, region in countries]
+    country_to_id = {country: i + 1 for i, (country, _) in enumerate(country_rows)}
+
+    category_rows = sorted(state['categories'].items(), key=lambda x: x[0])
+    ProductCategory_to_id = {category: i + 1 for i, (category, _) in enumerate(category_rows)}
+
+    # A stable sort of the products in first-line order, so one name with two
+    # prices comes out like step9's external_sort()
+    products = sorted(state['products'], key=lambda x: x[0])
+    product_rows = [(name, price, ProductCategory_to_id[category]) for name, price, category in products]
+    Product_to_id = {row[0]: i + 1 for i, row in enumerate(product_rows)}
+
+    tables = {
+        'region': [(region,) for region in regions],
+        'country': country_rows,
+        'productcategory': category_rows,
+        'product': product_rows,
+    }
+    return tables, country_to_id, Product_to_id
+
+
+def _assign_ids(state):
+    tables, country_to_id, Product_to_id = _assign_dimension_ids(state)
+
+    customers = sorted(range(len(state['customers'])), key=lambda i: state['customers'][i][0])
+    customer_rows = []
+    customer_to_id = {}
+    for i in customers:
+        firstname, lastname, address, city, country = state['customers'][i]
+        customer_rows.append((firstname, lastname, address, city, country_to_id[country]))
+        customer_to_id[firstname + ' ' + lastname] = len(customer_rows)
+    line_customer_id = [customer_to_id[c[0] + ' ' + c[1]] for c in state['customers']]
+
+    dates = _OrderDates()
+    orders = _OrderDetailColumns()
+    add_customer, add_product, add_date, add_quantity = orders.CustomerID.append, orders.ProductID.append, orders.DateKey.append, orders.QuantityOrdered.append
+    for line_no, ProdName, OrderDate, QuantityOrdered in state['orders']:
+        add_customer(line_customer_id[line_no])
+        add_product(Product_to_id[ProdName])
+        add_date(dates[OrderDate][1])
+        add_quantity(int(QuantityOrdered))
+        if len(orders.CustomerID) >= EXTERNAL_SORT_ROWS:
+            orders.spill()
+
+    tables['customer'] = customer_rows
+    tables['OrderDetail'] = orders.rows(dates)
+    tables['date_keys'] = dates.date_keys()
+    return tables
+
+
+def _create_normalized_tables(conn, orderdetail=True):
+    create_table(conn, REGION_TABLE_SQL)
+    create_table(conn, COUNTRY_TABLE_SQL)
+    create_table(conn, CUSTOMER_TABLE_SQL)
+    create_table(conn, PRODUCTCATEGORY_TABLE_SQL)
+    create_table(conn, PRODUCT_TABLE_SQL)
+    if orderdetail:
+        create_orderdetail_table(conn)
+
+
+def _write_normalized_tables(conn, tables):
+    _create_normalized_tables(conn)
+
+    conn.executemany("INSERT INTO region (Region) VALUES (?)", tables['region'])
+    conn.executemany("INSERT INTO country (Country, RegionID) VALUES (?, ?)", tables['country'])
+    conn.executemany("INSERT INTO customer (FirstName, LastName, Address, City, CountryID) VALUES (?, ?, ?, ?, ?)", tables['customer'])
+    conn.executemany("INSERT INTO productcategory (ProductCategory, ProductCategoryDescription) VALUES (?, ?)", tables['productcategory'])
+    conn.executemany("INSERT INTO product (ProductName, ProductUnitPrice, ProductCategoryID) VALUES (?, ?, ?)", tables['product'])
+    insert_in_batches(conn, ORDERDETAIL_INSERT_SQL, tables['OrderDetail'])
+    create_date_dim(conn, tables['date_keys'])
+
+
+def _shard_offsets(data_filename, shards):
+    # Split the file after its header line into at most `shards` byte ranges
+    # that each start at the beginning of a line.
+    with open(data_filename, 'rb') as f:
+        f.readline()
+        start = f.tell()
+        size = os.fstat(f.fileno()).st_size
+        bounds = [start]
+        for k in range(1, shards):
+            f.seek(start + (size - start) * k // shards - 1)
+            f.readline() # finish the line the cut falls in
+            if bounds[-1] < f.tell() < size:
+                bounds.append(f.tell())
+        bounds.append(size)
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def _parse_shard(args):
+    data_filename, start, end = args
+    encoding = locale.getpreferredencoding(False)
+    state = _new_parse_state()
+    with open(data_filename, 'rb') as f:
+        f.seek(start)
+        pos = start
+        while pos < end:
+            line = f.readline()
+            if not line:
+                break
+            pos += len(line)
+            _parse_data_line(state, line.decode(encoding))
+    return state
+
+
+def _merge_parse_states(states):
+    # Combine per-shard states in file order, so first/last occurrence rules and
+    # stable sorts behave as if the file had been read in one go.
+    merged = _new_parse_state()
+    for state in states:
+        offset = len(merged['customers'])
+        merged['regions'].update(state['regions'])
+        for country, region in state['country_region'].items():
+            merged['country_region'].setdefault(country, region)
+        merged['customers'].extend(state['customers'])
+        merged['categories'].update(state['categories'])
+        merged['products'].update(state['products'])
+        merged['orders'].extend((line_no + offset, ProdName, OrderDate, QuantityOrdered)
+                                for line_no, ProdName, OrderDate, QuantityOrdered in state['orders'])
+    return merged
+
+
+@instrumented
+def build_normalized_database(data_filename, normalized_database_filename, workers=None, indexes=True, bulk_load=False, summary_tables=False):
+    # With workers > 1 the file is split into newline-aligned byte ranges that are
+    # parsed in a process pool; this process merges them and does all the writing.
+    if workers is not None and workers > 1 and data_file_compression(data_filename) is None:
+        shards = [(data_filename, start, end) for start, end in _shard_offsets(data_filename, workers)]
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+            state = _merge_parse_states(pool.map(_parse_shard, shards))
+        record_metric('lines_parsed', len(state['customers']))
+    else:
+        state = _new_parse_state()
+        with open_data_file(data_filename) as f:
+            next(f) # skip header line
+            for line in f:
+                _parse_data_line(state, line)
+    tables = _assign_ids(state)
+
+    conn = create_connection(normalized_database_filename)
+    try:
+        with bulk_loading(conn) if bulk_load else contextlib.nullcontext():
+            _write_normalized_tables(conn, tables)
+            _record_watermark(conn, data_filename)
+            if summary_tables:
+                create_summary_tables(conn)
+            if indexes:
+                create_indexes(conn)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+### Summary tables
+# customer_total, country_total and region_total hold sum(ProductUnitPrice *
+# QuantityOrdered) and the number of order lines per group. Triggers on
+# OrderDetail keep them current on insert, update and delete, so ex3..ex7 can
+# read one row per group instead of joining every order line (summary=True).
+# Changing a product's price or a customer's country is not tracked; call
+# refresh_summary_tables() after such edits.
+#
+# customer_order_gap holds each customer's first and last OrderDate and the
+# longest gap between two consecutive order dates (with the dates on either
+# side), which is what ex11 reports (summary=True). A new line only extends
+# the gap when it falls after the last or before the first date, so lines can
+# arrive in any order; the customer's rows are re-read through
+# idx_orderdetail_customer_date only when a line lands inside the longest gap
+# or when lines are deleted or moved.
+
+SUMMARY_TABLE_SQL = [
+    """
+    CREATE TABLE IF NOT EXISTS customer_total (
+        CustomerID INTEGER PRIMARY KEY,
+        Total REAL NOT NULL,
+        OrderLines INTEGER NOT NULL
+    );
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS country_total (
+        CountryID INTEGER PRIMARY KEY,
+        Total REAL NOT NULL,
+        OrderLines INTEGER NOT NULL
+    );
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS region_total (
+        RegionID INTEGER PRIMARY KEY,
+        Total REAL NOT NULL,
+        OrderLines INTEGER NOT NULL
+    );
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS customer_order_gap (
+        CustomerID INTEGER PRIMARY KEY,
+        FirstOrderDate TEXT NOT NULL,
+        LastOrderDate TEXT NOT NULL,
+        OrderDate TEXT NOT NULL,
+        PreviousOrderDate TEXT,
+        MaxDaysWithoutOrder REAL
+    );
+    """,
+]
+
+# Adds (sign = '+') or removes (sign = '-') the line in NEW/OLD from each total.
+_SUMMARY_UPDATE_SQL = """
+        INSERT INTO customer_total (CustomerID, Total, OrderLines)
+            SELECT {row}.CustomerID, {sign}p.ProductUnitPrice * {row}.QuantityOrdered, {sign}1
+            FROM product p WHERE p.ProductID = {row}.ProductID
+            ON CONFLICT (CustomerID) DO UPDATE SET Total = Total + excluded.Total, OrderLines = OrderLines + excluded.OrderLines;
+        INSERT INTO country_total (CountryID, Total, OrderLines)
+            SELECT c.CountryID, {sign}p.ProductUnitPrice * {row}.QuantityOrdered, {sign}1
+            FROM product p, customer c WHERE p.ProductID = {row}.ProductID AND c.CustomerID = {row}.CustomerID
+            ON CONFLICT (CountryID) DO UPDATE SET Total = Total + excluded.Total, OrderLines = OrderLines + excluded.OrderLines;
+        INSERT INTO region_total (RegionID, Total, OrderLines)
+            SELECT co.RegionID, {sign}p.ProductUnitPrice * {row}.QuantityOrdered, {sign}1
+            FROM product p, customer c, country co WHERE p.ProductID = {row}.ProductID AND c.CustomerID = {row}.CustomerID AND co.CountryID = c.CountryID
+            ON CONFLICT (RegionID) DO UPDATE SET Total = Total + excluded.Total, OrderLines = OrderLines + excluded.OrderLines;
+"""
+
+# The customer_order_gap rows of the customers in {orderdetail} matching
+# {where}, computed like ex11: ties go to the earliest gap, and a customer with
+# a single order date keeps its first line with a NULL gap.
+_ORDER_GAP_SELECT_SQL = """
+        SELECT CustomerID, FirstOrderDate, LastOrderDate, OrderDate, PreviousOrderDate, DaysSinceLastOrder
+        FROM (
+            SELECT *,
+                min(OrderDate) OVER (PARTITION BY CustomerID) AS FirstOrderDate,
+                max(OrderDate) OVER (PARTITION BY CustomerID) AS LastOrderDate,
+                row_number() OVER (PARTITION BY CustomerID ORDER BY DaysSinceLastOrder DESC NULLS LAST, OrderDate) AS GapRank
+            FROM (
+                SELECT CustomerID, OrderDate,
+                    LAG(OrderDate, 1) OVER (PARTITION BY CustomerID ORDER BY OrderDate) AS PreviousOrderDate,
+                    JULIANDAY(OrderDate) - JULIANDAY(LAG(OrderDate, 1) OVER (PARTITION BY CustomerID ORDER BY OrderDate)) AS DaysSinceLastOrder
+                FROM {orderdetail}
+                {where}
+            )
+        )
+        WHERE GapRank = 1
+"""
+
+# Re-reads the customer of {row} (NEW or OLD) from OrderDetail.
+_ORDER_GAP_RECOMPUTE_SQL = """
+        DELETE FROM customer_order_gap WHERE CustomerID = {row}.CustomerID;
+        INSERT INTO customer_order_gap (CustomerID, FirstOrderDate, LastOrderDate, OrderDate, PreviousOrderDate, MaxDaysWithoutOrder)
+""" + _ORDER_GAP_SELECT_SQL.format(orderdetail="OrderDetail", where="WHERE CustomerID = {row}.CustomerID") + """;
+"""
+
+# Folds the OrderDate of NEW into its customer's row. A date inside the
+# current longest gap splits it, so that customer is re-read; any other date
+# inside [FirstOrderDate, LastOrderDate] cannot make a gap longer.
+_ORDER_GAP_INSERT_SQL = """
+        INSERT OR REPLACE INTO customer_order_gap (CustomerID, FirstOrderDate, LastOrderDate, OrderDate, PreviousOrderDate, MaxDaysWithoutOrder)
+""" + _ORDER_GAP_SELECT_SQL.format(orderdetail="OrderDetail", where="WHERE CustomerID = NEW.CustomerID AND EXISTS (SELECT 1 FROM customer_order_gap g WHERE g.CustomerID = NEW.CustomerID AND NEW.OrderDate > g.PreviousOrderDate AND NEW.OrderDate < g.OrderDate)") + """;
+        UPDATE customer_order_gap
+            SET OrderDate = NEW.OrderDate, PreviousOrderDate = LastOrderDate,
+                MaxDaysWithoutOrder = JULIANDAY(NEW.OrderDate) - JULIANDAY(LastOrderDate)
+            WHERE CustomerID = NEW.CustomerID AND NEW.OrderDate > LastOrderDate
+            AND (MaxDaysWithoutOrder IS NULL OR JULIANDAY(NEW.OrderDate) - JULIANDAY(LastOrderDate) > MaxDaysWithoutOrder);
+        UPDATE customer_order_gap
+            SET OrderDate = FirstOrderDate, PreviousOrderDate = NEW.OrderDate,
+                MaxDaysWithoutOrder = JULIANDAY(FirstOrderDate) - JULIANDAY(NEW.OrderDate)
+            WHERE CustomerID = NEW.CustomerID AND NEW.OrderDate < FirstOrderDate
+            AND (MaxDaysWithoutOrder IS NULL OR JULIANDAY(FirstOrderDate) - JULIANDAY(NEW.OrderDate) >= MaxDaysWithoutOrder);
+        UPDATE customer_order_gap
+            SET OrderDate = NEW.OrderDate, PreviousOrderDate = NEW.OrderDate, MaxDaysWithoutOrder = 0.0
+            WHERE CustomerID = NEW.CustomerID AND MaxDaysWithoutOrder IS NULL
+            AND NEW.OrderDate = FirstOrderDate AND NEW.OrderDate = LastOrderDate;
+        INSERT INTO customer_order_gap (CustomerID, FirstOrderDate, LastOrderDate, OrderDate, PreviousOrderDate, MaxDaysWithoutOrder)
+            VALUES (NEW.CustomerID, NEW.OrderDate, NEW.OrderDate, NEW.OrderDate, NULL, NULL)
+            ON CONFLICT (CustomerID) DO UPDATE SET
+                FirstOrderDate = min(FirstOrderDate, excluded.FirstOrderDate),
+                LastOrderDate = max(LastOrderDate, excluded.LastOrderDate);
+"""
+
+SUMMARY_TRIGGER_SQL = [
+    "CREATE TRIGGER IF NOT EXISTS trg_orderdetail_insert_totals AFTER INSERT ON OrderDetail BEGIN"
+    + _SUMMARY_UPDATE_SQL.format(row='NEW', sign='') + "END;",
+    "CREATE TRIGGER IF NOT EXISTS trg_orderdetail_delete_totals AFTER DELETE ON OrderDetail BEGIN"
+    + _SUMMARY_UPDATE_SQL.format(row='OLD', sign='-') + "END;",
+    "CREATE TRIGGER IF NOT EXISTS trg_orderdetail_update_totals AFTER UPDATE ON OrderDetail BEGIN"
+    + _SUMMARY_UPDATE_SQL.format(row='OLD', sign='-') + _SUMMARY_UPDATE_SQL.format(row='NEW', sign='') + "END;",
+    "CREATE TRIGGER IF NOT EXISTS trg_orderdetail_insert_gap AFTER INSERT ON OrderDetail BEGIN"
+    + _ORDER_GAP_INSERT_SQL + "END;",
+    "CREATE TRIGGER IF NOT EXISTS trg_orderdetail_delete_gap AFTER DELETE ON OrderDetail BEGIN"
+    + _ORDER_GAP_RECOMPUTE_SQL.format(row='OLD') + "END;",
+    "CREATE TRIGGER IF NOT EXISTS trg_orderdetail_update_gap AFTER UPDATE OF CustomerID, OrderDate ON OrderDetail BEGIN"
+    + _ORDER_GAP_RECOMPUTE_SQL.format(row='OLD') + _ORDER_GAP_RECOMPUTE_SQL.format(row='NEW') + "END;",
+]
+
+
+def refresh_summary_tables(conn):
+    # Recompute every total from OrderDetail.
+    conn.execute("DELETE FROM customer_total")
+    conn.execute("DELETE FROM country_total")
+    conn.execute("DELETE FROM region_total")
+    conn.execute("DELETE FROM customer_order_gap")
+    conn.execute("""
+        INSERT INTO customer_total (CustomerID, Total, OrderLines)
+        SELECT od.CustomerID, sum(p.ProductUnitPrice * od.QuantityOrdered), count(*)
+        FROM OrderDetail od JOIN product p ON od.ProductID = p.ProductID
+        GROUP BY od.CustomerID
+    """)
+    conn.execute("""
+        INSERT INTO country_total (CountryID, Total, OrderLines)
+        SELECT c.CountryID, sum(p.ProductUnitPrice * od.QuantityOrdered), count(*)
+        FROM OrderDetail od JOIN product p ON od.ProductID = p.ProductID
+        JOIN customer c ON od.CustomerID = c.CustomerID
+        GROUP BY c.CountryID
+    """)
+    conn.execute("""
+        INSERT INTO region_total (RegionID, Total, OrderLines)
+        SELECT co.RegionID, sum(p.ProductUnitPrice * od.QuantityOrdered), count(*)
+        FROM OrderDetail od JOIN product p ON od.ProductID = p.ProductID
+        JOIN customer c ON od.CustomerID = c.CustomerID
+        JOIN country co ON c.CountryID = co.CountryID
+        GROUP BY co.RegionID
+    """)
+    conn.execute("INSERT INTO customer_order_gap (CustomerID, FirstOrderDate, LastOrderDate, OrderDate, PreviousOrderDate, MaxDaysWithoutOrder)"
+                 + _ORDER_GAP_SELECT_SQL.format(orderdetail="OrderDetail", where=""))
+
+
+@instrumented
+def create_summary_tables(conn):
+    for table_sql in SUMMARY_TABLE_SQL:
+        create_table(conn, table_sql)
+    refresh_summary_tables(conn)
+    for trigger_sql in SUMMARY_TRIGGER_SQL:
+        conn.execute(trigger_sql)
+
+
+def lookup_customer_id(conn, CustomerName):
+    # Same answer as step6_create_customer_to_customerid_dictionary(...)[CustomerName],
+    # i.e. the last CustomerID stored under that name, from one indexed SELECT on conn.
+    name = CustomerName.split(' ')
+    select_sql = "SELECT max(CustomerID) FROM customer WHERE FirstName = ? AND LastName = ?"
+    customer_id = conn.execute(select_sql, (name[0], ' '.join(name[1:]))).fetchone()[0]
+    if customer_id is None:
+        raise KeyError(CustomerName)
+    return customer_id
+
+
+### Incremental ingest
+# ingest_delta() adds a new or grown data file to an existing database. Dimension
+# rows are only inserted when their natural key (Region, Country, customer name,
+# ProductCategory, ProductName) is not there yet; existing rows are left as they
+# are. For OrderDetail the byte offset up to which each file has been loaded is
+# stored in ingest_watermark, so only lines after it are appended. New IDs are
+# appended after the existing ones instead of following the name order of a
+# full build. build_normalized_database() and step11 record the watermark of the
+# file they load in the same transaction as its OrderDetail rows, so a later
+# ingest_delta() of that file only appends lines added after the build.
+# On a partitioned database the lines are appended with insert_partitioned_rows(),
+# which commits them before the watermark moves.
+
+WATERMARK_TABLE_SQL = """
+    CREATE TABLE IF NOT EXISTS ingest_watermark (
+        FileName TEXT PRIMARY KEY,
+        ByteOffset INTEGER NOT NULL,
+        TailHash TEXT NOT NULL
+    );
+"""
+
+
+def _tail_hash(f, offset):
+    # Hash of the 4 KB before offset, used to tell whether a file seen before
+    # has only grown since (same hash) or was replaced (different hash).
+    start = max(0, offset - 4096)
+    f.seek(start)
+    return hashlib.sha1(f.read(offset - start)).hexdigest()
+
+
+def _record_watermark(conn, data_filename):
+    # Mark data_filename as loaded up to its current end.
+    create_table(conn, WATERMARK_TABLE_SQL)
+    with _open_binary(data_filename) as f:
+        if data_file_compression(data_filename) is None:
+            offset = os.fstat(f.fileno()).st_size
+        else:
+            offset = 0
+            for block in iter(lambda: f.read(2**20), b''):
+                offset += len(block)
+        tail_hash = _tail_hash(f, offset)
+    conn.execute("INSERT OR REPLACE INTO ingest_watermark (FileName, ByteOffset, TailHash) VALUES (?, ?, ?)",
+                 (os.path.abspath(data_filename), offset, tail_hash))
+
+
+def _insert_missing(conn, insert_sql, keys, rows):
+    # rows maps natural key -> INSERT parameters; returns key -> new ID.
+    new_ids = {}
+    for key in sorted(rows):
+        if key not in keys:
+            new_ids[key] = conn.execute(insert_sql, rows[key]).lastrowid
+    return new_ids
+
+
+@instrumented
+def ingest_delta(data_filename, normalized_database_filename, conn=None):
+    close_conn = conn is None
+    if close_conn:
+        conn = create_connection(normalized_database_filename)
+    # On a partitioned database the OrderDetail rows go to the partition files.
+    partitioned = _partition_catalog(conn) is not None
+    _create_normalized_tables(conn, orderdetail=not partitioned)
+    create_table(conn, WATERMARK_TABLE_SQL)
+
+    file_key = os.path.abspath(data_filename)
+    watermark = conn.execute("SELECT ByteOffset, TailHash FROM ingest_watermark WHERE FileName = ?", (file_key,)).fetchone()
+    encoding = locale.getpreferredencoding(False)
+    state = _new_parse_state()
+    with _open_binary(data_filename) as f:
+        f.readline() # skip header line
+        offset = f.tell()
+        if watermark is not None and watermark[0] >= offset and _tail_hash(f, watermark[0]) == watermark[1]:
+            offset = watermark[0]
+        f.seek(offset)
+        for line in f:
+            _parse_data_line(state, line.decode(encoding))
+            offset += len(line)
+        tail_hash = _tail_hash(f, offset)
+    record_metric('lines_parsed', len(state['customers']))
+
+    region_to_id = step2_create_region_to_regionid_dictionary(normalized_database_filename, conn)
+    region_to_id.update(_insert_missing(conn, "INSERT INTO region (Region) VALUES (?)", region_to_id,
+                                        {region: (region,) for region in state['regions']}))
+
+    country_to_id = step4_create_country_to_countryid_dictionary(normalized_database_filename, conn)
+    country_to_id.update(_insert_missing(conn, "INSERT INTO country (Country, RegionID) VALUES (?, ?)", country_to_id,
+                                         {country: (country, region_to_id[region]) for country, region in state['country_region'].items()}))
+
+    # The customer table is the one that grows, so look up only the names in
+    # this delta through the index instead of loading the whole map.
+    customer_rows = {}
+    for firstname, lastname, address, city, country in state['customers']:
+        customer_rows.setdefault(firstname + ' ' + lastname, (firstname, lastname, address, city, country_to_id[country]))
+    Customer_to_id = {}
+    for name in customer_rows:
+        try:
+            Customer_to_id[name] = lookup_customer_id(conn, name)
+        except KeyError:
+            pass
+    Customer_to_id.update(_insert_missing(conn, "INSERT INTO customer (FirstName, LastName, Address, City, CountryID) VALUES (?, ?, ?, ?, ?)",
+                                          Customer_to_id, customer_rows))
+
+    ProductCategory_to_id = step8_create_productcategory_to_productcategoryid_dictionary(normalized_database_filename, conn)
+    ProductCategory_to_id.update(_insert_missing(conn, "INSERT INTO productcategory (ProductCategory, ProductCategoryDescription) VALUES (?, ?)",
+                                                 ProductCategory_to_id, {category: (category, description) for category, description in state['categories'].items()}))
+
+    Product_to_id = step10_create_product_to_productid_dictionary(normalized_database_filename, conn)
+    Product_to_id.update(_insert_missing(conn, "INSERT INTO product (ProductName, ProductUnitPrice, ProductCategoryID) VALUES (?, ?, ?)",
+                                         Product_to_id, {name: (name, price, ProductCategory_to_id[category]) for name, price, category in sorted(state['products'])}))
+
+    line_customer_id = [Customer_to_id[c[0] + ' ' + c[1]] for c in state['customers']]
+    dates = _OrderDates()
+    rows = ((line_customer_id[line_no], Product_to_id[ProdName], dates[OrderDate][0], int(QuantityOrdered), dates[OrderDate][1])
+            for line_no, ProdName, OrderDate, QuantityOrdered in state['orders'])
+    if partitioned:
+        count = insert_partitioned_rows(conn, rows)
+    else:
+        count = insert_in_batches(conn, ORDERDETAIL_INSERT_SQL, rows)
+        create_date_dim(conn, dates.date_keys())
+
+    conn.execute("INSERT OR REPLACE INTO ingest_watermark (FileName, ByteOffset, TailHash) VALUES (?, ?, ?)", (file_key, offset, tail_hash))
+    conn.commit()
+    if close_conn:
+        conn.close()
+
+    return count
+
+
+### Partitioned OrderDetail
+# partition_orderdetail() moves OrderDetail out of the main database into one
+# SQLite file per year (or quarter) next to it, e.g. normalized_OrderDetail_2012.db,
+# and lists them in orderdetail_partition. Each file holds a plain OrderDetail
+# table with the OrderDetail indexes, so an old year can be loaded, vacuumed
+# or archived on its own. use_partitions(conn, first_date, last_date) attaches
+# only the files that overlap the date range and points a TEMP VIEW OrderDetail
+# at them (UNION ALL, cut to the range), so the ex queries run unchanged on
+# just those partitions:
+#
+#   use_partitions(conn, '2012-01-01', '2012-03-31')
+#   pd.read_sql_query(ex8(conn), conn)
+#
+# New rows go in with insert_partitioned_rows() or ingest_delta().
+#
+# main.OrderDetail is gone after partitioning, so every connection has to call
+# use_partitions() before running ex queries; WalmartDB and QueryService do
+# that when they connect. Its summary triggers go with it: insert_partitioned_rows()
+# updates the summary tables itself when create_summary_tables() was run, and
+# after any other change to a partition file call refresh_summary_tables()
+# with use_partitions() in place.
+#
+# SQLite attaches at most 10 databases unless it was compiled with a higher
+# limit. When a date range spans more partitions than can still be attached,
+# use_partitions() copies their rows into a TEMP TABLE OrderDetail instead,
+# attaching them one at a time; call it again to see later inserts.
+# ex1_between() raises OperationalError in that case.
+
+PARTITION_TABLE_SQL = """
+    CREATE TABLE IF NOT EXISTS orderdetail_partition (
+        Partition TEXT PRIMARY KEY,
+        FileName TEXT NOT NULL,
+        FirstDateKey INTEGER NOT NULL,
+        LastDateKey INTEGER NOT NULL,
+        LastOrderID INTEGER NOT NULL
+    );
+"""
+
+ORDERDETAIL_COLUMNS = "OrderID, CustomerID, ProductID, OrderDate, QuantityOrdered, DateKey"
+
+# _SUMMARY_UPDATE_SQL for all of temp.inserted_orderdetail at once.
+_PARTITION_SUMMARY_SQL = [
+    """
+    INSERT INTO customer_total (CustomerID, Total, OrderLines)
+        SELECT n.CustomerID, sum(p.ProductUnitPrice * n.QuantityOrdered), count(*)
+        FROM temp.inserted_orderdetail n JOIN product p ON p.ProductID = n.ProductID
+        GROUP BY n.CustomerID
+        ON CONFLICT (CustomerID) DO UPDATE SET Total = Total + excluded.Total, OrderLines = OrderLines + excluded.OrderLines
+    """,
+    """
+    INSERT INTO country_total (CountryID, Total, OrderLines)
+        SELECT c.CountryID, sum(p.ProductUnitPrice * n.QuantityOrdered), count(*)
+        FROM temp.inserted_orderdetail n JOIN product p ON p.ProductID = n.ProductID JOIN customer c ON c.CustomerID = n.CustomerID
+        GROUP BY c.CountryID
+        ON CONFLICT (CountryID) DO UPDATE SET Total = Total + excluded.Total, OrderLines = OrderLines + excluded.OrderLines
+    """,
+    """
+    INSERT INTO region_total (RegionID, Total, OrderLines)
+        SELECT co.RegionID, sum(p.ProductUnitPrice * n.QuantityOrdered), count(*)
+        FROM temp.inserted_orderdetail n JOIN product p ON p.ProductID = n.ProductID JOIN customer c ON c.CustomerID = n.CustomerID
+        JOIN country co ON co.CountryID = c.CountryID
+        GROUP BY co.RegionID
+        ON CONFLICT (RegionID) DO UPDATE SET Total = Total + excluded.Total, OrderLines = OrderLines + excluded.OrderLines
+    """,
+]
+
+
+def _date_key(value):
+    # DateKey of a datetime.date, 'YYYY-MM-DD', 'YYYYMMDD' or a DateKey.
+    if isinstance(value, datetime.date):
+        return value.year * 10000 + value.month * 100 + value.day
+    return int(str(value).replace('-', ''))
+
+
+def _partition_of(date_key, period):
+    # (Partition, FirstDateKey, LastDateKey) of the partition holding date_key.
+    year = date_key // 10000
+    if period == 'year':
+        return str(year), year * 10000 + 101, year * 10000 + 1231
+    if period == 'quarter':
+        quarter = (date_key // 100 % 100 - 1) // 3
+        return '%dQ%d' % (year, quarter + 1), year * 10000 + quarter * 300 + 101, year * 10000 + quarter * 300 + 331
+    raise ValueError("period must be 'year' or 'quarter'")
+
+
+def _partition_catalog(conn):
+    # Partition -> (FileName, FirstDateKey, LastDateKey, LastOrderID), or None
+    # when OrderDetail is not partitioned.
+    if conn.execute("SELECT 1 FROM main.sqlite_master WHERE name = 'orderdetail_partition'").fetchone() is None:
+        return None
+    select_sql = "SELECT Partition, FileName, FirstDateKey, LastDateKey, LastOrderID FROM orderdetail_partition ORDER BY FirstDateKey"
+    return {row[0]: row[1:] for row in conn.execute(select_sql)}
+
+
+def _attach_partition(conn, partition, file_name, create=False):
+    schema = 'orderdetail_' + partition
+    if schema not in [row[1] for row in conn.execute("PRAGMA database_list")]:
+        main_file = conn.execute("PRAGMA database_list").fetchone()[2]
+        conn.execute("ATTACH DATABASE ? AS %s" % schema, (os.path.join(os.path.dirname(main_file), file_name),))
+    if create:
+        conn.execute(ORDERDETAIL_TABLE_SQL.replace("OrderDetail", schema + ".OrderDetail", 1))
+        for name, index_sql in INDEX_SQL.items():
+            if " ON OrderDetail " in index_sql:
+                conn.execute(index_sql.replace(" " + name, " %s.%s" % (schema, name), 1))
+    return schema
+
+
+def _attach_slots(conn):
+    # How many more databases conn can attach.
+    limit = conn.getlimit(sqlite3.SQLITE_LIMIT_ATTACHED) if hasattr(conn, 'getlimit') else 10
+    return limit - sum(1 for row in conn.execute("PRAGMA database_list") if row[1] not in ('main', 'temp'))
+
+
+def _attached_partitions(conn):
+    return set(row[1][len('orderdetail_'):] for row in conn.execute("PRAGMA database_list") if row[1].startswith('orderdetail_'))
+
+
+def _partitions_in_range(catalog, first_key=None, last_key=None):
+    return [partition for partition, (file_name, first, last, last_order_id) in catalog.items()
+            if not ((first_key is not None and last < first_key) or (last_key is not None and first > last_key))]
+
+
+def _partition_selects(conn, catalog, first_key=None, last_key=None):
+    # One SELECT per partition overlapping [first_key, last_key], attaching
+    # them as needed; partitions that are only partly in range are filtered.
+    partitions = _partitions_in_range(catalog, first_key, last_key)
+    missing = len(set(partitions) - _attached_partitions(conn))
+    if missing > _attach_slots(conn):
+        raise sqlite3.OperationalError("%d partition(s) in the date range are not attached, but only %d more databases can be attached"
+                                       % (missing, _attach_slots(conn)))
+    selects = []
+    for partition in partitions:
+        file_name, first, last, last_order_id = catalog[partition]
+        schema = _attach_partition(conn, partition, file_name)
+        select_sql = "SELECT %s FROM %s.OrderDetail" % (ORDERDETAIL_COLUMNS, schema)
+        conditions = []
+        if first_key is not None and first < first_key:
+            conditions.append("DateKey >= %d" % first_key)
+        if last_key is not None and last > last_key:
+            conditions.append("DateKey <= %d" % last_key)
+        if conditions:
+            select_sql += " WHERE " + " AND ".join(conditions)
+        selects.append(select_sql)
+    if not selects:
+        selects.append("SELECT NULL AS OrderID, NULL AS CustomerID, NULL AS ProductID, NULL AS OrderDate, NULL AS QuantityOrdered, NULL AS DateKey WHERE 0")
+    return selects
+
+
+@instrumented
+def partition_orderdetail(normalized_database_filename, period='year', conn=None):
+    close_conn = conn is None
+    if close_conn:
+        conn = create_connection(normalized_database_filename)
+    conn.commit()
+    create_table(conn, PARTITION_TABLE_SQL)
+    base = os.path.splitext(os.path.basename(conn.execute("PRAGMA database_list").fetchone()[2]))[0]
+
+    date_keys = [row[0] for row in conn.execute("SELECT DISTINCT DateKey FROM main.OrderDetail")]
+    for partition, first_key, last_key in sorted(set(_partition_of(date_key, period) for date_key in date_keys)):
+        file_name = '%s_OrderDetail_%s.db' % (base, partition)
+        schema = _attach_partition(conn, partition, file_name, create=True)
+        conn.execute("INSERT INTO %s.OrderDetail (%s) SELECT %s FROM main.OrderDetail WHERE DateKey BETWEEN ? AND ? ORDER BY OrderID"
+                     % (schema, ORDERDETAIL_COLUMNS, ORDERDETAIL_COLUMNS), (first_key, last_key))
+        last_order_id = conn.execute("SELECT max(OrderID) FROM %s.OrderDetail" % schema).fetchone()[0]
+        conn.execute("INSERT OR REPLACE INTO orderdetail_partition (Partition, FileName, FirstDateKey, LastDateKey, LastOrderID) VALUES (?, ?, ?, ?, ?)",
+                     (partition, file_name, first_key, last_key, last_order_id))
+        conn.commit()
+        conn.execute("ANALYZE %s" % schema)
+        conn.execute("DETACH DATABASE %s" % schema)
+
+    conn.execute("DROP TABLE main.OrderDetail")
+    conn.commit()
+    if close_conn:
+        conn.close()
+
+
+def _copy_partitions(conn, catalog, table, first_key=None, last_key=None, where=None):
+    # INSERT the rows of every partition in range (and matching the SQL
+    # condition where) into the TEMP table, attaching the partitions that are
+    # not attached yet one at a time and detaching them again.
+    attached = _attached_partitions(conn)
+    for partition in _partitions_in_range(catalog, first_key, last_key):
+        for select_sql in _partition_selects(conn, {partition: catalog[partition]}, first_key, last_key):
+            if where is not None:
+                select_sql += (" AND " if " WHERE " in select_sql else " WHERE ") + where
+            conn.execute("INSERT INTO temp.%s (%s) %s" % (table, ORDERDETAIL_COLUMNS, select_sql))
+        conn.commit()
+        if partition not in attached:
+            conn.execute("DETACH DATABASE orderdetail_%s" % partition)
+
+
+def _drop_temp_orderdetail(conn):
+    row = conn.execute("SELECT type FROM sqlite_temp_master WHERE name = 'OrderDetail'").fetchone()
+    if row is not None:
+        conn.execute("DROP %s temp.OrderDetail" % row[0].upper())
+
+
+def use_partitions(conn, first_date=None, last_date=None):
+    # (Re)create the TEMP VIEW OrderDetail over the partitions between
+    # first_date and last_date (both included, None for open-ended) and detach
+    # the others, or fill a TEMP TABLE OrderDetail with their rows when there
+    # are more than can be attached. Returns the partitions used.
+    catalog = _partition_catalog(conn)
+    if catalog is None:
+        raise ValueError("OrderDetail is not partitioned, see partition_orderdetail()")
+    first_key = None if first_date is None else _date_key(first_date)
+    last_key = None if last_date is None else _date_key(last_date)
+
+    _drop_temp_orderdetail(conn)
+    used = _partitions_in_range(catalog, first_key, last_key)
+    for partition in _attached_partitions(conn):
+        if partition not in used:
+            conn.execute("DETACH DATABASE orderdetail_%s" % partition)
+    if len(set(used) - _attached_partitions(conn)) <= _attach_slots(conn):
+        selects = _partition_selects(conn, catalog, first_key, last_key)
+        conn.execute("CREATE TEMP VIEW OrderDetail AS " + " UNION ALL ".join(selects))
+        return used
+
+    for partition in _attached_partitions(conn):
+        conn.execute("DETACH DATABASE orderdetail_%s" % partition)
+    conn.execute(ORDERDETAIL_TABLE_SQL.replace("OrderDetail", "temp.OrderDetail", 1))
+    _copy_partitions(conn, catalog, 'OrderDetail', first_key, last_key)
+    for name, index_sql in INDEX_SQL.items():
+        if " ON OrderDetail " in index_sql:
+            conn.execute(index_sql.replace(" " + name, " temp." + name, 1))
+    conn.commit()
+    return used
+
+
+def _use_partitions_if_partitioned(conn):
+    # For connections opened on a database that may have been partitioned.
+    if _partition_catalog(conn) is not None:
+        use_partitions(conn)
+
+
+def _update_partitioned_summaries(conn, catalog, rows):
+    # What the summary triggers on main.OrderDetail did for rows: add them to
+    # the totals and recompute the order gaps of their customers.
+    conn.execute("CREATE TEMP TABLE inserted_orderdetail (CustomerID INTEGER, ProductID INTEGER, QuantityOrdered INTEGER)")
+    conn.executemany("INSERT INTO temp.inserted_orderdetail (CustomerID, ProductID, QuantityOrdered) VALUES (?, ?, ?)",
+                     [(row[1], row[2], row[4]) for row in rows])
+    conn.commit()
+    conn.execute(ORDERDETAIL_TABLE_SQL.replace("OrderDetail", "temp.customer_orderdetail", 1))
+    _copy_partitions(conn, catalog, 'customer_orderdetail', where="CustomerID IN (SELECT CustomerID FROM temp.inserted_orderdetail)")
+    for group_sql in _PARTITION_SUMMARY_SQL:
+        conn.execute(group_sql)
+    conn.execute("DELETE FROM customer_order_gap WHERE CustomerID IN (SELECT CustomerID FROM temp.inserted_orderdetail)")
+    conn.execute("INSERT INTO customer_order_gap (CustomerID, FirstOrderDate, LastOrderDate, OrderDate, PreviousOrderDate, MaxDaysWithoutOrder)"
+                 + _ORDER_GAP_SELECT_SQL.format(orderdetail="temp.customer_orderdetail", where=""))
+    conn.execute("DROP TABLE temp.inserted_orderdetail")
+    conn.execute("DROP TABLE temp.customer_orderdetail")
+
+
+@instrumented
+def insert_partitioned_rows(conn, rows, period=None):
+    # Append ORDERDETAIL_INSERT_SQL rows to the partition of their DateKey,
+    # creating partition files as needed. OrderIDs continue after the highest
+    # one in any partition. period defaults to that of the existing partitions.
+    # Commits once per batch of partitions that can be attached together, then
+    # updates the summary tables if there are any; call use_partitions() again
+    # to see new partitions in the view.
+    conn.commit()
+    create_table(conn, PARTITION_TABLE_SQL)
+    catalog = _partition_catalog(conn)
+    if period is None:
+        period = 'quarter' if any('Q' in partition for partition in catalog) else 'year'
+    base = os.path.splitext(os.path.basename(conn.execute("PRAGMA database_list").fetchone()[2]))[0]
+
+    next_order_id = max((entry[3] for entry in catalog.values()), default=0) + 1
+    by_partition = {}
+    for row in rows:
+        by_partition.setdefault(_partition_of(row[4], period), []).append((next_order_id,) + tuple(row))
+        next_order_id += 1
+
+    attached = _attached_partitions(conn)
+    pending = sorted(by_partition)
+    count = 0
+    while pending:
+        # ATTACH is not allowed inside a transaction, so attach a batch first:
+        # the partitions attached already and as many others as fit
+        batch = [key for key in pending if key[0] in attached]
+        batch += [key for key in pending if key[0] not in attached][:_attach_slots(conn)]
+        if not batch:
+            raise sqlite3.OperationalError("no more databases can be attached to write partition %s" % pending[0][0])
+        pending = [key for key in pending if key not in batch]
+        schemas = {}
+        for partition, first_key, last_key in batch:
+            file_name = catalog[partition][0] if partition in catalog else '%s_OrderDetail_%s.db' % (base, partition)
+            schemas[partition] = (_attach_partition(conn, partition, file_name, create=True), file_name)
+        for partition, first_key, last_key in batch:
+            schema, file_name = schemas[partition]
+            partition_rows = by_partition[(partition, first_key, last_key)]
+            conn.executemany("INSERT INTO %s.OrderDetail (%s) VALUES (?, ?, ?, ?, ?, ?)" % (schema, ORDERDETAIL_COLUMNS), partition_rows)
+            conn.execute("INSERT OR REPLACE INTO orderdetail_partition (Partition, FileName, FirstDateKey, LastDateKey, LastOrderID) VALUES (?, ?, ?, ?, ?)",
+                         (partition, file_name, first_key, last_key, partition_rows[-1][0]))
+            count += len(partition_rows)
+        conn.commit()
+        for partition, first_key, last_key in batch:
+            if partition not in attached:
+                conn.execute("DETACH DATABASE %s" % schemas[partition][0])
+    create_date_dim(conn, set(row[5] for partition_rows in by_partition.values() for row in partition_rows))
+    if conn.execute("SELECT 1 FROM main.sqlite_master WHERE name = 'customer_order_gap'").fetchone() is not None:
+        _update_partitioned_summaries(conn, _partition_catalog(conn), [row for partition_rows in by_partition.values() for row in partition_rows])
+    conn.commit()
+    return count
+
+
+@instrumented
+def ex1_between(conn, CustomerName, first_date, last_date, chunksize=None):
+    # ex1 restricted to orders from first_date to last_date (both included).
+    # On a partitioned database only the partitions in that range are read.
+    customer_id = lookup_customer_id(conn, CustomerName)
+    first_key, last_key = _date_key(first_date), _date_key(last_date)
+    catalog = _partition_catalog(conn)
+    if catalog is None:
+        orderdetail = "OrderDetail"
+    else:
+        orderdetail = "(%s)" % " UNION ALL ".join(_partition_selects(conn, catalog, first_key, last_key))
+
+    sql_statement = """
+    select 
+        c.FirstName ||' '|| c.LastName as Name,
+        p.ProductName as ProductName,
+        od.OrderDate as OrderDate,
+        p.ProductUnitPrice as ProductUnitPrice,
+        od.QuantityOrdered as QuantityOrdered,
+        round(p.ProductUnitPrice * od.QuantityOrdered,2) as Total
+    from {} od 
+    join customer c on od.CustomerID = c.CustomerID
+    join product p on od.ProductID = p.ProductID
+    where od.CustomerID={} and od.DateKey between {} and {}
+    """.format(orderdetail, customer_id, first_key, last_key)
+    if chunksize is not None: # stream the rows, see iter_query()
+        return iter_query(conn, sql_statement, chunksize)
+    df = pd.read_sql_query(sql_statement, conn)
+    return sql_statement
+
+
+def _ex1_sql(conn, CustomerName):
+    
+    # Simply, you are fetching all the rows for a given CustomerName. 
+    # Write an SQL statement that SELECTs From the OrderDetail table and joins with the Customer and Product table.
+    # Pull out the following columns. 
+    # Name -- concatenation of FirstName and LastName
+    # ProductName
+    # OrderDate
+    # ProductUnitPrice
+    # QuantityOrdered
+    # Total -- which is calculated from multiplying ProductUnitPrice with QuantityOrdered -- round to two decimal places
+    # HINT: USE customer_to_customerid_dict to map customer name to customer id and then use where clause with CustomerID
+    
+    ### BEGIN SOLUTION
+    customer_id = lookup_customer_id(conn, CustomerName)
+
+    sql_statement = """
+    select 
+        c.FirstName ||' '|| c.LastName as Name,
+        p.ProductName as ProductName,
+        od.OrderDate as OrderDate,
+        p.ProductUnitPrice as ProductUnitPrice,
+        od.QuantityOrdered as QuantityOrdered,
+        round(p.ProductUnitPrice * od.QuantityOrdered,2) as Total
+    from OrderDetail od 
+    join customer c on od.CustomerID = c.CustomerID
+    join product p on od.ProductID = p.ProductID
+    where od.CustomerID={}
+    """.format(customer_id)
+    ### END SOLUTION
+    return sql_statement
+
+
+@instrumented
+def ex1(conn, CustomerName, chunksize=None):
+    sql_statement = _ex1_sql(conn, CustomerName)
+    if chunksize is not None: # stream the rows, see iter_query()
+        return iter_query(conn, sql_statement, chunksize)
+    df = pd.read_sql_query(sql_statement, conn)
+    return sql_statement
+
+def _ex2_sql(conn, CustomerName):
+    
+    # Simply, you are summing the total for a given CustomerName. 
+    # Write an SQL statement that SELECTs From the OrderDetail table and joins with the Customer and Product table.
+    # Pull out the following columns. 
+    # Name -- concatenation of FirstName and LastName
+    # Total -- which is calculated from multiplying ProductUnitPrice with QuantityOrdered -- sum first and then round to two decimal places
+    # HINT: USE customer_to_customerid_dict to map customer name to customer id and then use where clause with CustomerID
+    
+    ### BEGIN SOLUTION
+    customer_id = lookup_customer_id(conn, CustomerName)
+    sql_statement = """
+
+    SELECT 
+        FirstName || ' ' || LastName AS Name, 
+        round(sum(ProductUnitPrice * QuantityOrdered), 2) as Total
+    from OrderDetail od 
+    join customer c on od.CustomerID = c.CustomerID
+    join product p on od.ProductID = p.ProductID
+    where od.CustomerID={}
+    """.format(customer_id)
+    return sql_statement
+
+
+@instrumented
+def ex2(conn, CustomerName, chunksize=None):
+    sql_statement = _ex2_sql(conn, CustomerName)
+    if chunksize is not None: # stream the rows, see iter_query()
+        return iter_query(conn, sql_statement, chunksize)
+    df = pd.read_sql_query(sql_statement, conn)
+    return sql_statement
+
+### Batched customer queries
+# ex1_many/ex2_many answer ex1/ex2 for a whole list of customers with a fixed
+# number of statements. The names and IDs are bound as one JSON array and
+# matched with IN (SELECT ... FROM json_each(?)), so the SQL text never changes
+# and SQLite reuses the prepared statement, and each table is read once (or
+# through its index) however many customers are asked for. Nothing is written,
+# so no transaction is opened on conn.
+
+def lookup_customer_ids(conn, names):
+    # {name: CustomerID} for every name, the same IDs as lookup_customer_id(),
+    # from one SELECT. Raises KeyError for the first name that is not stored.
+    names = list(dict.fromkeys(names))
+    pairs = {}
+    for CustomerName in names:
+        name = CustomerName.split(' ')
+        pairs[CustomerName] = (name[0], ' '.join(name[1:]))
+    select_sql = """
+    SELECT FirstName, LastName, max(CustomerID) FROM customer
+    WHERE (FirstName, LastName) IN (SELECT json_extract(value, '$[0]'), json_extract(value, '$[1]') FROM json_each(?))
+    GROUP BY FirstName, LastName
+    """
+    found = {(FirstName, LastName): customer_id
+             for FirstName, LastName, customer_id in conn.execute(select_sql, (json.dumps(list(pairs.values())),))}
+    for CustomerName in names:
+        if pairs[CustomerName] not in found:
+            raise KeyError(CustomerName)
+    return {CustomerName: found[pairs[CustomerName]] for CustomerName in names}
+
+
+def _in_customer_order(df, customer_ids):
+    # Stable sort of the rows by the position of their customer in the request.
+    position = {customer_id: i for i, customer_id in enumerate(customer_ids.values())}
+    order = np.argsort(df['CustomerID'].map(position).to_numpy(), kind='stable')
+    return df.iloc[order].drop(columns='CustomerID').reset_index(drop=True)
+
+
+@instrumented
+def ex1_many(conn, names):
+    # ex1 for every name in names as one DataFrame, the customers in the order
+    # of names (duplicates are answered once).
+    customer_ids = lookup_customer_ids(conn, names)
+    sql_statement = """
+    select 
+        od.CustomerID as CustomerID,
+        c.FirstName ||' '|| c.LastName as Name,
+        p.ProductName as ProductName,
+        od.OrderDate as OrderDate,
+        p.ProductUnitPrice as ProductUnitPrice,
+        od.QuantityOrdered as QuantityOrdered,
+        round(p.ProductUnitPrice * od.QuantityOrdered,2) as Total
+    from OrderDetail od 
+    join customer c on od.CustomerID = c.CustomerID
+    join product p on od.ProductID = p.ProductID
+    where od.CustomerID in (select value from json_each(?))
+    """
+    df = pd.read_sql_query(sql_statement, conn, params=(json.dumps(list(customer_ids.values())),))
+    return _in_customer_order(df, customer_ids)
+
+
+@instrumented
+def ex2_many(conn, names):
+    # ex2 for every name in names: one (Name, Total) row per customer, in the
+    # order of names.
+    customer_ids = lookup_customer_ids(conn, names)
+    sql_statement = """
+    SELECT 
+        od.CustomerID as CustomerID,
+        FirstName || ' ' || LastName AS Name, 
+        round(sum(ProductUnitPrice * QuantityOrdered), 2) as Total
+    from OrderDetail od 
+    join customer c on od.CustomerID = c.CustomerID
+    join product p on od.ProductID = p.ProductID
+    where od.CustomerID in (select value from json_each(?))
+    group by od.CustomerID
+    """
+    df = pd.read_sql_query(sql_statement, conn, params=(json.dumps(list(customer_ids.values())),))
+    return _in_customer_order(df, customer_ids)
+
+
+def _ex3_sql(summary=False):
+    
+    # Simply, find the total for all the customers
+    # Write an SQL statement that SELECTs From the OrderDetail table and joins with the Customer and Product table.
+    # Pull out the following columns. 
+    # Name -- concatenation of FirstName and LastName
+    # Total -- which is calculated from multiplying ProductUnitPrice with QuantityOrdered -- sum first and then round to two decimal places
+    # ORDER BY Total Descending 
+    ### BEGIN SOLUTION
+   
+    sql_statement = """
+
+    SELECT 
+        FirstName || ' ' || LastName AS Name, 
+        round(sum(ProductUnitPrice * QuantityOrdered), 2) as Total
+    from OrderDetail od 
+    join customer c on od.CustomerID = c.CustomerID
+    join product p on od.ProductID = p.ProductID
+    group by od.CustomerID
+    order by Total desc
+    """
+
+    if summary: # read the trigger-maintained totals, see create_summary_tables()
+        sql_statement = """
+    SELECT 
+        FirstName || ' ' || LastName AS Name, 
+        round(t.Total, 2) as Total
+    from customer_total t
+    join customer c on t.CustomerID = c.CustomerID
+    where t.OrderLines > 0
+    order by Total desc
+    """
+    return sql_statement
+
+
+@instrumented
+def ex3(conn, summary=False, chunksize=None):
+    sql_statement = _ex3_sql(summary)
+    if chunksize is not None: # stream the rows, see iter_query()
+        return iter_query(conn, sql_statement, chunksize)
+    df = pd.read_sql_query(sql_statement, conn)
+    return sql_statement
+
+def _ex4_sql(summary=False):
+    
+    # Simply, find the total for all the region
+    # Write an SQL statement that SELECTs From the OrderDetail table and joins with the Customer, Product, Country, and 
+    # Region tables.
+    # Pull out the following columns. 
+    # Region
+    # Total -- which is calculated from multiplying ProductUnitPrice with QuantityOrdered -- sum first and then round to two decimal places
+    # ORDER BY Total Descending 
+    ### BEGIN SOLUTION
+
+    sql_statement = """
+    SELECT 
+        r.Region, 
+        round(sum(p.ProductUnitPrice * od.QuantityOrdered), 2) as Total
+    from OrderDetail od 
+    join customer c on od.CustomerID = c.CustomerID
+    join product p on od.ProductID = p.ProductID
+    join country co ON c.CountryID = co.CountryID
+    join region r on co.RegionID=r.RegionID
+    GROUP BY r.Region
+    order by Total desc
+    
+    """
+    ### END SOLUTION
+    if summary: # read the trigger-maintained totals, see create_summary_tables()
+        sql_statement = """
+    SELECT 
+        r.Region, 
+        round(t.Total, 2) as Total
+    from region_total t
+    join region r on t.RegionID = r.RegionID
+    where t.OrderLines > 0
+    order by Total desc
+    """
+    return sql_statement
+
+
+@instrumented
+def ex4(conn, summary=False, chunksize=None):
+    sql_statement = _ex4_sql(summary)
+    if chunksize is not None: # stream the rows, see iter_query()
+        return iter_query(conn, sql_statement, chunksize)
+    df = pd.read_sql_query(sql_statement, conn)
+    return sql_statement
+
+def _ex5_sql(summary=False):
+    
+     # Simply, find the total for all the countries
+    # Write an SQL statement that SELECTs From the OrderDetail table and joins with the Customer, Product, and Country table.
+    # Pull out the following columns. 
+    # Country
+    # CountryTotal -- which is calculated from multiplying ProductUnitPrice with QuantityOrdered -- sum first and then round
+    # ORDER BY Total Descending 
+    ### BEGIN SOLUTION
+
+    sql_statement = """
+    select co.Country, round(sum(p.ProductUnitPrice * od.QuantityOrdered), 0) AS CountryTotal
+    from OrderDetail od
+    join customer c ON od.CustomerID = c.CustomerID
+    join product p ON od.ProductID = p.ProductID
+    join country co ON c.CountryID = co.CountryID
+    group by co.Country
+    order by CountryTotal DESC
+    """
+    if summary: # read the trigger-maintained totals, see create_summary_tables()
+        sql_statement = """
+    select co.Country, round(t.Total, 0) AS CountryTotal
+    from country_total t
+    join country co ON t.CountryID = co.CountryID
+    where t.OrderLines > 0
+    order by CountryTotal DESC
+    """
+    return sql_statement
+
+
+@instrumented
+def ex5(conn, summary=False, chunksize=None):
+    sql_statement = _ex5_sql(summary)
+    if chunksize is not None: # stream the rows, see iter_query()
+        return iter_query(conn, sql_statement, chunksize)
+    df = pd.read_sql_query(sql_statement, conn)
+    return sql_statement
+
+
+def _ex6_sql(summary=False):
+    
+    # Rank the countries within a region based on order total
+    # Output Columns: Region, Country, CountryTotal, CountryRegionalRank
+    # Hint: Round the the total
+    # Hint: Sort ASC by Region
+    ### BEGIN SOLUTION
+
+    sql_statement = """
+    with region_country_total as
+    (
+        select r.Region as Region,
+        co.Country as Country,
+        round(sum(p.ProductUnitPrice * od.QuantityOrdered),0) as CountryTotal
+        from OrderDetail od
+        join Customer c on od.CustomerID=c.CustomerID
+        join Country co on c.CountryID=co.CountryID
+        join Region r on co.RegionID=r.RegionID
+        join Product p on od.ProductID=p.ProductID
+        group by r.Region,co.Country
+    ),
+    ranked_country_total as
+    (
+        select *,
+        dense_rank() over(partition by Region order by CountryTotal desc) as CountryRegionalRank
+        from region_country_total
+    )
+    select Region, Country, CountryTotal, CountryRegionalRank
+    from ranked_country_total
+    order by Region ASC
+
+    """
+
+
+    ### END SOLUTION
+    if summary: # read the trigger-maintained totals, see create_summary_tables()
+        sql_statement = """
+    with region_country_total as
+    (
+        select r.Region as Region,
+        co.Country as Country,
+        round(t.Total,0) as CountryTotal
+        from country_total t
+        join Country co on t.CountryID=co.CountryID
+        join Region r on co.RegionID=r.RegionID
+        where t.OrderLines > 0
+    ),
+    ranked_country_total as
+    (
+        select *,
+        dense_rank() over(partition by Region order by CountryTotal desc) as CountryRegionalRank
+        from region_country_total
+    )
+    select Region, Country, CountryTotal, CountryRegionalRank
+    from ranked_country_total
+    order by Region ASC
+    """
+    return sql_statement
+
+
+@instrumented
+def ex6(conn, summary=False, chunksize=None):
+    sql_statement = _ex6_sql(summary)
+    if chunksize is not None: # stream the rows, see iter_query()
+        return iter_query(conn, sql_statement, chunksize)
+    df = pd.read_sql_query(sql_statement, conn)
+    return sql_statement
+
+
+
+def _ex7_sql(summary=False):
+    
+   # Rank the countries within a region based on order total, BUT only select the TOP country, meaning rank = 1!
+    # Output Columns: Region, Country, CountryTotal, CountryRegionalRank
+    # Hint: Round the the total
+    # Hint: Sort ASC by Region
+    # HINT: Use "WITH"
+    ### BEGIN SOLUTION
+
+    sql_statement = """
+    with region_country_total as
+    (
+        select r.Region as Region,
+        co.Country as Country,
+        round(sum(p.ProductUnitPrice * od.QuantityOrdered),0) as CountryTotal
+        from OrderDetail od
+        join Customer c on od.CustomerID=c.CustomerID
+        join Country co on c.CountryID=co.CountryID
+        join Region r on co.RegionID=r.RegionID
+        join Product p on od.ProductID=p.ProductID
+        group by r.Region,co.Country
+    ),
+    ranked_country_total as
+    (
+        select *,
+        dense_rank() over(partition by Region order by CountryTotal desc) as CountryRegionalRank
+        from region_country_total
+    )
+    select Region, Country, CountryTotal, CountryRegionalRank
+    from ranked_country_total
+    where CountryRegionalRank=1
+    order by Region ASC
+      
+    """
+    ### END SOLUTION
+    if summary: # read the trigger-maintained totals, see create_summary_tables()
+        sql_statement = """
+    with region_country_total as
+    (
+        select r.Region as Region,
+        co.Country as Country,
+        round(t.Total,0) as CountryTotal
+        from country_total t
+        join Country co on t.CountryID=co.CountryID
+        join Region r on co.RegionID=r.RegionID
+        where t.OrderLines > 0
+    ),
+    ranked_country_total as
+    (
+        select *,
+        dense_rank() over(partition by Region order by CountryTotal desc) as CountryRegionalRank
+        from region_country_total
+    )
+    select Region, Country, CountryTotal, CountryRegionalRank
+    from ranked_country_total
+    where CountryRegionalRank=1
+    order by Region ASC
+    """
+    return sql_statement
+
+
+@instrumented
+def ex7(conn, summary=False, chunksize=None):
+    sql_statement = _ex7_sql(summary)
+    if chunksize is not None: # stream the rows, see iter_query()
+        return iter_query(conn, sql_statement, chunksize)
+    df = pd.read_sql_query(sql_statement, conn)
+    return sql_statement
+
+def _ex8_sql(date_dim=False):
+    
+    # Sum customer sales by Quarter and year
+    # Output Columns: Quarter,Year,CustomerID,Total
+    # HINT: Use "WITH"
+    # Hint: Round the the total
+    # HINT: YOU MUST CAST YEAR TO TYPE INTEGER!!!!
+    ### BEGIN SOLUTION
+
+    sql_statement = """
+    With SalesByQuarter AS (
+        select 
+            strftime('%Y', OrderDate) AS Year, 
+            CASE 
+                WHEN strftime('%m', OrderDate) BETWEEN '01' AND '03' THEN 'Q1'
+                WHEN strftime('%m', OrderDate) BETWEEN '04' AND '06' THEN 'Q2'
+                WHEN strftime('%m', OrderDate) BETWEEN '07' AND '09' THEN 'Q3'
+                ELSE 'Q4'
+            END AS Quarter, 
+            CustomerID, 
+            ROUND(SUM(p.ProductUnitPrice * od.QuantityOrdered), 0) AS Total
+        from OrderDetail od
+        join Product p ON od.ProductID = p.ProductID
+        group by Year, Quarter, CustomerID
+    )
+    select Quarter, CAST(Year AS INTEGER) AS Year, CustomerID, Total
+    from SalesByQuarter
+    order by Year, Quarter
+
+       
+    """
+    ### END SOLUTION
+    if date_dim: # integer date keys, see create_date_dim()
+        sql_statement = """
+    With SalesByQuarter AS (
+        select 
+            d.Year AS Year, 
+            d.Quarter AS Quarter, 
+            CustomerID, 
+            ROUND(SUM(p.ProductUnitPrice * od.QuantityOrdered), 0) AS Total
+        from OrderDetail od
+        join Product p ON od.ProductID = p.ProductID
+        join date_dim d ON od.DateKey = d.DateKey
+        group by Year, Quarter, CustomerID
+    )
+    select Quarter, Year, CustomerID, Total
+    from SalesByQuarter
+    order by Year, Quarter
+    """
+    return sql_statement
+
+
+@instrumented
+def ex8(conn, date_dim=False, chunksize=None):
+    sql_statement = _ex8_sql(date_dim)
+    if chunksize is not None: # stream the rows, see iter_query()
+        return iter_query(conn, sql_statement, chunksize)
+    df = pd.read_sql_query(sql_statement, conn)
+    return sql_statement
+
+def _ex9_sql(date_dim=False):
+    
+    # Rank the customer sales by Quarter and year, but only select the top 5 customers!
+    # Output Columns: Quarter, Year, CustomerID, Total
+    # HINT: Use "WITH"
+    # Hint: Round the the total
+    # HINT: YOU MUST CAST YEAR TO TYPE INTEGER!!!!
+    # HINT: You can have multiple CTE tables;
+    # WITH table1 AS (), table2 AS ()
+    ### BEGIN SOLUTION
+
+    sql_statement = """
+    
+    With SalesByQuarter AS (
+        select 
+            strftime('%Y', OrderDate) AS Year, 
+            CASE 
+                WHEN strftime('%m', OrderDate) BETWEEN '01' AND '03' THEN 'Q1'
+                WHEN strftime('%m', OrderDate) BETWEEN '04' AND '06' THEN 'Q2'
+                WHEN strftime('%m', OrderDate) BETWEEN '07' AND '09' THEN 'Q3'
+                ELSE 'Q4'
+            END AS Quarter, 
+            CustomerID, 
+            ROUND(SUM(p.ProductUnitPrice * od.QuantityOrdered), 0) AS Total
+        from OrderDetail od
+        join Product p ON od.ProductID = p.ProductID
+        group by Year, Quarter, CustomerID
+    ),
+    Top5Customers AS (
+        select 
+            Quarter, 
+            CAST(Year AS INTEGER) AS Year, 
+            CustomerID, 
+            Total, 
+            RANK() OVER (PARTITION BY Quarter, Year ORDER BY Total DESC) AS CustomerRank
+        from SalesByQuarter
+    )
+    select Quarter, Year, CustomerID, Total,CustomerRank
+    from Top5Customers
+    where CustomerRank <= 5
+    order by Year, Quarter
+    
+
+    
+    """
+    ### END SOLUTION
+    if date_dim: # integer date keys, see create_date_dim()
+        sql_statement = """
+    With SalesByQuarter AS (
+        select 
+            d.Year AS Year, 
+            d.Quarter AS Quarter, 
+            CustomerID, 
+            ROUND(SUM(p.ProductUnitPrice * od.QuantityOrdered), 0) AS Total
+        from OrderDetail od
+        join Product p ON od.ProductID = p.ProductID
+        join date_dim d ON od.DateKey = d.DateKey
+        group by Year, Quarter, CustomerID
+    ),
+    Top5Customers AS (
+        select 
+            Quarter, 
+            Year, 
+            CustomerID, 
+            Total, 
+            RANK() OVER (PARTITION BY Quarter, Year ORDER BY Total DESC) AS CustomerRank
+        from SalesByQuarter
+    )
+    select Quarter, Year, CustomerID, Total,CustomerRank
+    from Top5Customers
+    where CustomerRank <= 5
+    order by Year, Quarter
+    """
+    return sql_statement
+
+
+@instrumented
+def ex9(conn, date_dim=False, chunksize=None):
+    sql_statement = _ex9_sql(date_dim)
+    if chunksize is not None: # stream the rows, see iter_query()
+        return iter_query(conn, sql_statement, chunksize)
+    df = pd.read_sql_query(sql_statement, conn)
+    return sql_statement
+
+def _ex10_sql(date_dim=False):
+    
+    # Rank the monthly sales
+    # Output Columns: Quarter, Year, CustomerID, Total
+    # HINT: Use "WITH"
+    # Hint: Round the the total
+    ### BEGIN SOLUTION
+
+    sql_statement = """
+    	With SalesByMonth AS (
+			select 
+				CASE 
+					WHEN strftime('%m', OrderDate) = '01' THEN 'January'
+					WHEN strftime('%m', OrderDate) = '02' THEN 'February'
+					WHEN strftime('%m', OrderDate) = '03' THEN 'March'
+					WHEN strftime('%m', OrderDate) = '04' THEN 'April'
+					WHEN strftime('%m', OrderDate) = '05' THEN 'May'
+					WHEN strftime('%m', OrderDate) = '06' THEN 'June'
+					WHEN strftime('%m', OrderDate) = '07' THEN 'July'
+					WHEN strftime('%m', OrderDate) = '08' THEN 'August'
+					WHEN strftime('%m', OrderDate) = '09' THEN 'September'
+					WHEN strftime('%m', OrderDate) = '10' THEN 'October'
+					WHEN strftime('%m', OrderDate) = '11' THEN 'November'
+					WHEN strftime('%m', OrderDate) = '12' THEN 'December'
+				END AS Month, 
+				sum(ROUND((p.ProductUnitPrice * od.QuantityOrdered))) AS Total
+			from OrderDetail od
+			join Product p ON od.ProductID = p.ProductID
+			group by Month
+		),
+		 MonthlySalesRank AS (
+			SELECT 
+				Month, 
+				Total, 
+				RANK() OVER (ORDER BY Total DESC) AS TotalRank
+			FROM SalesByMonth
+		)
+		select Month,Total,TotalRank
+		from MonthlySalesRank
+      
+    """
+    ### END SOLUTION
+    if date_dim: # integer date keys, see create_date_dim()
+        sql_statement = """
+    With SalesByMonth AS (
+        select 
+            d.MonthName AS Month, 
+            sum(ROUND((p.ProductUnitPrice * od.QuantityOrdered))) AS Total
+        from OrderDetail od
+        join Product p ON od.ProductID = p.ProductID
+        join date_dim d ON od.DateKey = d.DateKey
+        group by Month
+    ),
+    MonthlySalesRank AS (
+        SELECT 
+            Month, 
+            Total, 
+            RANK() OVER (ORDER BY Total DESC) AS TotalRank
+        FROM SalesByMonth
+    )
+    select Month,Total,TotalRank
+    from MonthlySalesRank
+    """
+    return sql_statement
+
+
+@instrumented
+def ex10(conn, date_dim=False, chunksize=None):
+    sql_statement = _ex10_sql(date_dim)
+    if chunksize is not None: # stream the rows, see iter_query()
+        return iter_query(conn, sql_statement, chunksize)
+    df = pd.read_sql_query(sql_statement, conn)
+    return sql_statement
+
+def _ex11_sql(date_dim=False, summary=False):
+    
+    # Find the MaxDaysWithoutOrder for each customer 
+    # Output Columns: 
+    # CustomerID,
+    # FirstName,
+    # LastName,
+    # Country,
+    # OrderDate, 
+    # PreviousOrderDate,
+    # MaxDaysWithoutOrder
+    # order by MaxDaysWithoutOrder desc
+    # HINT: Use "WITH"; I created two CTE tables
+    # HINT: Use Lag
+
+    ### BEGIN SOLUTION
+
+    sql_statement = """
+    WITH OrderDates AS (
+        SELECT 
+			CustomerID, 
+            OrderDate, 
+            LAG(OrderDate, 1) OVER (PARTITION BY CustomerID ORDER BY OrderDate) AS PreviousOrderDate,
+            JULIANDAY(OrderDate) - JULIANDAY(LAG(OrderDate, 1) OVER (PARTITION BY CustomerID ORDER BY OrderDate)) AS DaysSinceLastOrder
+        FROM 
+            OrderDetail
+			)
+    
+    SELECT 
+        distinct od.CustomerID, 
+        FirstName, 
+        LastName, 
+        Country, 
+        OrderDate, 
+        PreviousOrderDate, 
+        max(DaysSinceLastOrder) AS MaxDaysWithoutOrder
+    FROM OrderDates od   
+    JOIN Customer ON od.CustomerID = Customer.CustomerID
+	join country on Customer.CountryID =country.CountryID
+	group by od.CustomerID
+	order by MaxDaysWithoutOrder desc
+    
+
+    """
+    ### END SOLUTION
+    if date_dim: # integer date keys, see create_date_dim()
+        sql_statement = """
+    WITH OrderDates AS (
+        SELECT 
+            CustomerID, 
+            od.OrderDate, 
+            LAG(od.OrderDate, 1) OVER (PARTITION BY CustomerID ORDER BY od.OrderDate) AS PreviousOrderDate,
+            1.0 * (d.DayNumber - LAG(d.DayNumber, 1) OVER (PARTITION BY CustomerID ORDER BY od.OrderDate)) AS DaysSinceLastOrder
+        FROM OrderDetail od
+        JOIN date_dim d ON od.DateKey = d.DateKey
+    )
+    SELECT 
+        distinct od.CustomerID, 
+        FirstName, 
+        LastName, 
+        Country, 
+        OrderDate, 
+        PreviousOrderDate, 
+        max(DaysSinceLastOrder) AS MaxDaysWithoutOrder
+    FROM OrderDates od   
+    JOIN Customer ON od.CustomerID = Customer.CustomerID
+    join country on Customer.CountryID =country.CountryID
+    group by od.CustomerID
+    order by MaxDaysWithoutOrder desc
+    """
+    if summary: # read the trigger-maintained gaps, see create_summary_tables()
+        sql_statement = """
+    SELECT 
+        g.CustomerID, 
+        FirstName, 
+        LastName, 
+        Country, 
+        g.OrderDate, 
+        g.PreviousOrderDate, 
+        g.MaxDaysWithoutOrder
+    FROM customer_order_gap g
+    JOIN Customer ON g.CustomerID = Customer.CustomerID
+    join country on Customer.CountryID =country.CountryID
+    order by MaxDaysWithoutOrder desc, g.CustomerID desc
+    """
+    return sql_statement
+
+
+@instrumented
+def ex11(conn, date_dim=False, summary=False, chunksize=None):
+    sql_statement = _ex11_sql(date_dim, summary)
+    if chunksize is not None: # stream the rows, see iter_query()
+        return iter_query(conn, sql_statement, chunksize)
+    df = pd.read_sql_query(sql_statement, conn)
+    return sql_statement
+
+
+def _table_root_pages(conn):
+    # (schema number, root page) -> table name, for the tables of every
+    # attached schema; indexes have root pages too but are left out.
+    root_pages = {}
+    for seq, schema, file_name in conn.execute("PRAGMA database_list").fetchall():
+        for name, root_page in conn.execute("SELECT name, rootpage FROM %s.sqlite_master WHERE type = 'table'" % schema):
+            root_pages[seq, root_page] = name
+    return root_pages
+
+
+def _table_scans(conn, sql_statement, root_pages):
+    # The tables sql_statement reads from end to end, from its bytecode: a
+    # Rewind (or Last) on a cursor opened on a table's b-tree. Query plans name
+    # tables by their aliases, which CTEs can reuse, so they cannot tell a
+    # table scan from a scan of rows the query built itself (CTEs, subqueries
+    # and sorters use ephemeral cursors); cursors on indexes are not counted.
+    cursors = {}
+    scans = []
+    for addr, opcode, p1, p2, p3, p4, p5, comment in conn.execute("EXPLAIN " + sql_statement):
+        if opcode in ('OpenRead', 'OpenWrite'):
+            cursors[p1] = root_pages.get((p3, p2))
+        elif opcode in ('Rewind', 'Last') and cursors.get(p1) is not None:
+            scans.append(cursors[p1])
+    return scans
+
+
+def verify_query_plans(conn, CustomerName=None):
+    # Return {name: [tables]} with the tables the statement of every exN
+    # function scans from end to end instead of reading through an index or
+    # by rowid, including the summary=True and date_dim=True variants when
+    # those tables exist. An empty list means the query is fully indexed.
+    if CustomerName is None:
+        CustomerName = execute_sql_statement("SELECT FirstName ||' '|| LastName FROM customer LIMIT 1", conn)[0][0]
+
+    statements = {'ex1': _ex1_sql(conn, CustomerName), 'ex2': _ex2_sql(conn, CustomerName)}
+    for n in range(3, 12):
+        statements['ex%d' % n] = globals()['_ex%d_sql' % n]()
+    root_pages = _table_root_pages(conn)
+    table_names = set(name.lower() for name in root_pages.values())
+    if 'customer_total' in table_names:
+        for n in range(3, 8):
+            statements['ex%d(summary=True)' % n] = globals()['_ex%d_sql' % n](summary=True)
+        statements['ex11(summary=True)'] = _ex11_sql(summary=True)
+    if 'date_dim' in table_names:
+        for n in range(8, 12):
+            statements['ex%d(date_dim=True)' % n] = globals()['_ex%d_sql' % n](date_dim=True)
+
+    return {name: _table_scans(conn, sql_statement, root_pages) for name, sql_statement in statements.items()}
+
+
+### Streaming results
+# The ex functions run their query into a DataFrame that they then drop. With
+# chunksize they skip that and return iter_query() over their SQL instead, a
+# generator of DataFrames of at most chunksize rows read with fetchmany, so
+# the rows held in Python never exceed one chunk:
+#
+#   for chunk in ex8(conn, chunksize=50000):
+#       ...
+#
+# Under Instrumentation the ex stage covers the reading of the chunks, not
+# just the call. export_ex() writes an ex result to CSV, or to Parquet when
+# pyarrow is installed, one chunk at a time; an empty result still gives a
+# file with the columns. SQLite still buffers what it must sort for an ORDER
+# BY, in its own cache and temp files.
+
+def iter_query(conn, sql_statement, chunksize=10000, params=(), frames=True):
+    # DataFrames like pd.read_sql_query(sql_statement, conn) of up to
+    # chunksize rows each, or the lists of row tuples with frames=False. An
+    # empty result gives one empty DataFrame, which still has the columns.
+    cursor = conn.execute(sql_statement, params)
+    columns = [column[0] for column in cursor.description]
+    dtypes = {}    # column position -> dtype of the first chunk with a value in it
+    chunks = 0
+    try:
+        while True:
+            rows = cursor.fetchmany(chunksize)
+            if not rows:
+                if frames and not chunks:
+                    yield pd.DataFrame.from_records([], columns=columns)
+                break
+            chunks += 1
+            if not frames:
+                yield rows
+                continue
+            chunk = pd.DataFrame.from_records(rows, columns=columns, coerce_float=True)
+            # A column that is all NULL in this chunk would come out as object.
+            # Integer columns cannot hold NULL, so those chunks get float64,
+            # as read_sql_query gives for an integer column with NULLs.
+            for i in range(len(columns)):
+                values = chunk.iloc[:, i]
+                if not values.isna().all():
+                    dtypes.setdefault(i, values.dtype)
+                elif i in dtypes:
+                    chunk.isetitem(i, values.astype('float64' if dtypes[i].kind in 'iu' else dtypes[i]))
+            yield chunk
+    finally:
+        cursor.close()
+
+
+def write_chunks(chunks, path, format=None):
+    # Write DataFrame chunks to one CSV or Parquet file (format None: from the
+    # extension, .parquet or else CSV). Returns the number of rows written.
+    if format is None:
+        format = 'parquet' if path.endswith('.parquet') else 'csv'
+    if format not in ('csv', 'parquet'):
+        raise ValueError("format must be 'csv' or 'parquet'")
+    rows = 0
+    if format == 'csv':
+        with open(path, 'w', newline='') as f:
+            for i, chunk in enumerate(chunks):
+                chunk.to_csv(f, header=i == 0, index=False)
+                rows += len(chunk)
+        return rows
+
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError("writing Parquet needs pyarrow; install it or use format='csv'") from None
+    writer = None
+    try:
+        for frame in _parquet_frames(chunks):
+            if writer is None:
+                schema = pyarrow.Schema.from_pandas(frame, preserve_index=False)
+                writer = pyarrow.parquet.ParquetWriter(path, schema)
+            writer.write_table(pyarrow.Table.from_pandas(frame, schema=schema, preserve_index=False))
+            rows += len(frame)
+    finally:
+        if writer is not None:
+            writer.close()
+    return rows
+
+
+def _parquet_frames(chunks):
+    # The chunks, regrouped and retyped so they all fit the Parquet schema of
+    # the first frame. Chunks are held back until every column has had a
+    # value (or the chunks run out), so no column is typed from NULLs alone,
+    # and an integer column that is float64 in a later chunk because it is all
+    # NULL there (see iter_query()) becomes nullable Int64.
+    dtypes = {}    # column position -> dtype of the first chunk with a value in it
+    pending = []
+    for chunk in chunks:
+        for i in range(chunk.shape[1]):
+            values = chunk.iloc[:, i]
+            if i not in dtypes:
+                if not values.isna().all():
+                    dtypes[i] = values.dtype
+            elif dtypes[i].kind in 'iu' and values.dtype.kind == 'f':
+                chunk = chunk.copy()
+                chunk.isetitem(i, values.astype('Int64'))
+        pending.append(chunk)
+        if len(dtypes) == chunk.shape[1]:
+            yield pending[0] if len(pending) == 1 else pd.concat(pending, ignore_index=True)
+            pending = []
+    if pending:
+        yield pd.concat(pending, ignore_index=True)
+
+
+def export_ex(conn, name, path, *args, chunksize=10000, format=None):
+    # Stream the result of exN (name 'exN') called with args to path.
+    return write_chunks(globals()[name](conn, *args, chunksize=chunksize), path, format)
+
+
+### Columnar analytics
+# export_columnar() writes OrderDetail as one .npy array per column (in OrderID
+# order) plus the lookup arrays needed by the reports, each indexed by ID.
+# load_columnar() memory-maps them back and the columnar_exN functions compute
+# the same DataFrames as pd.read_sql_query(exN(conn), conn) with vectorized
+# NumPy group-bys instead of SQLite joins. Rows that tie in an ORDER BY are
+# listed in the order SQLite gives them on an indexed database (create_indexes).
+
+COLUMNAR_ARRAYS = [
+    'od_customer', 'od_product', 'od_datekey', 'od_quantity',
+    'product_price', 'customer_country', 'customer_firstname', 'customer_lastname',
+    'country_region', 'country_name', 'region_name',
+]
+
+
+def _id_indexed(conn, select_sql, dtype, fill):
+    # Turn "SELECT ID, value" rows into an array where array[ID] == value.
+    rows = conn.execute(select_sql).fetchall()
+    values = np.full(max([row[0] for row in rows], default=0) + 1, fill, dtype=dtype)
+    for row_id, value in rows:
+        values[row_id] = value
+    return values
+
+
+@instrumented
+def export_columnar(conn, directory):
+    os.makedirs(directory, exist_ok=True)
+    create_orderdetail_table(conn)
+    cursor = conn.execute("SELECT CustomerID, ProductID, DateKey, QuantityOrdered FROM OrderDetail ORDER BY OrderID")
+    od = np.fromiter(cursor, dtype=[('customer', 'i8'), ('product', 'i8'), ('datekey', 'i8'), ('quantity', 'i8')])
+    arrays = {
+        'od_customer': od['customer'],
+        'od_product': od['product'],
+        'od_datekey': od['datekey'],
+        'od_quantity': od['quantity'],
+        'product_price': _id_indexed(conn, "SELECT ProductID, ProductUnitPrice FROM product", 'f8', np.nan),
+        'customer_country': _id_indexed(conn, "SELECT CustomerID, CountryID FROM customer", 'i8', 0),
+        'customer_firstname': _id_indexed(conn, "SELECT CustomerID, FirstName FROM customer", object, '').astype(str),
+        'customer_lastname': _id_indexed(conn, "SELECT CustomerID, LastName FROM customer", object, '').astype(str),
+        'country_region': _id_indexed(conn, "SELECT CountryID, RegionID FROM country", 'i8', 0),
+        'country_name': _id_indexed(conn, "SELECT CountryID, Country FROM country", object, '').astype(str),
+        'region_name': _id_indexed(conn, "SELECT RegionID, Region FROM region", object, '').astype(str),
+    }
+    for name, values in arrays.items():
+        np.save(os.path.join(directory, name + '.npy'), values)
+
+
+def load_columnar(directory, mmap_mode='r'):
+    return {name: np.load(os.path.join(directory, name + '.npy'), mmap_mode=mmap_mode) for name in COLUMNAR_ARRAYS}
+
+
+def _sql_round(values, digits=0):
+    # SQLite's round() goes half away from zero; np.round goes half to even.
+    scale = 10.0 ** digits
+    return np.sign(values) * np.floor(np.abs(values) * scale + 0.5) / scale
+
+
+def _group_sum(keys, weights):
+    # Sum weights per distinct key with a sort and np.add.reduceat; returns the
+    # sorted distinct keys and their sums.
+    if len(keys) == 0:
+        return keys[:0], np.zeros(0)
+    order = np.argsort(keys, kind='stable')
+    keys = keys[order]
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    return keys[starts], np.add.reduceat(weights[order], starts)
+
+
+def _rank(partition, values, dense):
+    # RANK()/DENSE_RANK() OVER (PARTITION BY partition ORDER BY values DESC),
+    # for rows already sorted by partition and then values descending.
+    n = len(values)
+    new_partition = np.r_[True, partition[1:] != partition[:-1]] if n else np.zeros(0, bool)
+    new_value = new_partition | np.r_[True, values[1:] != values[:-1]] if n else new_partition
+    partition_start = np.maximum.accumulate(np.where(new_partition, np.arange(n), 0)) if n else np.zeros(0, int)
+    if dense:
+        counter = np.cumsum(new_value)
+        return counter - counter[partition_start] + 1
+    value_start = np.maximum.accumulate(np.where(new_value, np.arange(n), 0)) if n else np.zeros(0, int)
+    return value_start - partition_start + 1
+
+
+def _line_totals(cols):
+    return cols['product_price'][cols['od_product']] * cols['od_quantity']
+
+
+def _country_totals(cols):
+    line_country = cols['customer_country'][cols['od_customer']]
+    country_id, total = _group_sum(line_country, _line_totals(cols))
+    return pd.DataFrame({
+        'RegionID': cols['country_region'][country_id],
+        'Region': cols['region_name'][cols['country_region'][country_id]],
+        'Country': cols['country_name'][country_id],
+        'CountryTotal': _sql_round(total, 0),
+    })
+
+
+def columnar_ex3(cols):
+    customer_id, total = _group_sum(cols['od_customer'], _line_totals(cols))
+    df = pd.DataFrame({
+        'Name': np.char.add(np.char.add(cols['customer_firstname'][customer_id], ' '), cols['customer_lastname'][customer_id]),
+        'Total': _sql_round(total, 2),
+    })
+    return df.sort_values('Total', ascending=False, kind='stable', ignore_index=True)
+
+
+def columnar_ex4(cols):
+    line_region = cols['country_region'][cols['customer_country'][cols['od_customer']]]
+    region_id, total = _group_sum(line_region, _line_totals(cols))
+    df = pd.DataFrame({'Region': cols['region_name'][region_id], 'Total': _sql_round(total, 2)})
+    df = df.sort_values('Region', kind='stable')
+    return df.sort_values('Total', ascending=False, kind='stable', ignore_index=True)
+
+
+def columnar_ex5(cols):
+    df = _country_totals(cols)[['Country', 'CountryTotal']].sort_values('Country', kind='stable')
+    return df.sort_values('CountryTotal', ascending=False, kind='stable', ignore_index=True)
+
+
+def columnar_ex6(cols):
+    df = _country_totals(cols).sort_values(['Region', 'CountryTotal', 'Country'], ascending=[True, False, True],
+                                           kind='stable', ignore_index=True)
+    df['CountryRegionalRank'] = _rank(df['Region'].to_numpy(), df['CountryTotal'].to_numpy(), dense=True)
+    return df[['Region', 'Country', 'CountryTotal', 'CountryRegionalRank']]
+
+
+def columnar_ex7(cols):
+    df = columnar_ex6(cols)
+    return df[df['CountryRegionalRank'] == 1].reset_index(drop=True)
+
+
+def _quarter_customer_totals(cols):
+    datekey = cols['od_datekey']
+    year, quarter = datekey // 10000, (datekey // 100 % 100 - 1) // 3 + 1
+    customers = len(cols['customer_country'])
+    key, total = _group_sum((year * 10 + quarter) * customers + cols['od_customer'], _line_totals(cols))
+    year_quarter, customer_id = key // customers, key % customers
+    return pd.DataFrame({
+        'Quarter': np.char.add('Q', (year_quarter % 10).astype(str)),
+        'Year': year_quarter // 10,
+        'CustomerID': customer_id,
+        'Total': _sql_round(total, 0),
+    })
+
+
+def columnar_ex8(cols):
+    return _quarter_customer_totals(cols)
+
+
+def columnar_ex9(cols):
+    df = _quarter_customer_totals(cols).sort_values(['Year', 'Quarter', 'Total'], ascending=[True, True, False],
+                                                    kind='stable', ignore_index=True)
+    partition = df['Year'].to_numpy() * 10 + df['Quarter'].str[1].astype(int).to_numpy()
+    df['CustomerRank'] = _rank(partition, df['Total'].to_numpy(), dense=False)
+    return df[df['CustomerRank'] <= 5].reset_index(drop=True)
+
+
+def columnar_ex10(cols):
+    month, total = _group_sum(cols['od_datekey'] // 100 % 100, _sql_round(_line_totals(cols), 0))
+    df = pd.DataFrame({'Month': np.array(MONTH_NAMES)[month - 1], 'Total': total})
+    df = df.sort_values('Month', kind='stable').sort_values('Total', ascending=False, kind='stable', ignore_index=True)
+    df['TotalRank'] = _rank(np.zeros(len(df), int), df['Total'].to_numpy(), dense=False)
+    return df
+
+
+def columnar_ex11(cols):
+    customer_id, datekey = cols['od_customer'], cols['od_datekey']
+    order = np.lexsort((datekey, customer_id))
+    customer_id, datekey = customer_id[order], datekey[order]
+    n = len(datekey)
+    days = (((datekey // 10000 - 1970) * 12 + datekey // 100 % 100 - 1).astype('datetime64[M]').astype('datetime64[D]')
+            + (datekey % 100 - 1).astype('timedelta64[D]'))
+
+    # LAG within each customer, then the first row holding each customer's max gap.
+    first = np.r_[True, customer_id[1:] != customer_id[:-1]] if n else np.zeros(0, bool)
+    previous = np.r_[0, np.arange(n - 1)] if n else np.zeros(0, int)
+    gap = np.where(first, np.nan, (days - days[previous]).astype('f8'))
+    starts = np.flatnonzero(first)
+    max_gap = np.fmax.reduceat(gap, starts) if n else np.zeros(0)
+    group = np.cumsum(first) - 1
+    is_max = (gap == max_gap[group]) | (np.isnan(max_gap[group]) & first)
+    best = np.full(len(starts), n, dtype=int)
+    np.minimum.at(best, group[is_max], np.flatnonzero(is_max))
+
+    iso = np.datetime_as_string(days, unit='D')
+    ids = customer_id[starts]
+    df = pd.DataFrame({
+        'CustomerID': ids,
+        'FirstName': cols['customer_firstname'][ids],
+        'LastName': cols['customer_lastname'][ids],
+        'Country': cols['country_name'][cols['customer_country'][ids]],
+        'OrderDate': iso[best],
+        'PreviousOrderDate': np.where(first[best], None, iso[previous[best]]),
+        'MaxDaysWithoutOrder': max_gap,
+    })
+    return df[::-1].sort_values('MaxDaysWithoutOrder', ascending=False, kind='stable', na_position='last', ignore_index=True)
+
+### Streaming leaderboards
+# Leaderboard answers ex7 and ex9 straight from data files, without building
+# the normalized database. It reads each file once, line by line, and keeps
+# running quantities in dicts keyed by (customer, quarter, product). The
+# customer, country and product rules of steps 3-10 are replayed on the fly:
+# a customer gets the CustomerID and country of its last line, a country
+# the region of its first line, and a product the price of its last new
+# (price, category) row. Each group's top K comes from heapq.nlargest and
+# keeps ties the way RANK()/DENSE_RANK() do, so
+#
+#   Leaderboard(data_filename).ex9()
+#
+# equals pd.read_sql_query(ex9(conn), conn) on a database built from that
+# file. Call add_file() again for a new drop and re-read the leaderboards.
+
+def iter_data_lines(data_filename):
+    with open_data_file(data_filename) as f:
+        next(f) # skip header line
+        for line in f:
+            yield line.strip().split('\t')
+
+
+def _rank_threshold(values, k, dense):
+    # Smallest value ranked k or better (RANK, or DENSE_RANK with dense),
+    # None when there are no values.
+    if dense:
+        values = set(values)
+    top = heapq.nlargest(k, values)
+    return top[-1] if top else None
+
+
+def _top_k(items, k, dense):
+    # [(key, value, rank)] of the (key, value) items ranked k or better by
+    # value, descending, ties in key order.
+    items = list(items)
+    threshold = _rank_threshold([value for key, value in items], k, dense)
+    top = sorted(((key, value) for key, value in items if value >= threshold), key=lambda x: (-x[1], x[0]))
+    ranked = []
+    for i, (key, value) in enumerate(top):
+        if i == 0:
+            rank = 1
+        elif value != top[i - 1][1]:
+            rank = ranked[-1][2] + 1 if dense else i + 1
+        ranked.append((key, value, rank))
+    return ranked
+
+
+class Leaderboard:
+    def __init__(self, data_filename=None):
+        self.dates = _OrderDates()
+        self.quantities = collections.defaultdict(int)    # (CustomerName, Year * 10 + Quarter, ProductName) -> quantity
+        self.customer_country = {}                        # CustomerName -> Country of its last line
+        self.customer_line = {}                           # CustomerName -> (FirstName, its last line among that FirstName's)
+        self.first_name_lines = collections.Counter()     # FirstName -> lines
+        self.country_region = {}                          # Country -> Region of its first line
+        self.product_rows = collections.defaultdict(set)  # ProductName -> (price, category) rows seen
+        self.product_price = {}                           # ProductName -> ProductUnitPrice
+        if data_filename is not None:
+            self.add_file(data_filename)
+
+    def add_file(self, data_filename):
+        for fields in iter_data_lines(data_filename):
+            self.add_line(fields)
+
+    def add_line(self, fields):
+        CustomerName, Country, Region = fields[0], fields[3], fields[4]
+        first_name = CustomerName.split(' ')[0]
+        self.customer_line[CustomerName] = (first_name, self.first_name_lines[first_name])
+        self.first_name_lines[first_name] += 1
+        self.customer_country[CustomerName] = Country
+        self.country_region.setdefault(Country, Region)
+
+        ProductName, ProductCategory, ProductUnitPrice = fields[5].split(';'), fields[6].split(';'), fields[8].split(';')
+        OrderDate, QuantityOrdered = fields[10].split(';'), fields[9].split(';')
+        quantities, dates = self.quantities, self.dates
+        for i, ProdName in enumerate(ProductName):
+            product = (float(ProductUnitPrice[i]), ProductCategory[i].strip())
+            rows = self.product_rows[ProdName.strip()]
+            if product not in rows:
+                rows.add(product)
+                self.product_price[ProdName.strip()] = product[0]
+            date_key = dates[OrderDate[i]][1]
+            year_quarter = date_key // 10000 * 10 + (date_key // 100 % 100 - 1) // 3 + 1
+            quantities[CustomerName, year_quarter, ProdName] += int(QuantityOrdered[i])
+
+    def customer_ids(self):
+        # CustomerName -> CustomerID, as step5 and step6 number them
+        first_line = {}
+        lines = 0
+        for first_name in sorted(self.first_name_lines):
+            first_line[first_name] = lines
+            lines += self.first_name_lines[first_name]
+        return {name: first_line[first_name] + line + 1 for name, (first_name, line) in self.customer_line.items()}
+
+    def _totals(self, group):
+        # group(CustomerName, year_quarter) -> SQL-rounded total per group
+        totals = collections.defaultdict(float)
+        product_price = self.product_price
+        for (CustomerName, year_quarter, ProdName), quantity in self.quantities.items():
+            totals[group(CustomerName, year_quarter)] += product_price[ProdName.strip()] * quantity
+        keys = list(totals)
+        return dict(zip(keys, _sql_round(np.array([totals[key] for key in keys]), 0)))
+
+    def ex7(self, k=1):
+        # ex7 with the top k countries of each region (DENSE_RANK <= k)
+        customer_country = self.customer_country
+        by_region = collections.defaultdict(list)
+        for Country, total in self._totals(lambda CustomerName, year_quarter: customer_country[CustomerName]).items():
+            by_region[self.country_region[Country]].append((Country, total))
+        rows = [(Region, Country, total, rank)
+                for Region in sorted(by_region)
+                for Country, total, rank in _top_k(by_region[Region], k, dense=True)]
+        return pd.DataFrame(rows, columns=['Region', 'Country', 'CountryTotal', 'CountryRegionalRank'])
+
+    def ex9(self, k=5):
+        # ex9 with the top k customers of each quarter (RANK <= k)
+        customer_ids = self.customer_ids()
+        by_quarter = collections.defaultdict(list)
+        for (year_quarter, customer_id), total in self._totals(lambda CustomerName, year_quarter: (year_quarter, customer_ids[CustomerName])).items():
+            by_quarter[year_quarter].append((customer_id, total))
+        rows = [('Q%d' % (year_quarter % 10), year_quarter // 10, customer_id, total, rank)
+                for year_quarter in sorted(by_quarter)
+                for customer_id, total, rank in _top_k(by_quarter[year_quarter], k, dense=False)]
+        return pd.DataFrame(rows, columns=['Quarter', 'Year', 'CustomerID', 'Total', 'CustomerRank'])
+
+
+### Dimension cache
+class DimensionCache:
+    # Keeps the name -> ID maps of the five dimension tables in memory, plus an
+    # ID -> name list for reverse lookups. Names are interned so the map and the
+    # list share one string per row. Every map is dropped, and reloaded when it
+    # is next used, as soon as the database changed: PRAGMA data_version moves
+    # on a commit from another connection, total_changes on a write from this
+    # one. That check costs one PRAGMA per id()/name() call; an ids()/names()
+    # call, or all the lookups inside `with cache.batch():`, share one check.
+
+    DIMENSIONS = {
+        'region': "SELECT RegionID, Region FROM region",
+        'country': "SELECT CountryID, Country FROM country",
+        'customer': "SELECT CustomerID, FirstName ||' '|| LastName as Name FROM customer",
+        'productcategory': "SELECT ProductCategoryID, ProductCategory FROM productcategory",
+        'product': "SELECT ProductID, ProductName FROM product",
+    }
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.version = None
+        self.maps = {}    # dimension -> (name -> ID, ID -> name)
+        self._batches = 0
+
+    def _database_version(self):
+        return (self.conn.execute("PRAGMA data_version").fetchone()[0], self.conn.total_changes)
+
+    def _check_version(self):
+        version = self._database_version()
+        if version != self.version:
+            self.version = version
+            self.maps.clear()
+
+    def _load(self, dimension):
+        rows = self.conn.execute(self.DIMENSIONS[dimension]).fetchall()
+        name_to_id = {}
+        id_to_name = [None] * (max((row[0] for row in rows), default=0) + 1)
+        for row_id, name in rows:
+            name = sys.intern(name)
+            name_to_id[name] = row_id
+            id_to_name[row_id] = name
+        self.maps[dimension] = (name_to_id, id_to_name)
+
+    def _maps(self, dimension):
+        if not self._batches:
+            self._check_version()
+        if dimension not in self.maps:
+            self._load(dimension)
+        return self.maps[dimension]
+
+    @contextlib.contextmanager
+    def batch(self):
+        # Lookups in the with block skip the version check, made once here, so
+        # they see the data as it was when the block started.
+        if not self._batches:
+            self._check_version()
+        self._batches += 1
+        try:
+            yield self
+        finally:
+            self._batches -= 1
+
+    def invalidate(self, dimension=None):
+        if dimension is None:
+            self.maps.clear()
+        else:
+            self.maps.pop(dimension, None)
+
+    def to_id(self, dimension):
+        # The cached name -> ID dict; callers must not modify it.
+        return self._maps(dimension)[0]
+
+    def id(self, dimension, name):
+        return self._maps(dimension)[0][name]
+
+    def name(self, dimension, row_id):
+        id_to_name = self._maps(dimension)[1]
+        if not 0 < row_id < len(id_to_name) or id_to_name[row_id] is None:
+            raise KeyError(row_id)
+        return id_to_name[row_id]
+
+    def ids(self, dimension, names):
+        with self.batch():
+            name_to_id = self._maps(dimension)[0]
+            return [name_to_id[name] for name in names]
+
+    def names(self, dimension, row_ids):
+        with self.batch():
+            return [self.name(dimension, row_id) for row_id in row_ids]
+
+
+### Result cache
+# run_ex(conn, 'exN', *args) returns the DataFrame of
+# pd.read_sql_query(exN(conn, *args), conn) with the query run only once:
+# ex1/ex2 go through ex1_many/ex2_many, and ex3 .. ex11 run the SQL built by
+# _exN_sql() for their flags.
+#
+# ResultCache keeps those DataFrames per (query, arguments) for as long as the
+# data has not changed. Like DimensionCache it checks PRAGMA data_version
+# (commits by other connections) and total_changes (writes on this one) before
+# each lookup, and drops every entry on any write. Entries are evicted least
+# recently used first once there are more than max_entries or they hold more
+# than max_bytes. With a directory results are also written there as Parquet
+# files (this needs pyarrow), keyed by the database file's size and mtime (and
+# its -wal file's), so a new process can reuse them; the files are pruned
+# oldest first above max_disk_bytes. Only data is read back from them, so a
+# shared directory cannot run code in the reader the way pickles could.
+
+def run_ex(conn, name, *args):
+    if name in ('ex1', 'ex2'):
+        return globals()[name + '_many'](conn, list(args))
+    if name in ('ex1_many', 'ex2_many'):
+        return globals()[name](conn, *args)
+    return pd.read_sql_query(globals()['_%s_sql' % name](*args), conn)
+
+
+class ResultCache:
+    def __init__(self, conn, max_entries=128, max_bytes=256 * 2**20, directory=None, max_disk_bytes=2**30):
+        self.conn = conn
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.max_disk_bytes = max_disk_bytes
+        self.version = None
+        self.entries = collections.OrderedDict()    # key -> (DataFrame, bytes)
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        if directory is not None:
+            try:
+                import pyarrow
+            except ImportError:
+                raise ImportError("ResultCache(directory=...) stores results as Parquet, which needs pyarrow") from None
+            os.makedirs(directory, exist_ok=True)
+            database_file = conn.execute("PRAGMA database_list").fetchone()[2]
+            self.database_file = os.path.abspath(database_file) if database_file else None
+
+    def _database_version(self):
+        # insert_partitioned_rows() also updates orderdetail_partition, so
+        # main's data_version covers writes to OrderDetail partitions
+        return (self.conn.execute("PRAGMA data_version").fetchone()[0], self.conn.total_changes)
+
+    def _orderdetail_view(self):
+        # The use_partitions() view the ex queries read, if any
+        row = self.conn.execute("SELECT sql FROM sqlite_temp_master WHERE type = 'view' AND name = 'OrderDetail'").fetchone()
+        return row and row[0]
+
+    def _file_version(self):
+        # Committed state of the database file for the disk tier, None when
+        # this connection has uncommitted writes or there is no file.
+        if self.database_file is None or self.conn.in_transaction:
+            return None
+        version = []
+        for filename in (self.database_file, self.database_file + '-wal'):
+            try:
+                stat = os.stat(filename)
+                version.append((stat.st_size, stat.st_mtime_ns))
+            except FileNotFoundError:
+                version.append(None)
+        return tuple(version)
+
+    def _disk_prefix(self, key):
+        return hashlib.sha1(repr((self.database_file, key)).encode()).hexdigest() + '-'
+
+    def _disk_filename(self, key, file_version):
+        # <query hash>-<version hash>.parquet, so a file is only ever read for
+        # the database version it was written for.
+        return os.path.join(self.directory, self._disk_prefix(key) + hashlib.sha1(repr(file_version).encode()).hexdigest() + '.parquet')
+
+    def _read_disk(self, key, file_version):
+        filename = self._disk_filename(key, file_version)
+        try:
+            df = pd.read_parquet(filename)
+        except (OSError, ValueError): # missing, or cut short by a crashed writer
+            return None
+        os.utime(filename)
+        return df
+
+    def _write_disk(self, key, file_version, df):
+        filename = self._disk_filename(key, file_version)
+        prefix = self._disk_prefix(key)
+        for name in os.listdir(self.directory):
+            if name.startswith(prefix): # results for older versions of the database
+                os.remove(os.path.join(self.directory, name))
+        df.to_parquet(filename + '.tmp', index=False)
+        os.replace(filename + '.tmp', filename)
+        files = [os.path.join(self.directory, name) for name in os.listdir(self.directory) if name.endswith('.parquet')]
+        files = sorted((os.stat(name).st_mtime_ns, os.stat(name).st_size, name) for name in files)
+        total = sum(size for mtime, size, name in files)
+        for mtime, size, name in files:
+            if total <= self.max_disk_bytes:
+                break
+            os.remove(name)
+            total -= size
+
+    def _store(self, key, df):
+        size = int(df.memory_usage(deep=True).sum())
+        if size > self.max_bytes:
+            return
+        self.entries[key] = (df, size)
+        self.bytes += size
+        while len(self.entries) > self.max_entries or self.bytes > self.max_bytes:
+            evicted, (evicted_df, evicted_size) = self.entries.popitem(last=False)
+            self.bytes -= evicted_size
+
+    def invalidate(self):
+        self.entries.clear()
+        self.bytes = 0
+
+    def query(self, name, *args):
+        # The cached result of run_ex(self.conn, name, *args); callers must not
+        # modify it.
+        key = (name,) + tuple(tuple(arg) if isinstance(arg, list) else arg for arg in args)
+        view = self._orderdetail_view()
+        if view is not None:
+            key += (view,)
+        version = self._database_version()
+        if version != self.version:
+            self.version = version
+            self.invalidate()
+        cached = self.entries.get(key)
+        if cached is not None:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return cached[0]
+
+        self.misses += 1
+        file_version = self._file_version() if self.directory is not None else None
+        df = self._read_disk(key, file_version) if file_version is not None else None
+        if df is None:
+            df = run_ex(self.conn, name, *args)
+            if file_version is not None:
+                self._write_disk(key, file_version, df)
+        self._store(key, df)
+        return df
+
+
+### Session
+class WalmartDB:
+    # Owns one connection to a normalized database and runs the step and ex
+    # functions on it, so a lookup never reconnects or rereads a whole table.
+    #
+    #   with WalmartDB('normalized.db') as db:
+    #       db.ex1('Alejandra Camino')
+
+    def __init__(self, normalized_database_filename, bulk_load=False):
+        self.normalized_database_filename = normalized_database_filename
+        self.bulk_load = bulk_load
+        self.conn = create_connection(normalized_database_filename)
+        self.bulk_load_settings = start_bulk_load(self.conn) if bulk_load else None
+        _use_partitions_if_partitioned(self.conn)
+        self.dimensions = DimensionCache(self.conn)
+        self.results = ResultCache(self.conn)
+
+    def close(self):
+        if self.conn is not None:
+            try:
+                if self.bulk_load:
+                    finish_bulk_load(self.conn, self.bulk_load_settings)
+                self.conn.commit()
+            finally:
+                self.conn.close()
+                self.conn = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def step1_create_region_table(self, data_filename):
+        step1_create_region_table(data_filename, self.normalized_database_filename, self.conn)
+
+    def step2_create_region_to_regionid_dictionary(self):
+        return dict(self.dimensions.to_id('region'))
+
+    def step3_create_country_table(self, data_filename):
+        step3_create_country_table(data_filename, self.normalized_database_filename, self.conn)
+
+    def step4_create_country_to_countryid_dictionary(self):
+        return dict(self.dimensions.to_id('country'))
+
+    def step5_create_customer_table(self, data_filename):
+        step5_create_customer_table(data_filename, self.normalized_database_filename, self.conn)
+
+    def step6_create_customer_to_customerid_dictionary(self):
+        return dict(self.dimensions.to_id('customer'))
+
+    def step7_create_productcategory_table(self, data_filename):
+        step7_create_productcategory_table(data_filename, self.normalized_database_filename, self.conn)
+
+    def step8_create_productcategory_to_productcategoryid_dictionary(self):
+        return dict(self.dimensions.to_id('productcategory'))
+
+    def step9_create_product_table(self, data_filename):
+        step9_create_product_table(data_filename, self.normalized_database_filename, self.conn)
+
+    def step10_create_product_to_productid_dictionary(self):
+        return dict(self.dimensions.to_id('product'))
+
+    def step11_create_orderdetail_table(self, data_filename):
+        step11_create_orderdetail_table(data_filename, self.normalized_database_filename, self.conn)
+
+    def step11_stream_orderdetail_table(self, data_filename, batch_size=10000, cluster='index'):
+        return step11_stream_orderdetail_table(data_filename, self.normalized_database_filename, batch_size, cluster, conn=self.conn)
+
+    def ingest_delta(self, data_filename):
+        return ingest_delta(data_filename, self.normalized_database_filename, self.conn)
+
+    def customer_id(self, CustomerName):
+        return self.dimensions.id('customer', CustomerName)
+
+    def customer_name(self, CustomerID):
+        return self.dimensions.name('customer', CustomerID)
+
+    def report(self, name, *args):
+        # DataFrame of exN (name 'exN') from self.results
+        return self.results.query(name, *args)
+
+    def iter_report(self, name, *args, chunksize=10000):
+        # DataFrame chunks of exN, not cached
+        return globals()[name](self.conn, *args, chunksize=chunksize)
+
+    def export_report(self, name, path, *args, chunksize=10000, format=None):
+        return export_ex(self.conn, name, path, *args, chunksize=chunksize, format=format)
+
+    def create_summary_tables(self):
+        create_summary_tables(self.conn)
+        self.conn.commit()
+
+    def create_date_dim(self):
+        create_date_dim(self.conn)
+        self.conn.commit()
+
+    def create_indexes(self):
+        create_indexes(self.conn)
+        self.conn.commit()
+
+    def verify_query_plans(self, CustomerName=None):
+        return verify_query_plans(self.conn, CustomerName)
+
+    def partition_orderdetail(self, period='year'):
+        partition_orderdetail(self.normalized_database_filename, period, conn=self.conn)
+        use_partitions(self.conn)
+
+    def use_partitions(self, first_date=None, last_date=None):
+        return use_partitions(self.conn, first_date, last_date)
+
+    def insert_partitioned_rows(self, rows, period=None):
+        return insert_partitioned_rows(self.conn, rows, period)
+
+    def ex1(self, CustomerName):
+        return ex1(self.conn, CustomerName)
+
+    def ex2(self, CustomerName):
+        return ex2(self.conn, CustomerName)
+
+    def ex1_many(self, names):
+        return ex1_many(self.conn, names)
+
+    def ex1_between(self, CustomerName, first_date, last_date):
+        return ex1_between(self.conn, CustomerName, first_date, last_date)
+
+    def ex2_many(self, names):
+        return ex2_many(self.conn, names)
+
+    def ex3(self, summary=False):
+        return ex3(self.conn, summary)
+
+    def ex4(self, summary=False):
+        return ex4(self.conn, summary)
+
+    def ex5(self, summary=False):
+        return ex5(self.conn, summary)
+
+    def ex6(self, summary=False):
+        return ex6(self.conn, summary)
+
+    def ex7(self, summary=False):
+        return ex7(self.conn, summary)
+
+    def ex8(self, date_dim=False):
+        return ex8(self.conn, date_dim)
+
+    def ex9(self, date_dim=False):
+        return ex9(self.conn, date_dim)
+
+    def ex10(self, date_dim=False):
+        return ex10(self.conn, date_dim)
+
+    def ex11(self, date_dim=False, summary=False):
+        return ex11(self.conn, date_dim, summary)
+
+
+### Query service
+# QueryService serves the ex reports to asyncio code from a pool of read-only
+# connections (mode=ro), one per worker thread. The database is switched to WAL
+# once, so the readers do not block an ingest writing through its own
+# connection (ingest_delta, step11_stream_orderdetail_table) and each query
+# sees the last committed data. Don't bulk_load while serving: the bulk-load
+# pragmas take the file out of WAL mode.
+#
+#   async with QueryService('normalized.db', readers=4) as service:
+#       totals, lines = await asyncio.gather(service.ex3(), service.ex1('Alejandra Camino'))
+#
+# Identical requests that arrive while one is running share its execution;
+# each caller gets its own copy of the DataFrame. At most max_pending
+# executions are queued for the readers; further ones wait, and once
+# max_waiting are waiting new requests fail with RuntimeError.
+
+class QueryService:
+    def __init__(self, normalized_database_filename, readers=4, max_pending=None, max_waiting=None, wal=True):
+        self.normalized_database_filename = normalized_database_filename
+        if wal:
+            conn = create_connection(normalized_database_filename)
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.close()
+        self.readers = readers
+        self.max_pending = readers * 2 if max_pending is None else max_pending
+        self.max_waiting = max_waiting
+        self._uri = 'file:%s?mode=ro' % urllib.request.pathname2url(os.path.abspath(normalized_database_filename))
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=readers, thread_name_prefix='walmart-reader')
+        self._in_flight = {}
+        self._slots = None
+        self._waiting = 0
+
+    def _connection(self):
+        # The calling worker thread's read-only connection.
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self._uri, uri=True, check_same_thread=False)
+            _use_partitions_if_partitioned(conn)
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    def _call(self, func, *args):
+        return func(self._connection(), *args)
+
+    async def _submit(self, key, func, *args):
+        future = self._in_flight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(self._execute(func, args))
+            self._in_flight[key] = future
+            future.add_done_callback(lambda done: self._in_flight.pop(key, None))
+        # shield, so one caller giving up does not cancel it for the others
+        result = await asyncio.shield(future)
+        return result.copy()
+
+    async def _execute(self, func, args):
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_pending)
+        if self._slots.locked() and self.max_waiting is not None and self._waiting >= self.max_waiting:
+            raise RuntimeError("query service is busy: %d requests waiting" % self._waiting)
+        self._waiting += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self._waiting -= 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, self._call, func, *args)
+        finally:
+            self._slots.release()
+
+    async def ex1(self, CustomerName):
+        return await self._submit(('ex1', CustomerName), run_ex, 'ex1', CustomerName)
+
+    async def ex2(self, CustomerName):
+        return await self._submit(('ex2', CustomerName), run_ex, 'ex2', CustomerName)
+
+    async def ex1_many(self, names):
+        return await self._submit(('ex1_many', tuple(names)), ex1_many, list(names))
+
+    async def ex2_many(self, names):
+        return await self._submit(('ex2_many', tuple(names)), ex2_many, list(names))
+
+    async def ex3(self, summary=False):
+        return await self._submit(('ex3', summary), run_ex, 'ex3', summary)
+
+    async def ex4(self, summary=False):
+        return await self._submit(('ex4', summary), run_ex, 'ex4', summary)
+
+    async def ex5(self, summary=False):
+        return await self._submit(('ex5', summary), run_ex, 'ex5', summary)
+
+    async def ex6(self, summary=False):
+        return await self._submit(('ex6', summary), run_ex, 'ex6', summary)
+
+    async def ex7(self, summary=False):
+        return await self._submit(('ex7', summary), run_ex, 'ex7', summary)
+
+    async def ex8(self, date_dim=False):
+        return await self._submit(('ex8', date_dim), run_ex, 'ex8', date_dim)
+
+    async def ex9(self, date_dim=False):
+        return await self._submit(('ex9', date_dim), run_ex, 'ex9', date_dim)
+
+    async def ex10(self, date_dim=False):
+        return await self._submit(('ex10', date_dim), run_ex, 'ex10', date_dim)
+
+    async def ex11(self, date_dim=False, summary=False):
+        return await self._submit(('ex11', date_dim, summary), run_ex, 'ex11', date_dim, summary)
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        with self._lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await asyncio.get_running_loop().run_in_executor(None, self.close)
@@ -0,0 +1,49 @@
+import os
+import shutil
+import sqlite3
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import mini_project2
+
+# 300 lines from benchmark.generate_data_file(), with three customers listed
+# again under another address and country just before the last line.
+SAMPLE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'sample.tsv')
+
+TABLES = ['region', 'country', 'customer', 'productcategory', 'product', 'OrderDetail']
+
+
+def build_with_steps(data_filename, normalized_database_filename):
+    # The original pipeline, step1 .. step11 on separate connections.
+    mini_project2.step1_create_region_table(data_filename, normalized_database_filename)
+    mini_project2.step3_create_country_table(data_filename, normalized_database_filename)
+    mini_project2.step5_create_customer_table(data_filename, normalized_database_filename)
+    mini_project2.step7_create_productcategory_table(data_filename, normalized_database_filename)
+    mini_project2.step9_create_product_table(data_filename, normalized_database_filename)
+    mini_project2.step11_create_orderdetail_table(data_filename, normalized_database_filename)
+
+
+def table_rows(normalized_database_filename, tables=TABLES):
+    conn = sqlite3.connect(normalized_database_filename)
+    try:
+        return {table: conn.execute("SELECT * FROM %s ORDER BY 1" % table).fetchall() for table in tables}
+    finally:
+        conn.close()
+
+
+@pytest.fixture(scope='session')
+def step_db(tmp_path_factory):
+    # Built once; copy it (see copy_db) before writing to it.
+    db = str(tmp_path_factory.mktemp('steps') / 'normalized.db')
+    build_with_steps(SAMPLE, db)
+    return db
+
+
+@pytest.fixture
+def copy_db(step_db, tmp_path):
+    db = str(tmp_path / 'normalized.db')
+    shutil.copy(step_db, db)
+    return db
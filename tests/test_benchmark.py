@@ -0,0 +1,83 @@
+import os
+
+import pandas as pd
+import pytest
+
+import benchmark
+import mini_project2
+from conftest import build_with_steps
+
+
+def test_generate_data_file_layout(tmp_path):
+    path = str(tmp_path / 'data.tsv')
+    data = benchmark.generate_data_file(path, 300, customers=20, products=10, seed=1)
+    with open(path) as f:
+        header, *lines = [line.rstrip('\n').split('\t') for line in f]
+    assert header == benchmark.DATA_HEADER
+    assert data['lines'] == len(lines)
+    order_lines = 0
+    for fields in lines:
+        assert len(fields) == 11
+        lists = [field.split(';') for field in fields[5:]]
+        assert len({len(values) for values in lists}) == 1
+        order_lines += len(lists[0])
+        assert all(len(date) == 8 and date.isdigit() for date in lists[5])
+    assert data['order_lines'] == order_lines >= 300
+    # the last line orders one product of every category, for step7
+    assert set(lines[-1][6].split(';')) == {category for category, description in benchmark.CATEGORIES}
+    assert lines[-1][0] == data['top_customer']
+
+    again = str(tmp_path / 'again.tsv')
+    benchmark.generate_data_file(again, 300, customers=20, products=10, seed=1)
+    with open(path) as f, open(again) as g:
+        assert f.read() == g.read()
+    with pytest.raises(ValueError):
+        benchmark.generate_data_file(again, 300, products=len(benchmark.CATEGORIES) - 1)
+
+
+def test_generated_file_builds(tmp_path):
+    path = str(tmp_path / 'data.tsv')
+    db = str(tmp_path / 'normalized.db')
+    data = benchmark.generate_data_file(path, 300, customers=20, products=10)
+    build_with_steps(path, db)
+    conn = mini_project2.create_connection(db)
+    assert conn.execute("SELECT count(*) FROM OrderDetail").fetchone()[0] == data['order_lines']
+    assert conn.execute("SELECT count(*) FROM product").fetchone()[0] == 10
+    conn.close()
+
+
+def test_run_benchmark(tmp_path):
+    directory = str(tmp_path / 'run')
+    results = benchmark.run_benchmark([300], directory, stages=['step5_create_customer_table', 'ex1'],
+                                      customers=20, products=10)
+    (scale,) = results['scales']
+    assert scale['order_lines'] == 300
+    stages = [stage['stage'] for stage in scale['stages']]
+    # a query needs every step before it
+    assert stages == [stage for stage, table in benchmark.STEPS] + ['ex1']
+    setup = [stage['stage'] for stage in scale['stages'] if stage.get('setup')]
+    assert setup == [stage for stage in stages if stage not in ('step5_create_customer_table', 'ex1')]
+    by_stage = {stage['stage']: stage for stage in scale['stages']}
+    assert by_stage['step1_create_region_table']['rows'] == len(benchmark.GEOGRAPHY)
+    assert by_stage['step11_create_orderdetail_table']['rows'] == scale['data']['order_lines']
+    assert by_stage['ex1']['rows'] > 0
+    assert all(stage['wall'] >= 0 and stage['cpu'] >= 0 for stage in scale['stages'])
+    assert os.listdir(directory) == []
+
+    with pytest.raises(ValueError, match='ex12'):
+        benchmark.run_benchmark([300], directory, stages=['ex12'])
+
+
+def test_compare_results(tmp_path):
+    def results(walls):
+        return {'scales': [{'order_lines': scale, 'stages': [{'stage': stage, 'wall': wall}
+                                                            for stage, wall in stages.items()]}
+                           for scale, stages in walls.items()]}
+
+    old = str(tmp_path / 'old.json')
+    new = str(tmp_path / 'new.json')
+    benchmark.save_results(results({100: {'ex1': 2.0, 'ex2': 0.0}, 1000: {'ex1': 4.0}}), old)
+    benchmark.save_results(results({100: {'ex1': 1.0, 'ex2': 0.5, 'ex3': 1.0}, 10000: {'ex1': 1.0}}), new)
+    expected = pd.DataFrame([(100, 'ex1', 2.0, 1.0, 0.5), (100, 'ex2', 0.0, 0.5, None)],
+                            columns=['order_lines', 'stage', 'old_wall', 'new_wall', 'ratio'])
+    pd.testing.assert_frame_equal(benchmark.compare_results(old, new), expected)
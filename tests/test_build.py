@@ -0,0 +1,119 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+import mini_project2
+from conftest import SAMPLE, TABLES, build_with_steps, table_rows
+
+
+def test_single_pass_build_matches_steps(step_db, tmp_path):
+    db = str(tmp_path / 'single_pass.db')
+    mini_project2.build_normalized_database(SAMPLE, db)
+    assert table_rows(db) == table_rows(step_db)
+
+
+def _build_dimensions(db):
+    mini_project2.step1_create_region_table(SAMPLE, db)
+    mini_project2.step3_create_country_table(SAMPLE, db)
+    mini_project2.step5_create_customer_table(SAMPLE, db)
+    mini_project2.step7_create_productcategory_table(SAMPLE, db)
+    mini_project2.step9_create_product_table(SAMPLE, db)
+
+
+def test_streaming_loader_matches_step11(step_db, tmp_path):
+    # With one batch holding every row, cluster='batch' sorts like step11.
+    db = str(tmp_path / 'stream.db')
+    _build_dimensions(db)
+    mini_project2.step11_stream_orderdetail_table(SAMPLE, db, batch_size=100000, cluster='batch')
+    assert table_rows(db) == table_rows(step_db)
+
+
+@pytest.mark.parametrize('cluster', ['index', 'batch', None])
+def test_streaming_loader_same_rows(step_db, tmp_path, cluster):
+    db = str(tmp_path / 'stream.db')
+    _build_dimensions(db)
+    count = mini_project2.step11_stream_orderdetail_table(SAMPLE, db, batch_size=50, cluster=cluster)
+    rows, expected = table_rows(db), table_rows(step_db)
+    assert count == len(expected['OrderDetail'])
+    assert sorted(row[1:] for row in rows['OrderDetail']) == sorted(row[1:] for row in expected['OrderDetail'])
+    assert all(rows[table] == expected[table] for table in TABLES if table != 'OrderDetail')
+
+
+@pytest.mark.parametrize('workers', [2, 3])
+def test_parallel_build_matches_steps(step_db, tmp_path, workers):
+    db = str(tmp_path / 'workers.db')
+    mini_project2.build_normalized_database(SAMPLE, db, workers=workers)
+    assert table_rows(db) == table_rows(step_db)
+
+
+def test_shard_offsets_cover_the_file_on_line_starts():
+    with open(SAMPLE, 'rb') as f:
+        data = f.read()
+    shards = mini_project2._shard_offsets(SAMPLE, 7)
+    assert shards[0][0] == data.index(b'\n') + 1 and shards[-1][1] == len(data)
+    assert all(end == start for (_, end), (start, _) in zip(shards, shards[1:]))
+    assert all(data[start - 1:start] == b'\n' for start, _ in shards)
+
+
+@pytest.fixture(params=['gzip', 'bz2', 'xz'])
+def compressed_sample(request, tmp_path):
+    # Named without an extension; the build has to go by the first bytes.
+    path = str(tmp_path / ('sample-' + request.param))
+    with open(SAMPLE, 'rb') as f, mini_project2._COMPRESSED_OPENERS[request.param](path, 'wb') as out:
+        out.write(f.read())
+    assert mini_project2.data_file_compression(path) == request.param
+    return path
+
+
+@pytest.mark.parametrize('options', [{}, {'workers': 2}])
+def test_compressed_build_matches_steps(step_db, tmp_path, compressed_sample, options):
+    db = str(tmp_path / 'compressed.db')
+    mini_project2.build_normalized_database(compressed_sample, db, **options)
+    assert table_rows(db) == table_rows(step_db)
+
+
+def test_compressed_steps_match_steps(step_db, tmp_path, compressed_sample):
+    db = str(tmp_path / 'compressed.db')
+    build_with_steps(compressed_sample, db)
+    assert table_rows(db) == table_rows(step_db)
+
+
+SEED_BUILDS = """
+import sys
+import mini_project2
+from conftest import table_rows
+for i, options in enumerate([{}, {'workers': 2}]):
+    db = '%s-%d.db' % (sys.argv[2], i)
+    mini_project2.build_normalized_database(sys.argv[1], db, **options)
+    print(repr((options, table_rows(db))))
+"""
+
+
+def test_product_with_two_prices_under_any_hash_seed(tmp_path):
+    # Every 7th line sells its products one cent dearer, so names repeat with
+    # different prices and step9 keeps them in first-line order.
+    with open(SAMPLE, 'r') as f:
+        lines = f.readlines()
+    for i in range(1, len(lines), 7):
+        fields = lines[i].split('\t')
+        fields[8] = ';'.join('%.2f' % (float(price) + 0.01) for price in fields[8].split(';'))
+        lines[i] = '\t'.join(fields)
+    data_filename = str(tmp_path / 'prices.tsv')
+    with open(data_filename, 'w') as f:
+        f.writelines(lines)
+    step_db = str(tmp_path / 'steps.db')
+    build_with_steps(data_filename, step_db)
+    expected = table_rows(step_db)
+    assert len(expected['product']) > len(set(row[1] for row in expected['product']))
+
+    tests = os.path.dirname(os.path.abspath(__file__))
+    for seed in range(6):
+        env = dict(os.environ, PYTHONHASHSEED=str(seed), PYTHONPATH=os.pathsep.join([os.path.dirname(tests), tests]))
+        output = subprocess.run([sys.executable, '-c', SEED_BUILDS, data_filename, str(tmp_path / ('seed%d' % seed))], env=env,
+                                capture_output=True, text=True, check=True).stdout.splitlines()
+        assert len(output) == 2
+        for line in output:
+            options, rows = eval(line)
+            assert rows == expected, 'PYTHONHASHSEED=%d %r' % (seed, options)
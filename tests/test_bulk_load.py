@@ -0,0 +1,89 @@
+import sqlite3
+
+import pytest
+
+import mini_project2
+from conftest import SAMPLE, table_rows
+
+
+def _journal_mode(db):
+    conn = sqlite3.connect(db)
+    try:
+        return conn.execute("PRAGMA journal_mode").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_bulk_load_build_matches_steps(step_db, tmp_path):
+    db = str(tmp_path / 'bulk.db')
+    mini_project2.build_normalized_database(SAMPLE, db, bulk_load=True)
+    assert table_rows(db) == table_rows(step_db)
+
+
+def test_bulk_load_keeps_wal(tmp_path):
+    db = str(tmp_path / 'wal.db')
+    conn = sqlite3.connect(db)
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.close()
+    mini_project2.build_normalized_database(SAMPLE, db, bulk_load=True)
+    assert _journal_mode(db) == 'wal'
+
+
+def _settings(conn):
+    return [conn.execute("PRAGMA %s" % name).fetchone()[0] for name in mini_project2.BULK_LOAD_SETTINGS]
+
+
+def test_finish_bulk_load_restores_settings(tmp_path):
+    conn = mini_project2.create_connection(str(tmp_path / 'x.db'))
+    conn.execute("PRAGMA synchronous = NORMAL")
+    before = _settings(conn)
+    settings = mini_project2.start_bulk_load(conn)
+    assert conn.execute("PRAGMA foreign_keys").fetchone()[0] == 0
+    mini_project2.finish_bulk_load(conn, settings)
+    assert _settings(conn) == before
+    conn.close()
+
+
+def test_foreign_key_violation_closes_connection(copy_db):
+    db = mini_project2.WalmartDB(copy_db, bulk_load=True)
+    conn = db.conn
+    db.conn.execute("INSERT INTO customer (FirstName, LastName, Address, City, CountryID) VALUES ('A', 'B', 'C', 'D', 999)")
+    with pytest.raises(sqlite3.IntegrityError):
+        db.close()
+    assert db.conn is None
+    with pytest.raises(sqlite3.ProgrammingError):
+        conn.execute("SELECT 1")
+
+
+def test_failed_bulk_load_restores_settings(tmp_path):
+    conn = mini_project2.create_connection(str(tmp_path / 'x.db'))
+    conn.execute("PRAGMA journal_mode = WAL")
+    before = _settings(conn)
+    with pytest.raises(ZeroDivisionError):
+        with mini_project2.bulk_loading(conn):
+            conn.execute("CREATE TABLE t (x)")
+            conn.execute("INSERT INTO t VALUES (1)")
+            1 / 0
+    assert _settings(conn) == before
+    assert not conn.in_transaction
+    conn.close()
+
+
+def test_failed_bulk_build_keeps_wal(tmp_path, monkeypatch):
+    def fail(conn):
+        raise sqlite3.OperationalError('disk full')
+    wal = str(tmp_path / 'wal.db')
+    conn = sqlite3.connect(wal)
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.close()
+    with monkeypatch.context() as m:
+        m.setattr(mini_project2, 'create_indexes', fail)
+        with pytest.raises(sqlite3.OperationalError):
+            mini_project2.build_normalized_database(SAMPLE, wal, bulk_load=True)
+    assert _journal_mode(wal) == 'wal'
+
+    # A later bulk load on another database must not get the failed one's settings.
+    for i in range(5):
+        db = str(tmp_path / ('fresh%d.db' % i))
+        mini_project2.build_normalized_database(SAMPLE, db, bulk_load=True)
+        assert _journal_mode(db) == 'delete'
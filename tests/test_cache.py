@@ -0,0 +1,78 @@
+import sqlite3
+
+import pandas as pd
+import pytest
+
+import mini_project2
+
+QUERIES = [('ex3', False), ('ex4', False), ('ex5', False), ('ex6', False), ('ex7', False),
+           ('ex8', False), ('ex9', False), ('ex10', False), ('ex11', False, False),
+           ('ex3', True), ('ex8', True), ('ex11', True, False), ('ex11', False, True)]
+
+
+@pytest.fixture
+def conn(copy_db):
+    conn = sqlite3.connect(copy_db)
+    mini_project2.create_summary_tables(conn)
+    conn.commit()
+    yield conn
+    conn.close()
+
+
+def _selects(conn, func, *args):
+    # Result of func(conn, *args) and the SELECT statements it ran, not
+    # counting lookups in the schema.
+    statements = []
+    conn.set_trace_callback(statements.append)
+    try:
+        result = func(conn, *args)
+    finally:
+        conn.set_trace_callback(None)
+    return result, [sql for sql in statements
+                    if sql.lstrip().upper().startswith(('SELECT', 'WITH')) and 'sqlite_temp_master' not in sql]
+
+
+@pytest.mark.parametrize('query', QUERIES)
+def test_run_ex_runs_the_query_once(conn, query):
+    name, args = query[0], query[1:]
+    expected = pd.read_sql_query(getattr(mini_project2, name)(conn, *args), conn)
+    df, selects = _selects(conn, mini_project2.run_ex, name, *args)
+    assert len(selects) == 1
+    pd.testing.assert_frame_equal(df, expected)
+
+
+def test_result_cache_hits_until_a_write(conn):
+    cache = mini_project2.ResultCache(conn)
+    first = cache.query('ex3')
+    df, selects = _selects(conn, lambda conn: cache.query('ex3'))
+    assert df is first and cache.hits == 1 and not selects
+
+    conn.execute("UPDATE OrderDetail SET QuantityOrdered = QuantityOrdered + 1 WHERE OrderID = 1")
+    conn.commit()
+    df = cache.query('ex3')
+    assert cache.misses == 2
+    pd.testing.assert_frame_equal(df, pd.read_sql_query(mini_project2.ex3(conn), conn))
+
+
+def test_result_cache_evicts_least_recently_used(conn):
+    cache = mini_project2.ResultCache(conn, max_entries=2)
+    cache.query('ex3')
+    cache.query('ex4')
+    cache.query('ex3')
+    cache.query('ex5')
+    assert list(cache.entries) == [('ex3',), ('ex5',)]
+
+
+def test_result_cache_directory_needs_pyarrow(conn, tmp_path):
+    try:
+        import pyarrow
+    except ImportError:
+        with pytest.raises(ImportError, match='pyarrow'):
+            mini_project2.ResultCache(conn, directory=str(tmp_path))
+        return
+    first = mini_project2.ResultCache(conn, directory=str(tmp_path))
+    expected = first.query('ex6')
+    second = mini_project2.ResultCache(conn, directory=str(tmp_path))
+    df, selects = _selects(conn, lambda conn: second.query('ex6'))
+    assert not selects
+    pd.testing.assert_frame_equal(df, expected)
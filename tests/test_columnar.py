@@ -0,0 +1,23 @@
+import sqlite3
+
+import pandas as pd
+import pytest
+
+import mini_project2
+
+
+@pytest.fixture
+def indexed_conn(copy_db):
+    conn = sqlite3.connect(copy_db)
+    mini_project2.create_indexes(conn)
+    conn.commit()
+    yield conn
+    conn.close()
+
+
+@pytest.mark.parametrize('n', range(3, 12))
+def test_columnar_matches_sql(indexed_conn, tmp_path, n):
+    mini_project2.export_columnar(indexed_conn, str(tmp_path))
+    cols = mini_project2.load_columnar(str(tmp_path))
+    expected = pd.read_sql_query(getattr(mini_project2, 'ex%d' % n)(indexed_conn), indexed_conn)
+    pd.testing.assert_frame_equal(getattr(mini_project2, 'columnar_ex%d' % n)(cols), expected)
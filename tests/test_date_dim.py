@@ -0,0 +1,46 @@
+import sqlite3
+
+import pandas as pd
+import pytest
+
+import mini_project2
+
+QUERIES = ['ex8', 'ex9', 'ex10', 'ex11']
+
+
+def _assert_date_dim_matches(conn):
+    for name in QUERIES:
+        func = getattr(mini_project2, name)
+        pd.testing.assert_frame_equal(pd.read_sql_query(func(conn, True), conn),
+                                      pd.read_sql_query(func(conn), conn), obj=name)
+
+
+def test_date_dim_queries_match(step_db):
+    conn = sqlite3.connect(step_db)
+    _assert_date_dim_matches(conn)
+    conn.close()
+
+
+def test_date_dim_for_database_without_date_keys(copy_db):
+    # A database from before DateKey: the column is added and date_dim filled.
+    conn = sqlite3.connect(copy_db)
+    expected = {name: pd.read_sql_query(getattr(mini_project2, name)(conn), conn) for name in QUERIES}
+    conn.execute("DROP TABLE date_dim")
+    conn.execute("ALTER TABLE OrderDetail DROP COLUMN DateKey")
+    conn.commit()
+    mini_project2.create_date_dim(conn)
+    conn.commit()
+    for name in QUERIES:
+        pd.testing.assert_frame_equal(pd.read_sql_query(getattr(mini_project2, name)(conn, True), conn), expected[name], obj=name)
+    conn.close()
+
+
+def test_date_dim_rows():
+    conn = sqlite3.connect(':memory:')
+    mini_project2.create_date_dim(conn, [20120229, 20131001])
+    mini_project2.create_date_dim(conn, [20120229])
+    assert conn.execute("SELECT * FROM date_dim ORDER BY DateKey").fetchall() == [
+        (20120229, '2012-02-29', 2012, 'Q1', 2, 'February', 734562),
+        (20131001, '2013-10-01', 2013, 'Q4', 10, 'October', 735142),
+    ]
+    conn.close()
@@ -0,0 +1,73 @@
+import sqlite3
+
+import pytest
+
+import mini_project2
+
+
+@pytest.fixture
+def conn(copy_db):
+    conn = sqlite3.connect(copy_db)
+    yield conn
+    conn.close()
+
+
+def _statements(conn, func):
+    statements = []
+    conn.set_trace_callback(statements.append)
+    try:
+        result = func()
+    finally:
+        conn.set_trace_callback(None)
+    return result, statements
+
+
+def test_maps_match_step_dictionaries(conn, copy_db):
+    cache = mini_project2.DimensionCache(conn)
+    assert cache.to_id('region') == mini_project2.step2_create_region_to_regionid_dictionary(copy_db)
+    assert cache.to_id('country') == mini_project2.step4_create_country_to_countryid_dictionary(copy_db)
+    assert cache.to_id('customer') == mini_project2.step6_create_customer_to_customerid_dictionary(copy_db)
+    assert cache.to_id('productcategory') == mini_project2.step8_create_productcategory_to_productcategoryid_dictionary(copy_db)
+    assert cache.to_id('product') == mini_project2.step10_create_product_to_productid_dictionary(copy_db)
+    for name, customer_id in cache.to_id('customer').items():
+        assert cache.name('customer', customer_id) == name
+    with pytest.raises(KeyError):
+        cache.name('customer', 0)
+    with pytest.raises(KeyError):
+        cache.name('customer', 10**6)
+
+
+@pytest.mark.parametrize('same_connection', [True, False])
+def test_rename_is_seen(conn, copy_db, same_connection):
+    cache = mini_project2.DimensionCache(conn)
+    name, product_id = conn.execute("SELECT ProductName, ProductID FROM product LIMIT 1").fetchone()
+    assert cache.id('product', name) == product_id
+    writer = conn if same_connection else sqlite3.connect(copy_db)
+    writer.execute("UPDATE product SET ProductName = 'Renamed' WHERE ProductID = ?", (product_id,))
+    writer.commit()
+    assert cache.id('product', 'Renamed') == product_id
+    assert cache.name('product', product_id) == 'Renamed'
+    with pytest.raises(KeyError):
+        cache.id('product', name)
+    if not same_connection:
+        writer.close()
+
+
+def test_batch_checks_for_changes_once(conn):
+    cache = mini_project2.DimensionCache(conn)
+    names = list(cache.to_id('customer'))[:3]
+    expected = [cache.id('customer', name) for name in names]
+
+    ids, statements = _statements(conn, lambda: [cache.id('customer', name) for name in names])
+    assert ids == expected and len(statements) == 3
+
+    def batch():
+        with cache.batch():
+            return [cache.id('customer', name) for name in names]
+    ids, statements = _statements(conn, batch)
+    assert ids == expected and len(statements) == 1
+
+    ids, statements = _statements(conn, lambda: cache.ids('customer', names))
+    assert ids == expected and len(statements) == 1
+    result, statements = _statements(conn, lambda: cache.names('customer', expected))
+    assert result == names and len(statements) == 1
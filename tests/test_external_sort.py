@@ -0,0 +1,31 @@
+import random
+
+import pytest
+
+import mini_project2
+from conftest import SAMPLE, build_with_steps, table_rows
+
+
+@pytest.mark.parametrize('run_size', [1, 7, 1000])
+def test_external_sort_is_a_stable_sort(run_size):
+    rows = [(random.Random(i).randrange(20), i % 5) for i in range(500)]
+    key = lambda row: row[0]
+    assert list(mini_project2.external_sort(rows, key=key, run_size=run_size)) == sorted(rows, key=key)
+    unique = sorted(dict.fromkeys(rows), key=key)
+    assert list(mini_project2.external_sort(rows, key=key, unique=True, run_size=run_size)) == unique
+
+
+@pytest.mark.parametrize('build', ['steps', 'single_pass'])
+def test_spilled_builds_match_steps(step_db, tmp_path, monkeypatch, build):
+    monkeypatch.setattr(mini_project2, 'EXTERNAL_SORT_ROWS', 50)
+    monkeypatch.setattr(mini_project2, 'EXTERNAL_SORT_DIR', str(tmp_path))
+    runs = []
+    temporary_file = mini_project2.tempfile.TemporaryFile
+    monkeypatch.setattr(mini_project2.tempfile, 'TemporaryFile', lambda **kwargs: runs.append(kwargs) or temporary_file(**kwargs))
+    db = str(tmp_path / 'spilled.db')
+    if build == 'steps':
+        build_with_steps(SAMPLE, db)
+    else:
+        mini_project2.build_normalized_database(SAMPLE, db)
+    assert len(runs) > 2 and all(kwargs['dir'] == str(tmp_path) for kwargs in runs)
+    assert table_rows(db) == table_rows(step_db)
@@ -0,0 +1,44 @@
+import gzip
+import locale
+
+import pytest
+
+import mini_project2
+from conftest import SAMPLE
+
+
+def _split_lines(data_filename, columns):
+    with open(data_filename, 'r') as f:
+        next(f)
+        return [tuple(line.strip().split('\t')[i] for i in columns) for line in f]
+
+
+@pytest.mark.parametrize('columns', [(4,), (3, 4), (0, 10, 5, 9), (10,)])
+def test_fields_match_split(columns):
+    assert list(mini_project2.iter_data_fields(SAMPLE, columns)) == _split_lines(SAMPLE, columns)
+
+
+def test_undecoded_fields_are_bytes():
+    encoding = locale.getpreferredencoding(False)
+    fields = list(mini_project2.iter_data_fields(SAMPLE, (0, 6), decode=False))
+    assert [tuple(field.decode(encoding) for field in row) for row in fields] == _split_lines(SAMPLE, (0, 6))
+
+
+def test_last_line_without_newline_and_empty_file(tmp_path):
+    with open(SAMPLE, 'rb') as f:
+        data = f.read().rstrip(b'\n')
+    path = tmp_path / 'no_newline.tsv'
+    path.write_bytes(data)
+    assert list(mini_project2.iter_data_fields(str(path), (0, 4))) == _split_lines(SAMPLE, (0, 4))
+    empty = tmp_path / 'empty.tsv'
+    empty.write_bytes(b'')
+    assert list(mini_project2.iter_data_fields(str(empty), (0,))) == []
+
+
+def test_fields_of_compressed_file(tmp_path, monkeypatch):
+    # Batches smaller than a line still give every line once.
+    monkeypatch.setattr(mini_project2, 'DECOMPRESS_BATCH_BYTES', 64)
+    path = str(tmp_path / 'sample.tsv.gz')
+    with open(SAMPLE, 'rb') as f, gzip.open(path, 'wb') as out:
+        out.write(f.read())
+    assert list(mini_project2.iter_data_fields(path, (0, 10))) == _split_lines(SAMPLE, (0, 10))
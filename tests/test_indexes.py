@@ -0,0 +1,52 @@
+import sqlite3
+
+import pytest
+
+import mini_project2
+
+VARIANTS = ['ex%d(summary=True)' % n for n in range(3, 8)] + ['ex11(summary=True)'] + ['ex%d(date_dim=True)' % n for n in range(8, 12)]
+
+
+@pytest.fixture
+def conn(copy_db):
+    conn = sqlite3.connect(copy_db)
+    yield conn
+    conn.close()
+
+
+def _names(conn, kind):
+    return set(row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = ?", (kind,)))
+
+
+def test_create_indexes(conn):
+    mini_project2.create_indexes(conn)
+    mini_project2.create_indexes(conn)
+    assert set(mini_project2.INDEX_SQL) <= _names(conn, 'index')
+    assert conn.execute("SELECT count(*) FROM sqlite_stat1").fetchone()[0] > 0
+
+
+def test_query_plans_before_and_after_indexes(conn):
+    conn.execute("DROP INDEX IF EXISTS idx_orderdetail_customer_date")
+    before = mini_project2.verify_query_plans(conn)
+    assert 'OrderDetail' in before['ex1'] and 'OrderDetail' in before['ex11']
+
+    mini_project2.create_indexes(conn)
+    mini_project2.create_summary_tables(conn)
+    conn.commit()
+    after = mini_project2.verify_query_plans(conn)
+    assert set(VARIANTS) <= set(after)
+    for name in ['ex1', 'ex2', 'ex3', 'ex11', 'ex11(summary=True)', 'ex11(date_dim=True)']:
+        assert after[name] == [], name
+    # only tables are reported, never the CTEs and subqueries the queries build
+    tables = _names(conn, 'table')
+    assert all(table in tables and table != 'OrderDetail' for scans in after.values() for table in scans)
+
+
+def test_query_plans_on_partitions(copy_db):
+    mini_project2.partition_orderdetail(copy_db)
+    conn = sqlite3.connect(copy_db)
+    mini_project2.use_partitions(conn)
+    plans = mini_project2.verify_query_plans(conn)
+    assert plans['ex1'] == []
+    assert 'OrderDetail' in plans['ex4']
+    conn.close()
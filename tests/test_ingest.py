@@ -0,0 +1,95 @@
+import gzip
+import shutil
+
+import pandas as pd
+import pytest
+
+import mini_project2
+from conftest import SAMPLE, build_with_steps, table_rows
+
+
+def _orderdetail_count(db):
+    return len(table_rows(db, ['OrderDetail'])['OrderDetail'])
+
+
+def _build_stream(data_filename, db):
+    build_with_steps(data_filename, db)
+    conn = mini_project2.create_connection(db)
+    conn.execute("DELETE FROM OrderDetail")
+    conn.execute("DELETE FROM ingest_watermark")
+    conn.commit()
+    conn.close()
+    mini_project2.step11_stream_orderdetail_table(data_filename, db)
+
+
+BUILDS = {
+    'steps': build_with_steps,
+    'stream': _build_stream,
+    'single_pass': mini_project2.build_normalized_database,
+}
+
+
+@pytest.mark.parametrize('build', sorted(BUILDS))
+def test_ingest_delta_after_build_adds_nothing(build, tmp_path):
+    db = str(tmp_path / 'normalized.db')
+    BUILDS[build](SAMPLE, db)
+    count = _orderdetail_count(db)
+    assert mini_project2.ingest_delta(SAMPLE, db) == 0
+    assert _orderdetail_count(db) == count
+
+
+def test_ingest_delta_after_compressed_build_adds_nothing(tmp_path):
+    data_filename = str(tmp_path / 'sample.tsv.gz')
+    with open(SAMPLE, 'rb') as src, gzip.open(data_filename, 'wb') as dst:
+        shutil.copyfileobj(src, dst)
+    db = str(tmp_path / 'normalized.db')
+    mini_project2.build_normalized_database(data_filename, db)
+    assert mini_project2.ingest_delta(data_filename, db) == 0
+
+
+def test_ingest_delta_appends_only_new_lines(tmp_path):
+    with open(SAMPLE, 'rb') as f:
+        lines = f.readlines()
+    data_filename = str(tmp_path / 'sample.tsv')
+    with open(data_filename, 'wb') as f:
+        f.writelines(lines[:-10])
+    db = str(tmp_path / 'normalized.db')
+    mini_project2.build_normalized_database(data_filename, db)
+    count = _orderdetail_count(db)
+
+    with open(data_filename, 'ab') as f:
+        f.writelines(lines[-10:])
+    added = sum(line.split(b'\t')[5].count(b';') + 1 for line in lines[-10:])
+    assert mini_project2.ingest_delta(data_filename, db) == added
+    assert _orderdetail_count(db) == count + added
+
+
+@pytest.mark.parametrize('period', ['year', 'quarter'])
+def test_ingest_delta_into_partitions(tmp_path, period):
+    with open(SAMPLE, 'rb') as f:
+        lines = f.readlines()
+    data_filename = str(tmp_path / 'sample.tsv')
+    with open(data_filename, 'wb') as f:
+        f.writelines(lines[:-10])
+    plain, partitioned = str(tmp_path / 'plain.db'), str(tmp_path / 'partitioned.db')
+    for db in (plain, partitioned):
+        mini_project2.build_normalized_database(data_filename, db, summary_tables=True)
+    mini_project2.partition_orderdetail(partitioned, period=period)
+
+    with open(data_filename, 'ab') as f:
+        f.writelines(lines[-10:])
+    added = mini_project2.ingest_delta(data_filename, plain)
+    assert mini_project2.ingest_delta(data_filename, partitioned) == added > 0
+    assert mini_project2.ingest_delta(data_filename, partitioned) == 0
+
+    expected = mini_project2.create_connection(plain)
+    conn = mini_project2.create_connection(partitioned)
+    assert conn.execute("SELECT 1 FROM main.sqlite_master WHERE name = 'OrderDetail'").fetchone() is None
+    mini_project2.use_partitions(conn)
+    assert conn.execute("SELECT count(*) FROM OrderDetail").fetchone() == expected.execute("SELECT count(*) FROM OrderDetail").fetchone()
+    for query in [('ex3', False), ('ex3', True), ('ex6', False), ('ex11', False, False), ('ex11', False, True)]:
+        func = getattr(mini_project2, query[0])
+        pd.testing.assert_frame_equal(pd.read_sql_query(func(conn, *query[1:]), conn),
+                                      pd.read_sql_query(func(expected, *query[1:]), expected), obj=repr(query))
+    conn.close()
+    expected.close()
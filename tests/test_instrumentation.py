@@ -0,0 +1,139 @@
+import json
+import sqlite3
+
+import pytest
+
+import mini_project2
+from conftest import SAMPLE, build_with_steps, table_rows
+
+
+def _data_lines():
+    with open(SAMPLE) as f:
+        return sum(1 for line in f) - 1
+
+
+@pytest.fixture
+def measured(tmp_path):
+    db = str(tmp_path / 'normalized.db')
+    finished = []
+    with mini_project2.Instrumentation(sink=finished.append) as inst:
+        build_with_steps(SAMPLE, db)
+    return inst, finished, db
+
+
+def test_stages_nest(measured):
+    inst, finished, db = measured
+    stages = [(stage['depth'], stage['stage'], stage['parent']) for stage in inst.stages]
+    assert stages == [
+        (0, 'step1_create_region_table', None),
+        (0, 'step3_create_country_table', None),
+        (1, 'step2_create_region_to_regionid_dictionary', 'step3_create_country_table'),
+        (0, 'step5_create_customer_table', None),
+        (1, 'step4_create_country_to_countryid_dictionary', 'step5_create_customer_table'),
+        (0, 'step7_create_productcategory_table', None),
+        (0, 'step9_create_product_table', None),
+        (1, 'step8_create_productcategory_to_productcategoryid_dictionary', 'step9_create_product_table'),
+        (0, 'step11_create_orderdetail_table', None),
+        (1, 'step6_create_customer_to_customerid_dictionary', 'step11_create_orderdetail_table'),
+        (1, 'step10_create_product_to_productid_dictionary', 'step11_create_orderdetail_table'),
+    ]
+    by_stage = {stage['stage']: stage for stage in inst.stages}
+    # a nested stage's time is part of its parent's
+    for stage in inst.stages:
+        if stage['parent'] is not None:
+            assert stage['wall'] <= by_stage[stage['parent']]['wall']
+    assert not any(stage['error'] for stage in inst.stages)
+    assert mini_project2._instrumentation is None
+
+
+def test_counts_go_to_the_innermost_stage(measured):
+    inst, finished, db = measured
+    tables = table_rows(db, ['region', 'country', 'OrderDetail'])
+    by_stage = {stage['stage']: stage for stage in inst.stages}
+    for stage in inst.stages:
+        # only the steps that create a table read the data file
+        assert stage['lines_parsed'] == (_data_lines() if stage['depth'] == 0 else 0)
+        # rows_inserted adds up the INSERT statements of the stage, not of its children
+        assert stage['rows_inserted'] == sum(entry['rows'] for entry in stage['statements'].values()
+                                             if entry['sql'].startswith('INSERT'))
+    assert by_stage['step1_create_region_table']['rows_inserted'] == len(tables['region'])
+    assert by_stage['step3_create_country_table']['rows_inserted'] == len(tables['country'])
+    assert by_stage['step2_create_region_to_regionid_dictionary']['rows_fetched'] == len(tables['region'])
+    assert by_stage['step3_create_country_table']['rows_fetched'] == 0
+    statements = by_stage['step11_create_orderdetail_table']['statements']
+    insert = statements[' '.join(mini_project2.ORDERDETAIL_INSERT_SQL.split())]
+    assert insert['calls'] == 1 and insert['rows'] == len(tables['OrderDetail'])
+    assert insert['seconds'] is not None
+
+
+def test_sink_gets_each_stage_when_it_finishes(measured):
+    inst, finished, db = measured
+    # children finish before their parent
+    assert [stage['stage'] for stage in finished] == [
+        'step1_create_region_table', 'step2_create_region_to_regionid_dictionary', 'step3_create_country_table',
+        'step4_create_country_to_countryid_dictionary', 'step5_create_customer_table',
+        'step7_create_productcategory_table', 'step8_create_productcategory_to_productcategoryid_dictionary',
+        'step9_create_product_table', 'step6_create_customer_to_customerid_dictionary',
+        'step10_create_product_to_productid_dictionary', 'step11_create_orderdetail_table']
+    for stage in finished:
+        seconds = [entry['seconds'] or 0 for entry in stage['statements']]
+        assert seconds == sorted(seconds, reverse=True)
+    assert sorted(finished, key=lambda stage: stage['stage']) == \
+        sorted(inst.report()['stages'], key=lambda stage: stage['stage'])
+
+
+def test_table_and_json(measured, tmp_path):
+    inst, finished, db = measured
+    path = str(tmp_path / 'report.json')
+    text = inst.to_json(path)
+    with open(path) as f:
+        assert f.read() == text
+    assert json.loads(text) == inst.report()
+
+    stages, slowest = inst.table(statements=3).split('\n\n')
+    lines = stages.splitlines()
+    assert lines[0].split() == ['stage', 'wall', 'cpu', 'lines_parsed', 'rows_inserted', 'rows_fetched',
+                                'peak_tracemalloc', 'sql']
+    assert len(lines) == len(inst.stages) + 1
+    # nested stages are indented
+    assert lines[2].startswith('step3_create_country_table ')
+    assert lines[3].startswith('  step2_create_region_to_regionid_dictionary ')
+    assert slowest.splitlines()[0].split() == ['stage', 'calls', 'seconds', 'rows', 'sql']
+    assert len(slowest.splitlines()) == 4
+    assert '\n\n' not in inst.table(statements=0)
+
+
+def test_only_one_active():
+    with mini_project2.Instrumentation() as inst:
+        with pytest.raises(RuntimeError, match='already active'):
+            mini_project2.Instrumentation().start()
+        assert mini_project2._instrumentation is inst
+    assert mini_project2._instrumentation is None
+    mini_project2.Instrumentation().start().stop()
+
+
+def test_inactive_records_nothing(tmp_path):
+    inst = mini_project2.Instrumentation()
+    conn = mini_project2.create_connection(str(tmp_path / 'normalized.db'))
+    assert type(conn) is sqlite3.Connection
+    mini_project2.execute_sql_statement("SELECT 1", conn)
+    conn.close()
+    assert inst.stages == []
+
+
+def test_error_and_untraced_connection():
+    finished = []
+    conn = sqlite3.connect(':memory:')
+    with mini_project2.Instrumentation(sink=finished.append) as inst:
+        assert mini_project2.execute_sql_statement("SELECT 1", conn) == [(1,)]
+        with pytest.raises(sqlite3.OperationalError):
+            mini_project2.execute_sql_statement("SELECT * FROM missing", conn)
+    conn.close()
+    ok, failed = inst.stages
+    # statements on a connection not opened by create_connection() are
+    # captured without durations or row counts
+    assert list(ok['statements']) == ['SELECT 1']
+    assert ok['statements']['SELECT 1']['seconds'] is None
+    assert ok['error'] is None
+    assert 'missing' in failed['error']
+    assert finished[1]['stage'] == 'execute_sql_statement'
@@ -0,0 +1,30 @@
+import sqlite3
+
+import pandas as pd
+
+import mini_project2
+from conftest import SAMPLE
+
+
+def test_leaderboard_matches_sql(step_db):
+    board = mini_project2.Leaderboard(SAMPLE)
+    conn = sqlite3.connect(step_db)
+    pd.testing.assert_frame_equal(board.ex7(), pd.read_sql_query(mini_project2.ex7(conn), conn), check_dtype=False)
+    pd.testing.assert_frame_equal(board.ex9(), pd.read_sql_query(mini_project2.ex9(conn), conn), check_dtype=False)
+    conn.close()
+
+
+def test_leaderboard_add_file(tmp_path, step_db):
+    # The file in two drops gives the same boards as the whole file.
+    with open(SAMPLE, 'rb') as f:
+        lines = f.readlines()
+    first, second = str(tmp_path / 'first.tsv'), str(tmp_path / 'second.tsv')
+    with open(first, 'wb') as f:
+        f.writelines(lines[:150])
+    with open(second, 'wb') as f:
+        f.writelines(lines[:1] + lines[150:])
+    board = mini_project2.Leaderboard(first)
+    board.add_file(second)
+    whole = mini_project2.Leaderboard(SAMPLE)
+    pd.testing.assert_frame_equal(board.ex7(k=3), whole.ex7(k=3))
+    pd.testing.assert_frame_equal(board.ex9(k=10), whole.ex9(k=10))
@@ -0,0 +1,48 @@
+import sqlite3
+
+import pandas as pd
+import pytest
+
+import mini_project2
+from test_summary import _edit_orderdetail
+
+
+@pytest.fixture
+def conn(copy_db):
+    conn = sqlite3.connect(copy_db)
+    mini_project2.create_summary_tables(conn)
+    conn.commit()
+    yield conn
+    conn.close()
+
+
+def _assert_gaps_match(conn):
+    pd.testing.assert_frame_equal(pd.read_sql_query(mini_project2.ex11(conn, summary=True), conn),
+                                  pd.read_sql_query(mini_project2.ex11(conn), conn))
+
+
+def test_order_gaps_match_ex11(conn):
+    _assert_gaps_match(conn)
+
+
+def test_triggers_keep_order_gaps_current(conn):
+    _edit_orderdetail(conn)
+    _assert_gaps_match(conn)
+
+
+def test_line_inside_the_longest_gap(conn):
+    # Splitting a customer's longest gap makes another gap the longest.
+    customer, previous, current = conn.execute(
+        "SELECT CustomerID, PreviousOrderDate, OrderDate FROM customer_order_gap WHERE MaxDaysWithoutOrder > 2 LIMIT 1").fetchone()
+    middle = pd.Timestamp(previous) + (pd.Timestamp(current) - pd.Timestamp(previous)) / 2
+    conn.execute("INSERT INTO OrderDetail (CustomerID, ProductID, OrderDate, QuantityOrdered, DateKey) VALUES (?, 1, ?, 1, ?)",
+                 (customer, middle.strftime('%Y-%m-%d'), int(middle.strftime('%Y%m%d'))))
+    conn.commit()
+    _assert_gaps_match(conn)
+
+
+def test_deleting_every_line_of_a_customer(conn):
+    conn.execute("DELETE FROM OrderDetail WHERE CustomerID = 1")
+    conn.commit()
+    assert conn.execute("SELECT count(*) FROM customer_order_gap WHERE CustomerID = 1").fetchone()[0] == 0
+    _assert_gaps_match(conn)
@@ -0,0 +1,98 @@
+import asyncio
+import sqlite3
+
+import pandas as pd
+import pytest
+
+import mini_project2
+
+QUERIES = [('ex3', False), ('ex5', False), ('ex6', False), ('ex8', False), ('ex9', True), ('ex10', True),
+           ('ex11', False, False), ('ex3', True), ('ex4', True), ('ex11', False, True)]
+
+
+def _results(conn):
+    return {query: pd.read_sql_query(getattr(mini_project2, query[0])(conn, *query[1:]), conn) for query in QUERIES}
+
+
+def _assert_same_results(conn, expected):
+    for query, df in _results(conn).items():
+        pd.testing.assert_frame_equal(df, expected[query], obj=repr(query))
+
+
+@pytest.fixture
+def summary_db(copy_db):
+    conn = sqlite3.connect(copy_db)
+    mini_project2.create_summary_tables(conn)
+    conn.commit()
+    expected = _results(conn)
+    conn.close()
+    return copy_db, expected
+
+
+def _temp_orderdetail_type(conn):
+    return conn.execute("SELECT type FROM sqlite_temp_master WHERE name = 'OrderDetail'").fetchone()[0]
+
+
+def test_year_partitions_view(summary_db):
+    db, expected = summary_db
+    mini_project2.partition_orderdetail(db)
+    conn = sqlite3.connect(db)
+    assert mini_project2.use_partitions(conn) == ['2010', '2011', '2012', '2013']
+    assert _temp_orderdetail_type(conn) == 'view'
+    _assert_same_results(conn, expected)
+    conn.close()
+
+
+def test_quarter_partitions_past_the_attach_limit(summary_db):
+    # 16 quarters do not fit in SQLite's 10 attached databases
+    db, expected = summary_db
+    mini_project2.partition_orderdetail(db, period='quarter')
+    conn = sqlite3.connect(db)
+    assert len(mini_project2.use_partitions(conn)) == 16
+    assert _temp_orderdetail_type(conn) == 'table'
+    assert [row[1] for row in conn.execute("PRAGMA database_list")] == ['main', 'temp']
+    _assert_same_results(conn, expected)
+
+    assert mini_project2.use_partitions(conn, '2012-02-01', '2012-12-31') == ['2012Q1', '2012Q2', '2012Q3', '2012Q4']
+    assert _temp_orderdetail_type(conn) == 'view'
+
+    name = conn.execute("SELECT FirstName ||' '|| LastName FROM customer LIMIT 1").fetchone()[0]
+    with pytest.raises(sqlite3.OperationalError, match='attached'):
+        mini_project2.ex1_between(conn, name, '2010-01-01', '2013-12-31')
+    conn.close()
+
+
+def test_partitioned_database_in_new_sessions(summary_db):
+    db, expected = summary_db
+    mini_project2.partition_orderdetail(db, period='quarter')
+    with mini_project2.WalmartDB(db) as session:
+        pd.testing.assert_frame_equal(pd.read_sql_query(session.ex3(), session.conn), expected[('ex3', False)])
+
+    async def serve():
+        async with mini_project2.QueryService(db, readers=1) as service:
+            return await service.ex6()
+    pd.testing.assert_frame_equal(asyncio.run(serve()), expected[('ex6', False)])
+
+
+@pytest.mark.parametrize('period', ['year', 'quarter'])
+def test_insert_partitioned_rows_updates_summaries(copy_db, period):
+    conn = sqlite3.connect(copy_db)
+    rows = conn.execute("SELECT CustomerID, ProductID, OrderDate, QuantityOrdered, DateKey FROM OrderDetail WHERE OrderID % 3 = 0").fetchall()
+    conn.execute("DELETE FROM OrderDetail WHERE OrderID % 3 = 0")
+    mini_project2.create_summary_tables(conn)
+    conn.commit()
+    conn.close()
+    mini_project2.partition_orderdetail(copy_db, period=period)
+
+    conn = sqlite3.connect(copy_db)
+    # rows spread over every partition, plus ones for a new year
+    new_rows = rows + [(row[0], row[1], '2014' + row[2][4:], row[3], 20140000 + row[4] % 10000) for row in rows[:20]]
+    assert mini_project2.insert_partitioned_rows(conn, new_rows) == len(new_rows)
+    mini_project2.use_partitions(conn)
+    summaries = {query: df for query, df in _results(conn).items() if query in [('ex3', True), ('ex4', True), ('ex11', False, True)]}
+    mini_project2.refresh_summary_tables(conn)
+    conn.commit()
+    expected = _results(conn)
+    for query, df in summaries.items():
+        pd.testing.assert_frame_equal(df, expected[query], obj=repr(query))
+    conn.close()
@@ -0,0 +1,57 @@
+import sqlite3
+
+import pandas as pd
+import pytest
+
+import mini_project2
+
+
+def _names(conn, count=5):
+    # A few stored names, one of them twice and the rest in reverse ID order.
+    rows = conn.execute("SELECT FirstName ||' '|| LastName FROM customer ORDER BY CustomerID DESC LIMIT ?", (count,)).fetchall()
+    names = [row[0] for row in rows]
+    return names + names[:1]
+
+
+def _add_cher(conn):
+    # A single-word name, stored with LastName '' as step5 stores it.
+    conn.execute("INSERT INTO customer (FirstName, LastName, Address, City, CountryID) VALUES ('Cher', '', '1 Main St', 'Paris', 1)")
+    customer_id = conn.execute("SELECT max(CustomerID) FROM customer").fetchone()[0]
+    conn.execute("INSERT INTO OrderDetail (CustomerID, ProductID, OrderDate, QuantityOrdered, DateKey) VALUES (?, 1, '2020-01-02', 3, 20200102)",
+                 (customer_id,))
+    conn.commit()
+    return customer_id
+
+
+def test_lookup_customer_ids_matches_lookup_customer_id(copy_db):
+    conn = sqlite3.connect(copy_db)
+    names = _names(conn)
+    ids = mini_project2.lookup_customer_ids(conn, names)
+    assert list(ids) == list(dict.fromkeys(names))
+    assert ids == {name: mini_project2.lookup_customer_id(conn, name) for name in names}
+    conn.close()
+
+
+def test_lookup_customer_ids_single_word_name(copy_db):
+    conn = sqlite3.connect(copy_db)
+    customer_id = _add_cher(conn)
+    assert mini_project2.lookup_customer_id(conn, 'Cher') == customer_id
+    assert mini_project2.lookup_customer_ids(conn, ['Cher']) == {'Cher': customer_id}
+    conn.close()
+
+
+def test_lookup_customer_ids_unknown_name(copy_db):
+    conn = sqlite3.connect(copy_db)
+    with pytest.raises(KeyError):
+        mini_project2.lookup_customer_ids(conn, _names(conn) + ['Nobody Here'])
+    conn.close()
+
+
+@pytest.mark.parametrize('single, many', [(mini_project2.ex1, mini_project2.ex1_many), (mini_project2.ex2, mini_project2.ex2_many)])
+def test_ex_many_matches_ex(copy_db, single, many):
+    conn = sqlite3.connect(copy_db)
+    _add_cher(conn)
+    names = _names(conn)
+    expected = pd.concat([pd.read_sql_query(single(conn, name), conn) for name in dict.fromkeys(names)], ignore_index=True)
+    pd.testing.assert_frame_equal(many(conn, names), expected)
+    conn.close()
@@ -0,0 +1,34 @@
+import asyncio
+import sqlite3
+
+import pandas as pd
+
+import mini_project2
+
+
+def test_query_service_runs_each_query_once(copy_db):
+    conn = sqlite3.connect(copy_db)
+    name = conn.execute("SELECT FirstName ||' '|| LastName FROM customer LIMIT 1").fetchone()[0]
+    expected = {
+        'ex1': pd.read_sql_query(mini_project2.ex1(conn, name), conn),
+        'ex3': pd.read_sql_query(mini_project2.ex3(conn), conn),
+        'ex9': pd.read_sql_query(mini_project2.ex9(conn, True), conn),
+    }
+    conn.close()
+
+    async def serve():
+        async with mini_project2.QueryService(copy_db, readers=1) as service:
+            await service.ex3() # opens the reader connection
+            statements = []
+            for reader in service._connections:
+                reader.set_trace_callback(statements.append)
+            results = await asyncio.gather(service.ex1(name), service.ex3(), service.ex3(), service.ex9(True))
+            return results, statements
+
+    (ex1, ex3, ex3_again, ex9), statements = asyncio.run(serve())
+    pd.testing.assert_frame_equal(ex1, expected['ex1'])
+    pd.testing.assert_frame_equal(ex3, expected['ex3'])
+    pd.testing.assert_frame_equal(ex3_again, expected['ex3'])
+    pd.testing.assert_frame_equal(ex9, expected['ex9'])
+    # ex1 looks its customer up and then runs one query; the two ex3 calls share one
+    assert len(statements) == 4
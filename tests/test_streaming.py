@@ -0,0 +1,100 @@
+import sqlite3
+
+import pandas as pd
+import pytest
+
+import mini_project2
+
+QUERIES = [('ex3',), ('ex6',), ('ex8',), ('ex9', True), ('ex10',), ('ex11',), ('ex11', True)]
+
+
+@pytest.mark.parametrize('query', QUERIES)
+def test_chunks_match_query(copy_db, query):
+    conn = sqlite3.connect(copy_db)
+    func = getattr(mini_project2, query[0])
+    expected = pd.read_sql_query(func(conn, *query[1:]), conn)
+    chunks = list(func(conn, *query[1:], chunksize=7))
+    assert all(len(chunk) <= 7 for chunk in chunks)
+    pd.testing.assert_frame_equal(pd.concat(chunks, ignore_index=True), expected)
+    conn.close()
+
+
+def test_chunk_of_nulls_in_integer_column():
+    conn = sqlite3.connect(':memory:')
+    sql_statement = "SELECT 1 AS x, 'a' AS y UNION ALL SELECT NULL, NULL UNION ALL SELECT 3, 'c'"
+    chunks = list(mini_project2.iter_query(conn, sql_statement, chunksize=1))
+    assert [chunk['x'].dtype.kind for chunk in chunks] == ['i', 'f', 'i']
+    pd.testing.assert_frame_equal(pd.concat(chunks, ignore_index=True), pd.read_sql_query(sql_statement, conn))
+    conn.close()
+
+
+def test_streamed_ex_is_measured_while_consumed(copy_db):
+    with mini_project2.Instrumentation() as inst:
+        conn = mini_project2.create_connection(copy_db)
+        chunks = mini_project2.ex3(conn, chunksize=5)
+        assert not inst.stages[-1]['rows_fetched']
+        rows = sum(len(chunk) for chunk in chunks)
+        conn.close()
+    stage = inst.stages[-1]
+    assert stage['stage'] == 'ex3'
+    assert stage['rows_fetched'] == rows
+    assert any('customer' in entry['sql'] for entry in stage['statements'].values())
+
+
+def test_export_ex_csv(copy_db, tmp_path):
+    conn = sqlite3.connect(copy_db)
+    path = str(tmp_path / 'ex8.csv')
+    assert mini_project2.export_ex(conn, 'ex8', path, True, chunksize=10) == len(pd.read_sql_query(mini_project2.ex8(conn, True), conn))
+    pd.testing.assert_frame_equal(pd.read_csv(path), pd.read_sql_query(mini_project2.ex8(conn, True), conn), check_dtype=False)
+    conn.close()
+
+
+def test_export_ex_parquet(copy_db, tmp_path):
+    conn = sqlite3.connect(copy_db)
+    path = str(tmp_path / 'ex6.parquet')
+    try:
+        import pyarrow
+    except ImportError:
+        with pytest.raises(ImportError, match='pyarrow'):
+            mini_project2.export_ex(conn, 'ex6', path, chunksize=10)
+    else:
+        mini_project2.export_ex(conn, 'ex6', path, chunksize=10)
+        pd.testing.assert_frame_equal(pd.read_parquet(path), pd.read_sql_query(mini_project2.ex6(conn), conn))
+    conn.close()
+
+
+def test_empty_result_keeps_columns(tmp_path):
+    conn = sqlite3.connect(':memory:')
+    sql_statement = 'SELECT 1 AS x, 2 AS y WHERE 0'
+    chunks = list(mini_project2.iter_query(conn, sql_statement))
+    assert len(chunks) == 1
+    pd.testing.assert_frame_equal(chunks[0], pd.read_sql_query(sql_statement, conn), check_index_type=False)
+    path = str(tmp_path / 'empty.csv')
+    assert mini_project2.write_chunks(mini_project2.iter_query(conn, sql_statement), path) == 0
+    assert list(pd.read_csv(path).columns) == ['x', 'y']
+    assert len(pd.read_csv(path)) == 0
+    conn.close()
+
+
+def test_integer_column_with_chunk_of_nulls_fits_one_schema(tmp_path):
+    conn = sqlite3.connect(':memory:')
+    sql_statement = ("SELECT 1 AS x, NULL AS y UNION ALL SELECT NULL, 'b' "
+                     "UNION ALL SELECT 3, 'c' UNION ALL SELECT NULL, NULL")
+    frames = list(mini_project2._parquet_frames(mini_project2.iter_query(conn, sql_statement, chunksize=1)))
+    # y has no value in the first chunk, so it is held back until the second.
+    assert [len(frame) for frame in frames] == [2, 1, 1]
+    assert str(frames[-1]['x'].dtype) == 'Int64'
+    expected = pd.read_sql_query(sql_statement, conn)
+    values = pd.concat(frames, ignore_index=True).astype(object)
+    assert values.where(values.notna(), None).values.tolist() == [[1, None], [None, 'b'], [3, 'c'], [None, None]]
+    path = str(tmp_path / 'nulls.csv')
+    assert mini_project2.write_chunks(mini_project2.iter_query(conn, sql_statement, chunksize=1), path) == 4
+    pd.testing.assert_frame_equal(pd.read_csv(path), expected, check_dtype=False)
+    pytest.importorskip('pyarrow')
+    path = str(tmp_path / 'nulls.parquet')
+    assert mini_project2.write_chunks(mini_project2.iter_query(conn, sql_statement, chunksize=1), path) == 4
+    pd.testing.assert_frame_equal(pd.read_parquet(path), expected, check_dtype=False)
+    path = str(tmp_path / 'empty.parquet')
+    assert mini_project2.write_chunks(mini_project2.iter_query(conn, sql_statement + ' LIMIT 0'), path) == 0
+    assert list(pd.read_parquet(path).columns) == ['x', 'y']
+    conn.close()
@@ -0,0 +1,62 @@
+import sqlite3
+
+import pandas as pd
+import pytest
+
+import mini_project2
+from conftest import SAMPLE
+
+TOTALS = ['ex3', 'ex4', 'ex5', 'ex6', 'ex7']
+
+
+def _assert_summaries_match(conn, names):
+    for name in names:
+        func = getattr(mini_project2, name)
+        pd.testing.assert_frame_equal(pd.read_sql_query(func(conn, summary=True), conn),
+                                      pd.read_sql_query(func(conn), conn), obj=name)
+
+
+def _edit_orderdetail(conn):
+    # An insert for a customer with no orders yet, more lines for existing
+    # ones, a moved line, a changed quantity and deletes.
+    conn.execute("INSERT INTO customer (FirstName, LastName, Address, City, CountryID) VALUES ('New', 'Customer', '1 Main St', 'Oslo', 2)")
+    new_id = conn.execute("SELECT max(CustomerID) FROM customer").fetchone()[0]
+    conn.executemany("INSERT INTO OrderDetail (CustomerID, ProductID, OrderDate, QuantityOrdered, DateKey) VALUES (?, ?, ?, ?, ?)",
+                     [(new_id, 3, '2011-05-06', 4, 20110506), (1, 5, '2014-02-01', 9, 20140201), (2, 7, '2009-12-31', 1, 20091231)])
+    conn.execute("UPDATE OrderDetail SET CustomerID = 3, OrderDate = '2012-07-01', DateKey = 20120701 WHERE OrderID = 10")
+    conn.execute("UPDATE OrderDetail SET QuantityOrdered = QuantityOrdered * 2 WHERE OrderID % 17 = 0")
+    conn.execute("DELETE FROM OrderDetail WHERE OrderID % 11 = 0")
+    conn.commit()
+
+
+@pytest.fixture
+def conn(copy_db):
+    conn = sqlite3.connect(copy_db)
+    mini_project2.create_summary_tables(conn)
+    conn.commit()
+    yield conn
+    conn.close()
+
+
+def test_summary_tables_match_queries(conn):
+    _assert_summaries_match(conn, TOTALS)
+
+
+def test_triggers_keep_totals_current(conn):
+    _edit_orderdetail(conn)
+    _assert_summaries_match(conn, TOTALS)
+
+
+def test_refresh_after_price_change(conn):
+    conn.execute("UPDATE product SET ProductUnitPrice = ProductUnitPrice + 1 WHERE ProductID = 4")
+    mini_project2.refresh_summary_tables(conn)
+    conn.commit()
+    _assert_summaries_match(conn, TOTALS)
+
+
+def test_build_with_summary_tables(tmp_path):
+    db = str(tmp_path / 'summary.db')
+    mini_project2.build_normalized_database(SAMPLE, db, summary_tables=True)
+    conn = sqlite3.connect(db)
+    _assert_summaries_match(conn, TOTALS)
+    conn.close()